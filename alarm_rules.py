@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+장치별 알람 규칙 엔진.
+
+폴러는 샘플을 받을 때마다 observe()로 규칙 상태(구간 최솟값, 초과 시작 시각 등)만 O(1)로 갱신하고,
+주기가 끝나면 evaluate()로 이번 주기에 샘플이 들어온 장치들을 한꺼번에 판정합니다.
+규칙 수가 늘어도 샘플당 비용은 규칙 수에 비례할 뿐 구간 길이나 장치 수와는 상관이 없습니다.
+
+규칙 (devices.alarm_rules JSON, 비우면 임계값 + 기본 히스테리시스만 사용):
+
+    {"hysteresis": 0.5,                          # 해제 기준: 발생 기준보다 이만큼(°C) 내려가야 해제 (기본 ALARM_HYSTERESIS)
+     "rate": {"rise": 3.0, "minutes": 10},        # 최근 10분 최저값보다 3°C 이상 오르면 알람 (문 열림, 압축기 정지 등)
+     "sustained": {"above": -15, "minutes": 20},  # -15°C 초과가 20분 이상 이어지면 알람 (above 생략 시 알람 임계값)
+     "suppress_defrost": true,                    # 제상 중과 끝난 뒤 DEFROST_GRACE_MINUTES분 동안은 새 알람을 내지 않음 (기본 false)
+                                                  #   제상이 시작된 지 DEFROST_MAX_MINUTES분이 지나면 제상 신호가 계속 켜져 있어도 다시 알람
+     "repeat_minutes": 30}                        # 알람이 이어질 때 다시 알리는 간격 (기본 ALARM_REPEAT_MINUTES)
+
+장치 단위로 '알람 중이 아니면 어느 규칙이든 발생 조건을 만족할 때 발생, 알람 중이면 모든 규칙이 해제 조건을 만족할 때 해제'로
+판정하므로, 규칙별 상태를 따로 저장하지 않아도 재시작/샤드 이동 뒤 DB의 알람 상태만으로 히스테리시스가 이어집니다.
+"""
+import json
+import threading
+from collections import deque
+
+import config
+
+RULE_KEYS = ('hysteresis', 'rate', 'sustained', 'suppress_defrost', 'repeat_minutes')
+
+class RollingWindow:
+    """ 최근 span초 샘플의 최솟값을 샘플당 분할 상환 O(1)로 유지합니다. (단조 증가 deque: 최솟값 후보만 보관) """
+    __slots__ = ('span', '_mins')
+
+    def __init__(self, span):
+        self.span = span
+        self._mins = deque() # (ts, 값), 값이 앞에서 뒤로 증가. 맨 앞이 구간 최솟값
+
+    def push(self, ts, value):
+        mins = self._mins
+        while mins and mins[-1][1] >= value: mins.pop();
+        mins.append((ts, value))
+        cutoff = ts - self.span
+        while mins[0][0] < cutoff: mins.popleft();
+
+    def clear(self):
+        self._mins.clear()
+
+    @property
+    def min(self):
+        return self._mins[0][1] if self._mins else None
+
+def parse_rules(text):
+    """ alarm_rules JSON 문자열 -> dict (비었으면 {}). 형식이 틀리면 ValueError """
+    if not text or not str(text).strip(): return {};
+    try:
+        rules = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"알람 규칙 JSON 형식 오류: {e}")
+    if not isinstance(rules, dict): raise ValueError("알람 규칙은 JSON 객체여야 합니다.");
+    unknown = set(rules) - set(RULE_KEYS)
+    if unknown: raise ValueError(f"알 수 없는 알람 규칙: {', '.join(sorted(unknown))} (사용 가능: {', '.join(RULE_KEYS)})");
+    def number(value, name, positive=True):
+        if isinstance(value, bool) or not isinstance(value, (int, float)): raise ValueError(f"{name}는 숫자여야 합니다.");
+        if positive and value <= 0: raise ValueError(f"{name}는 0보다 커야 합니다.");
+        return float(value)
+    if 'hysteresis' in rules and number(rules['hysteresis'], 'hysteresis', positive=False) < 0: raise ValueError("hysteresis는 0 이상이어야 합니다. (음수면 해제 기준이 발생 기준보다 높아짐)");
+    if 'repeat_minutes' in rules: number(rules['repeat_minutes'], 'repeat_minutes');
+    if 'rate' in rules:
+        rate = rules['rate']
+        if not isinstance(rate, dict) or set(rate) != {'rise', 'minutes'}: raise ValueError("rate는 {\"rise\": °C, \"minutes\": 분} 형식이어야 합니다.");
+        number(rate['rise'], 'rate.rise'); number(rate['minutes'], 'rate.minutes')
+    if 'sustained' in rules:
+        sustained = rules['sustained']
+        if not isinstance(sustained, dict) or 'minutes' not in sustained or set(sustained) - {'above', 'minutes'}: raise ValueError("sustained는 {\"above\": °C, \"minutes\": 분} 형식이어야 합니다.");
+        number(sustained['minutes'], 'sustained.minutes')
+        if 'above' in sustained: number(sustained['above'], 'sustained.above', positive=False);
+    if 'suppress_defrost' in rules and not isinstance(rules['suppress_defrost'], bool): raise ValueError("suppress_defrost는 true/false여야 합니다.");
+    return rules
+
+class DeviceRules:
+    """ 장치 하나의 규칙과 규칙 상태. observe()는 샘플당 O(1), evaluate()는 규칙 수만큼 """
+    __slots__ = ('key', 'threshold', 'hysteresis', 'rate_rise', 'rate_window', 'sustained_above', 'sustained_seconds',
+                 'suppress_defrost', 'repeat_seconds', 'last_ts', 'last_temp', 'above_since', 'defrost_since', 'defrost_until')
+
+    def __init__(self, device):
+        self.key = (device.get('alarm_threshold'), device.get('alarm_rules'))
+        try:
+            rules = parse_rules(device.get('alarm_rules'))
+        except ValueError:
+            rules = {} # 저장 시 검사하므로 여기까지 오지 않지만, 잘못된 값이 있어도 임계값 알람은 유지
+        self.threshold = device.get('alarm_threshold')
+        self.hysteresis = float(rules.get('hysteresis', config.ALARM_HYSTERESIS))
+        rate = rules.get('rate')
+        self.rate_rise = float(rate['rise']) if rate else None
+        self.rate_window = RollingWindow(float(rate['minutes']) * 60) if rate else None
+        sustained = rules.get('sustained')
+        above = sustained.get('above', self.threshold) if sustained else None # above를 생략하고 임계값도 없으면 지속 규칙은 꺼짐
+        self.sustained_above = float(above) if above is not None else None
+        self.sustained_seconds = float(sustained['minutes']) * 60 if above is not None else None
+        self.suppress_defrost = rules.get('suppress_defrost', False) # 규칙으로 켠 장치만: 기본은 임계값만으로 알람
+        self.repeat_seconds = float(rules.get('repeat_minutes', config.ALARM_REPEAT_MINUTES)) * 60
+        self.last_ts = None; self.last_temp = None
+        self.above_since = None # sustained: 기준을 넘기 시작한 시각
+        self.defrost_since = None # 제상 신호가 켜진 시각 (꺼지면 None)
+        self.defrost_until = 0 # 이 시각까지는 제상(과 회복 시간)으로 보고 새 알람을 내지 않음 (제상 시작 후 DEFROST_MAX_MINUTES분까지)
+
+    @property
+    def enabled(self):
+        return self.threshold is not None or self.rate_rise is not None or self.sustained_above is not None
+
+    def observe(self, ts, temperature, op_status):
+        if temperature is None: # 통신 실패: 구간이 끊겼으므로 창과 지속 시간을 처음부터
+            self.last_temp = None; self.above_since = None
+            if self.rate_window: self.rate_window.clear();
+            return
+        if self.suppress_defrost and op_status and op_status.get('defrost'):
+            if self.defrost_since is None: self.defrost_since = ts;
+            limit = self.defrost_since + config.DEFROST_MAX_MINUTES * 60 # 제상 신호가 붙어 있어도 이 뒤로는 보류하지 않음
+            self.defrost_until = min(ts + config.DEFROST_GRACE_MINUTES * 60, limit)
+            if ts < limit and self.rate_window: self.rate_window.clear(); # 제상으로 오른 온도가 회복 뒤 상승률 기준점이 되지 않도록
+        else:
+            self.defrost_since = None
+        self.last_ts = ts; self.last_temp = temperature
+        if self.rate_window: self.rate_window.push(ts, temperature);
+        if self.sustained_above is not None:
+            if temperature > self.sustained_above:
+                if self.above_since is None: self.above_since = ts;
+            elif temperature <= self.sustained_above - self.hysteresis:
+                self.above_since = None # 히스테리시스 구간 안에서는 시작 시각 유지
+
+    def evaluate(self, in_alarm):
+        """ (알람이어야 하는지, 사유 목록). in_alarm: 지금 장치가 알람 상태인지 (DB와 맞춘 메모리 상태) """
+        temperature = self.last_temp
+        if temperature is None: return in_alarm, [];
+        h = self.hysteresis
+        raised = []; holding = []
+        if self.threshold is not None:
+            if temperature > self.threshold: raised.append(f"임계값({self.threshold}°C) 초과");
+            elif temperature > self.threshold - h: holding.append(f"임계값({self.threshold}°C) 해제 대기");
+        if self.rate_rise is not None and self.rate_window.min is not None:
+            rise = temperature - self.rate_window.min
+            minutes = self.rate_window.span / 60
+            if rise >= self.rate_rise: raised.append(f"{minutes:g}분 동안 {rise:.1f}°C 상승");
+            elif rise >= max(self.rate_rise - h, self.rate_rise / 2): holding.append(f"{minutes:g}분 동안 {rise:.1f}°C 상승");
+        if self.sustained_above is not None and self.above_since is not None:
+            minutes = (self.last_ts - self.above_since) / 60
+            if minutes >= self.sustained_seconds / 60: raised.append(f"{self.sustained_above}°C 초과 {minutes:.0f}분 지속"); # 해제 히스테리시스는 above_since에 반영됨
+        if in_alarm: return bool(raised or holding), raised + holding;
+        if raised and self.suppress_defrost and self.last_ts < self.defrost_until: return False, []; # 제상 중/직후: 새 알람 보류
+        return bool(raised), raised
+
+class AlarmEngine:
+    """ 폴러 하나가 맡은 장치들의 규칙 모음. 샘플은 observe()로 쌓고, 주기 끝에 evaluate()로 한꺼번에 판정합니다. """
+    def __init__(self):
+        self._rules = {} # 장치 id -> DeviceRules
+        self._dirty = {} # 이번 주기에 샘플이 들어온 장치 id -> 장치 dict
+        self._lock = threading.Lock() # observe는 폴링 스레드에서만 부르지만, sync/evaluate와 겹칠 수 있어 보호
+
+    def rules_for(self, device):
+        """ 장치의 규칙 (임계값/규칙 설정이 바뀌었으면 새로 만듦: 창과 지속 시간은 처음부터) """
+        rules = self._rules.get(device['id'])
+        if rules is None or rules.key != (device.get('alarm_threshold'), device.get('alarm_rules')):
+            rules = self._rules[device['id']] = DeviceRules(device)
+        return rules
+
+    def observe(self, device, ts, temperature, op_status=None):
+        with self._lock:
+            rules = self.rules_for(device)
+            rules.observe(ts, temperature, op_status)
+            if temperature is not None: self._dirty[device['id']] = device;
+
+    def evaluate(self, alarm_states):
+        """
+        이번 주기에 샘플이 들어온 장치들을 판정합니다. alarm_states: 장치명 -> 지금 알람 중인지.
+        [(장치, 알람이어야 하는지, 사유 목록, 반복 간격(초), 현재 온도)]를 반환합니다.
+        """
+        with self._lock:
+            dirty = self._dirty; self._dirty = {}
+            results = []
+            for device_id, device in dirty.items():
+                rules = self._rules[device_id]; in_alarm = alarm_states.get(device['name'], False)
+                if not rules.enabled and not in_alarm: continue; # 규칙 없는 장치 (규칙을 지운 직후의 알람 해제는 판정)
+                active, reasons = rules.evaluate(in_alarm)
+                results.append((device, active, reasons, rules.repeat_seconds, rules.last_temp))
+            return results
+
+    def sync(self, devices):
+        """ 목록에 없는 장치(삭제, 다른 폴러로 이동)의 규칙 상태를 버립니다. """
+        ids = {device['id'] for device in devices}
+        with self._lock:
+            for device_id in set(self._rules) - ids:
+                del self._rules[device_id]; self._dirty.pop(device_id, None)
+
+alarm_engine = AlarmEngine()
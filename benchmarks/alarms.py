@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+알람 규칙 엔진 벤치마크: 장치 N대에 임계값만 / 모든 규칙(히스테리시스, 상승률, 지속, 제상 보류)을 걸고
+주기마다 샘플을 observe()한 뒤 evaluate()로 한꺼번에 판정하는 비용을 잽니다. (DB/알림 없이 엔진만)
+장치 수를 늘려도 샘플당 비용이 일정한지 보려고 N대와 10N대를 함께 잽니다.
+"""
+import json
+import math
+import random
+import time
+
+from alarm_rules import AlarmEngine
+from benchmarks.common import metric, latency_metrics
+
+FULL_RULES = json.dumps({"hysteresis": 0.5, "rate": {"rise": 3, "minutes": 10}, "sustained": {"above": -15, "minutes": 20}, "suppress_defrost": True})
+
+def make_devices(count, rules):
+    return [{'id': i, 'name': f"BENCH-{i:05d}", 'alarm_threshold': -10.0, 'alarm_rules': rules} for i in range(count)]
+
+def run_cycles(devices, cycles, interval=10):
+    """ 주기마다 (observe 전체 + evaluate 한 번) 소요 시간(초) 목록. 앞의 1시간 분량은 창을 채우는 예열 """
+    engine = AlarmEngine(); alarm_states = {}
+    rng = random.Random(1)
+    warmup = 3600 // interval
+    samples = []
+    for cycle in range(warmup + cycles):
+        ts = cycle * interval
+        start = time.perf_counter()
+        for device in devices:
+            temperature = -18 + 2 * math.sin(ts / 600 + device['id']) + rng.random()
+            engine.observe(device, ts, temperature, {'defrost': cycle % 360 < 6})
+        for device, active, _, _, _ in engine.evaluate(alarm_states): alarm_states[device['name']] = active;
+        if cycle >= warmup: samples.append(time.perf_counter() - start);
+    return samples
+
+def run(args):
+    results = {}
+    count = args.alarm_devices
+    for label, rules in (("임계값만", None), ("규칙 전체", FULL_RULES)):
+        samples = run_cycles(make_devices(count, rules), args.cycles * 4)
+        results.update(latency_metrics(f"{count}대 {label} 주기", samples))
+        results[f"{label} 샘플당"] = metric(sum(samples) / len(samples) / count * 1e6, 'us', 'lower')
+    large = run_cycles(make_devices(count * 10, FULL_RULES), args.cycles)
+    results[f"{count * 10}대 규칙 전체 샘플당"] = metric(sum(large) / len(large) / (count * 10) * 1e6, 'us', 'lower')
+    return results
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+프로토콜 코덱 마이크로 벤치마크.
+테이블 기반 코덱(command_frame/decode_*)과 기존 함수(calculate_bcc + parse_*)의 결과와 오류 로그가 같은지 먼저 확인한 뒤 속도를 비교합니다.
+
+    python -m benchmarks.codec [--number 20000]
+"""
+import argparse
+import logging
+import sys
+import timeit
+
+import protocol
+from benchmarks.common import metric
+from protocol import STX, ETX, HEADER_READ_DATA, HEADER_READ_SETTING_RESP, HEADER_READ_TEMP
+
+def make_frame(controller_id, header, payload):
+    """ 응답 프레임 (STX+ID+헤더+페이로드+ETX+BCC) """
+    packet = STX + controller_id + header + payload + ETX
+    return packet + protocol.calculate_bcc(packet)
+
+def encode_temperature(value, decimal=True):
+    raw = int(round(value * 10)) if decimal else int(value)
+    return f"{raw & 0xFFFF:04X}".encode('ascii') + (b'1' if decimal else b'0')
+
+def build_corpus():
+    """ (설명, 응답 바이트, 기대 ID, 종류) 목록. 정상 프레임과 여러 종류의 잘못된 프레임을 섞습니다. """
+    corpus = []
+    for i, temp in enumerate([-25.5, -0.1, 0.0, 3.2, 12.8, 99.9]):
+        cid = f"{i + 1:02d}".encode('ascii')
+        corpus.append((f"정상 현재온도 {temp}", make_frame(cid, HEADER_READ_DATA, encode_temperature(temp) + b'0'), cid, 'temp'))
+        corpus.append((f"정상 설정온도 {temp}", make_frame(cid, HEADER_READ_SETTING_RESP, encode_temperature(temp)), cid, 'set'))
+    corpus.append(("정수 온도", make_frame(b'07', HEADER_READ_DATA, encode_temperature(-7, decimal=False) + b'0'), b'07', 'temp'))
+    corpus.append(("운전 플래그 F", make_frame(b'01', HEADER_READ_DATA, encode_temperature(4.0) + b'F'), b'01', 'temp'))
+    good = make_frame(b'01', HEADER_READ_DATA, encode_temperature(4.0) + b'0')
+    corpus += [
+        ("빈 응답", b'', b'01', 'temp'),
+        ("STX 없음", good[1:], b'01', 'temp'),
+        ("앞쪽 잡음", b'\xff\x00' + good, b'01', 'temp'),
+        ("너무 짧음", STX + b'01' + ETX, b'01', 'temp'),
+        ("ETX 없음", good[:-2] + b'X' + good[-1:], b'01', 'temp'),
+        ("BCC 불일치", good[:-1] + bytes([good[-1] ^ 0x55]), b'01', 'temp'),
+        ("ID 불일치", good, b'02', 'temp'),
+        ("헤더 불일치", make_frame(b'01', b'RDXX0', encode_temperature(4.0) + b'0'), b'01', 'temp'),
+        ("페이로드 부족", make_frame(b'01', HEADER_READ_DATA, b'00281'), b'01', 'temp'),
+        ("센서 오픈", make_frame(b'01', HEADER_READ_DATA, encode_temperature(4.0) + b'1'), b'01', 'temp'),
+        ("센서 쇼트", make_frame(b'01', HEADER_READ_DATA, encode_temperature(4.0) + b'2'), b'01', 'temp'),
+        ("16진수 아닌 문자", make_frame(b'01', HEADER_READ_DATA, b'0G2z10'), b'01', 'temp'),
+        ("설정온도 페이로드 부족", make_frame(b'01', HEADER_READ_SETTING_RESP, b'0028'), b'01', 'set'),
+        ("설정온도에 현재온도 응답", good, b'01', 'set'),
+    ]
+    return corpus
+
+class _Capture(logging.Handler):
+    def __init__(self):
+        super().__init__(); self.messages = []
+    def emit(self, record):
+        self.messages.append((record.levelname, record.getMessage()))
+
+def check_equivalence(corpus):
+    """ 두 경로의 반환값과 로그를 비교하고 불일치 목록을 돌려줍니다. """
+    root = logging.getLogger(); capture = _Capture()
+    old_handlers = root.handlers[:]; old_level = root.level
+    root.handlers = [capture]; root.setLevel(logging.DEBUG) # 비교용으로 의도한 오류 로그는 화면에 내지 않음
+    mismatches = []
+    try:
+        for name, frame, cid, kind in corpus:
+            reference = protocol.parse_temperature_response if kind == 'temp' else protocol.parse_set_temperature_response
+            fast = protocol.decode_temperature if kind == 'temp' else protocol.decode_set_temperature
+            capture.messages = []; expected = reference(frame, cid); expected_logs = capture.messages
+            capture.messages = []; actual = fast(frame, cid); actual_logs = capture.messages
+            if expected != actual or expected_logs != actual_logs or type(expected) is not type(actual):
+                mismatches.append((name, expected, actual, expected_logs, actual_logs))
+        # 일괄 해석: 정상 프레임을 이어 붙인 버퍼 하나를 decode_frames로 해석한 결과가 개별 해석과 같아야 함
+        temps = [(frame, cid) for name, frame, cid, kind in corpus if kind == 'temp' and name.startswith("정상")]
+        buffer = b'\x00'.join(frame for frame, _ in temps)
+        bulk = protocol.decode_frames(buffer, [cid for _, cid in temps])
+        single = [protocol.parse_temperature_response(frame, cid) for frame, cid in temps]
+        if bulk != single: mismatches.append(("일괄 해석", single, bulk, [], []));
+    finally:
+        root.handlers = old_handlers; root.setLevel(old_level)
+    return mismatches
+
+def reference_command(controller_id, header):
+    """ 기존 방식의 요청 프레임 생성 (매번 조립 + BCC 계산) """
+    packet_without_bcc = STX + controller_id.encode('ascii') + header + ETX
+    return packet_without_bcc + protocol.calculate_bcc(packet_without_bcc)
+
+def run(number):
+    corpus = build_corpus()
+    mismatches = check_equivalence(corpus)
+    for name, expected, actual, expected_logs, actual_logs in mismatches:
+        print(f"[불일치] {name}: 기존={expected!r} {expected_logs} / 새 코덱={actual!r} {actual_logs}")
+    if mismatches: return 1, {};
+
+    frame = make_frame(b'01', HEADER_READ_DATA, encode_temperature(3.2) + b'0')
+    set_frame = make_frame(b'01', HEADER_READ_SETTING_RESP, encode_temperature(-18.0))
+    buffer = frame * 100; ids = [b'01'] * 100
+    cases = [
+        ("명령 프레임 생성", lambda: reference_command('01', HEADER_READ_TEMP), lambda: protocol.command_frame('01', HEADER_READ_TEMP), 1),
+        ("현재온도 해석", lambda: protocol.parse_temperature_response(frame, b'01'), lambda: protocol.decode_temperature(frame, b'01'), 1),
+        ("설정온도 해석", lambda: protocol.parse_set_temperature_response(set_frame, b'01'), lambda: protocol.decode_set_temperature(set_frame, b'01'), 1),
+        ("100프레임 일괄 해석", lambda: [protocol.parse_temperature_response(bytes(f), b'01') for f in protocol.iter_frames(buffer)], lambda: protocol.decode_frames(buffer, ids), 100),
+    ]
+    results = {}
+    print(f"결과/오류 로그 일치: {len(corpus)}개 프레임 + 일괄 해석")
+    print(f"{'항목':<16}{'기존 (프레임/초)':>18}{'새 코덱 (프레임/초)':>20}{'배율':>8}")
+    for name, old, new, frames in cases:
+        old_rate = frames * number / min(timeit.repeat(old, number=number, repeat=3))
+        new_rate = frames * number / min(timeit.repeat(new, number=number, repeat=3))
+        results[name] = metric(new_rate, 'frames/s'); results[f"{name} (기존 함수)"] = metric(old_rate, 'frames/s')
+        print(f"{name:<16}{old_rate:>18,.0f}{new_rate:>20,.0f}{new_rate / old_rate:>7.1f}x")
+    return 0, results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="프로토콜 코덱 마이크로 벤치마크")
+    parser.add_argument('--number', type=int, default=20000, help="측정당 반복 횟수")
+    sys.exit(run(parser.parse_args().number)[0])
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import contextlib
+import os
+import shutil
+import tempfile
+import time
+
+import config
+import database
+
+BENCH_DIR = os.path.join(tempfile.gettempdir(), 'tempmon-bench') # 합성 DB 보관 위치 (저장소 밖)
+
+def metric(value, unit, better='higher'):
+    """ 벤치마크 결과 한 항목. better: 'higher'(처리량) 또는 'lower'(지연) """
+    return {'value': value, 'unit': unit, 'better': better}
+
+def latency_metrics(prefix, samples):
+    """ 지연 표본(초)에서 p50/p95 (ms) 항목을 만듭니다. """
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return {f"{prefix} p50": metric(pick(0.50), 'ms', 'lower'), f"{prefix} p95": metric(pick(0.95), 'ms', 'lower')}
+
+def time_calls(fn, repeat):
+    """ fn을 repeat번 호출한 각각의 소요 시간(초) 목록 """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter(); fn(); samples.append(time.perf_counter() - start)
+    return samples
+
+@contextlib.contextmanager
+def use_database(path, fresh=True):
+    """ config.DATABASE를 path로 바꿔 둔 채 실행합니다. fresh면 빈 DB로 새로 만듭니다. """
+    original = config.DATABASE
+    database.connections.close_all() # 같은 경로의 DB를 새로 만들 수 있으므로 재사용 연결을 비움
+    if fresh:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix): os.remove(path + suffix);
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    config.DATABASE = path
+    try:
+        database.init_db()
+        yield path
+    finally:
+        database.connections.close_all()
+        config.DATABASE = original
+
+@contextlib.contextmanager
+def scratch_database(name):
+    """ 실행이 끝나면 지우는 임시 DB """
+    directory = tempfile.mkdtemp(prefix='tempmon-bench-')
+    try:
+        with use_database(os.path.join(directory, name)) as path: yield path;
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+def add_devices(count, ip='127.0.0.1', port=15000, per_bus=None, threshold=-10.0):
+    """ 벤치마크용 장치를 count개 등록하고 장치 목록(dict)을 반환합니다. per_bus마다 포트를 하나씩 올립니다. """
+    per_bus = per_bus or count
+    for i in range(count):
+        database.add_device(f"BENCH-{i:05d}", ip, port + i // per_bus, f"{i % per_bus + 1:02d}", threshold, "벤치마크")
+    return [dict(device) for device in database.get_all_devices()]
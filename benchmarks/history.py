@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+이력 조회 벤치마크: 합성 DB(기본 1천만 행)에서 get_historical_data / get_decimated_history 지연.
+합성 DB는 만드는 데 시간이 걸리므로 임시 디렉터리에 행 수별로 보관해 다음 실행에서 재사용합니다. (--rebuild로 새로 만듦)
+"""
+import os
+import time
+
+import config
+import database
+import rollup
+from benchmarks.common import BENCH_DIR, latency_metrics, time_calls, use_database
+
+DEVICES = 20
+SAMPLE_INTERVAL = 10 # 초 (폴링 주기와 같게)
+
+def build(rows):
+    """ 장치 DEVICES개가 SAMPLE_INTERVAL초마다 기록한 rows행의 이력을 만들고 롤업까지 채웁니다. 마지막 샘플 시각을 반환합니다. """
+    per_device = rows // DEVICES
+    end_ts = int(time.time()) // 86400 * 86400
+    start_ts = end_ts - per_device * SAMPLE_INTERVAL
+    conn = database.configure_writer_connection(database.get_db_connection())
+    try:
+        for i in range(DEVICES):
+            conn.execute("INSERT INTO devices (name, ip, port, controller_id, alarm_threshold, memo) VALUES (?, '127.0.0.1', 15000, ?, -10.0, '벤치마크')", (f"HIST-{i:02d}", f"{i + 1:02d}"))
+        conn.commit()
+        # 행마다 도는 롤업 트리거 없이 원본을 채운 뒤, 롤업은 집계 쿼리로 한 번에 계산하고 트리거를 되살립니다.
+        conn.execute(f"DROP TRIGGER IF EXISTS {config.TABLE_NAME}_rollup")
+        with conn:
+            conn.execute(f"""
+                WITH RECURSIVE seq(n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n + 1 < ?)
+                INSERT INTO {config.TABLE_NAME} (device_id, ts, temperature)
+                SELECT d.id, ? + seq.n * ?, -18.0 + 3.0 * ((seq.n * 7 + d.id * 13) % 100) / 100.0
+                FROM devices d, seq ORDER BY d.id, seq.n
+            """, (per_device, start_ts, SAMPLE_INTERVAL))
+        rollup.backfill_chunk(conn, start_ts, end_ts + 86400)
+        database.init_rollups(conn.cursor()); conn.commit()
+    finally:
+        conn.close()
+    return end_ts
+
+def run(args):
+    path = os.path.join(BENCH_DIR, f"history_{args.rows}.db")
+    fresh = args.rebuild or not os.path.exists(path)
+    with use_database(path, fresh=fresh):
+        if fresh:
+            start = time.perf_counter()
+            print(f"  합성 DB 생성 중: {args.rows:,}행 -> {path}")
+            build(args.rows)
+            print(f"  생성 완료 ({time.perf_counter() - start:.0f}초)")
+        with database.get_db_connection() as conn:
+            end_ts = conn.execute(f"SELECT MAX(ts) FROM {config.TABLE_NAME}").fetchone()[0]
+        day = lambda days_ago: time.strftime('%Y-%m-%d', time.localtime(end_ts - days_ago * 86400))
+        name = "HIST-07"; repeat = args.repeat
+        results = {}
+        results.update(latency_metrics("원본 1일", time_calls(lambda: database.get_historical_data(name, day(0), day(0)), repeat)))
+        results.update(latency_metrics("7일 30분 간격", time_calls(lambda: database.get_historical_data(name, day(6), day(0), interval_minutes=30), repeat)))
+        results.update(latency_metrics("30일 3시간 간격", time_calls(lambda: database.get_historical_data(name, day(29), day(0), interval_minutes=180), repeat)))
+        results.update(latency_metrics("7일 기록 표 (30분 솎음)", time_calls(lambda: database.get_decimated_history(name, day(6), day(0), step_minutes=30), repeat)))
+    return results
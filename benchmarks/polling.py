@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+""" 폴링 주기 벤치마크: 로컬 시뮬레이터(simulator.py)에 N개 장치를 띄우고 poller.poll_cycle 한 주기의 소요 시간을 잽니다. """
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import poller
+import protocol
+import shared_state
+import simulator
+from benchmarks.common import metric, latency_metrics, time_calls, scratch_database, add_devices
+
+def run(args):
+    per_bus = min(args.per_bus, 99)
+    cfg = simulator.SimulatorConfig(base_port=args.sim_port, ports=math.ceil(args.devices / per_bus), controllers=per_bus, latency=args.latency / 1000, seed=1)
+    sim = simulator.run_in_thread(cfg)
+    executor = ThreadPoolExecutor(max_workers=max(1, config.POLL_WORKERS), thread_name_prefix="PollWorker")
+    try:
+        with scratch_database('polling.db'):
+            devices = add_devices(args.devices, port=args.sim_port, per_bus=per_bus)
+            shared_state.sync_shared_state(devices)
+            poller.poll_cycle(devices, executor) # 세션 연결 등 예열
+            samples = time_calls(lambda: poller.poll_cycle(devices, executor), args.cycles)
+    finally:
+        executor.shutdown(wait=True)
+        protocol.connection_pool.close_all()
+        simulator.stop_thread(sim)
+    # 버스는 POLL_WORKERS까지 동시에, 버스 안의 장치는 차례로 읽으므로 한 주기 ≈ 버스 하나를 도는 시간. 장치 수와 상관없게 버스당으로 잼
+    buses = math.ceil(args.devices / per_bus)
+    results = latency_metrics("버스 주기", samples)
+    results["버스당 처리량"] = metric(args.devices / buses / (sum(samples) / len(samples)), 'devices/s')
+    return results
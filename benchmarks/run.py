@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+벤치마크 모음 실행/비교 도구.
+
+    python -m benchmarks.run [--suites codec,storage,history,polling,web,alarms] [--quick]
+    python -m benchmarks.run --save-baseline          # 이번에 실행한 묶음의 결과를 기준값(benchmarks/baseline.json)에 저장
+    python -m benchmarks.run --compare A.json B.json  # 저장된 두 결과 비교 (실행하지 않음)
+
+- 결과는 benchmarks/results/<시각>.json에 저장되고, 기준값 파일이 있으면 항목별로 비교합니다.
+- 기준값보다 --threshold(%) 이상 나빠진 항목이 있으면 종료 코드 1로 끝나므로 배포 전 점검에 쓸 수 있습니다.
+- 기준값은 측정한 컴퓨터에 따라 다르므로, 같은 컴퓨터에서 잰 결과끼리 비교하세요.
+- 규모(장치 수, 행 수 등)가 다른 결과끼리는 비교하지 않습니다. --quick은 따로 기준값(benchmarks/baseline.quick.json)을 씁니다.
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import sys
+
+BENCH_ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_ROOT, 'baseline.json')
+QUICK_BASELINE = os.path.join(BENCH_ROOT, 'baseline.quick.json')
+RESULTS_DIR = os.path.join(BENCH_ROOT, 'results')
+SUITES = ('codec', 'storage', 'history', 'polling', 'web', 'alarms')
+# 묶음별로 결과 값에 영향을 주는 규모 인자: 이 값이 기준값과 다르면 그 묶음은 비교하지 않음
+SCALE_ARGS = {'codec': ('number',), 'storage': ('inserts',), 'history': ('rows',), 'polling': ('devices', 'per_bus', 'latency'),
+              'web': ('web_devices',), 'alarms': ('alarm_devices',)}
+
+def suite_args(result, suite):
+    """ 결과/기준값 파일에서 그 묶음을 잰 규모 인자 (묶음별로 저장된 값이 있으면 그것, 없으면 실행 인자) """
+    args = result.get('suite_args', {}).get(suite) or result.get('meta', {}).get('args', {})
+    return {key: args.get(key) for key in SCALE_ARGS.get(suite, ())}
+
+def run_suite(name, args):
+    if name == 'codec':
+        from benchmarks import codec
+        code, results = codec.run(args.number)
+        if code: raise RuntimeError("새 코덱과 기존 함수의 결과가 다릅니다.");
+        return results
+    module = __import__(f"benchmarks.{name}", fromlist=['run'])
+    return module.run(args)
+
+def compare(baseline, current, threshold):
+    """ 항목별 변화율을 출력하고, threshold(%) 이상 나빠진 항목 목록을 반환합니다. """
+    regressions = []
+    print(f"\n{'항목':<44}{'기준':>14}{'이번':>14}{'변화':>9}")
+    for suite, metrics in current['suites'].items():
+        base_args = suite_args(baseline, suite); current_args = suite_args(current, suite)
+        if suite in baseline.get('suites', {}) and base_args != current_args:
+            differ = ', '.join(f"{key} {base_args[key]}→{current_args[key]}" for key in base_args if base_args[key] != current_args[key])
+            print(f"{suite:<44}(규모가 달라 비교하지 않음: {differ})"); continue
+        for name, m in metrics.items():
+            base = baseline.get('suites', {}).get(suite, {}).get(name)
+            label = f"{suite}/{name}"
+            if not base or not base['value']:
+                print(f"{label:<44}{'-':>14}{m['value']:>14,.2f}{'(신규)':>9}"); continue
+            change = (m['value'] - base['value']) / base['value'] * 100
+            worse = -change if m['better'] == 'higher' else change
+            flag = " ▼" if worse >= threshold else ""
+            if flag: regressions.append(label);
+            print(f"{label:<44}{base['value']:>14,.2f}{m['value']:>14,.2f}{change:>+8.1f}%{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="온도 모니터링 벤치마크 모음")
+    parser.add_argument('--suites', default=','.join(SUITES), help=f"실행할 묶음 (기본: 전체 {','.join(SUITES)})")
+    parser.add_argument('--quick', action='store_true', help="작은 규모로 빠르게 (합성 DB 20만 행 등)")
+    parser.add_argument('--number', type=int, default=20000, help="codec: 측정당 반복 횟수")
+    parser.add_argument('--inserts', type=int, default=2000, help="storage: 단건 삽입 횟수 (일괄 삽입은 20배)")
+    parser.add_argument('--rows', type=int, default=10_000_000, help="history: 합성 DB 행 수 (기본 1천만)")
+    parser.add_argument('--rebuild', action='store_true', help="history: 보관된 합성 DB를 다시 만듦")
+    parser.add_argument('--devices', type=int, default=200, help="polling: 장치 수")
+    parser.add_argument('--per-bus', type=int, default=20, help="polling: 버스(포트)당 장치 수")
+    parser.add_argument('--latency', type=float, default=20.0, help="polling: 시뮬레이터 응답 지연(ms)")
+    parser.add_argument('--cycles', type=int, default=5, help="polling: 측정할 주기 수")
+    parser.add_argument('--sim-port', type=int, default=15500, help="polling: 시뮬레이터 첫 포트")
+    parser.add_argument('--web-devices', type=int, default=50, help="web: 장치 수")
+    parser.add_argument('--alarm-devices', type=int, default=2000, help="alarms: 장치 수 (10배 규모도 함께 잼)")
+    parser.add_argument('--repeat', type=int, default=50, help="history/web: 요청 반복 횟수")
+    parser.add_argument('--baseline', help="비교할 기준값 파일 (기본: benchmarks/baseline.json, --quick이면 baseline.quick.json)")
+    parser.add_argument('--save-baseline', action='store_true', help="이번에 실행한 묶음의 결과를 기준값 파일에 저장 (다른 묶음은 그대로 둠)")
+    parser.add_argument('--threshold', type=float, default=10.0, help="회귀로 판단할 악화율(%%) (기본 10)")
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help="저장된 두 결과 파일만 비교")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.compare:
+        with open(args.compare[0], encoding='utf-8') as f: baseline = json.load(f);
+        with open(args.compare[1], encoding='utf-8') as f: current = json.load(f);
+        return 1 if compare(baseline, current, args.threshold) else 0
+
+    if args.quick:
+        args.number = min(args.number, 5000); args.inserts = min(args.inserts, 500); args.rows = min(args.rows, 200_000)
+        args.devices = min(args.devices, 40); args.cycles = min(args.cycles, 3); args.repeat = min(args.repeat, 20); args.alarm_devices = min(args.alarm_devices, 200)
+    args.baseline = args.baseline or (QUICK_BASELINE if args.quick else DEFAULT_BASELINE)
+
+    current = {
+        'meta': {'time': datetime.datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+                 'machine': platform.platform(), 'args': {k: v for k, v in vars(args).items() if k not in ('compare', 'save_baseline', 'baseline')}},
+        'suites': {},
+    }
+    for name in [s.strip() for s in args.suites.split(',') if s.strip()]:
+        if name not in SUITES: parser.error(f"알 수 없는 묶음: {name}");
+        print(f"[{name}] 실행 중...")
+        current['suites'][name] = run_suite(name, args)
+        for metric_name, m in current['suites'][name].items():
+            print(f"  {metric_name:<36}{m['value']:>14,.2f} {m['unit']}")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = os.path.join(RESULTS_DIR, datetime.datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    with open(output, 'w', encoding='utf-8') as f: json.dump(current, f, ensure_ascii=False, indent=2);
+    print(f"\n결과 저장: {output}")
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding='utf-8') as f: baseline = json.load(f);
+        regressions = compare(baseline, current, args.threshold)
+        if regressions: print(f"\n기준값보다 {args.threshold:.0f}% 이상 나빠진 항목: {', '.join(regressions)}");
+    if args.save_baseline:
+        baseline = {'suites': {}, 'suite_args': {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding='utf-8') as f: baseline = json.load(f);
+        stored_args = baseline.setdefault('suite_args', {})
+        for suite in baseline.get('suites', {}): stored_args.setdefault(suite, suite_args(baseline, suite)); # 예전 형식: 실행 인자에서 채움
+        baseline['meta'] = current['meta']
+        for suite, metrics in current['suites'].items():
+            baseline['suites'][suite] = metrics; stored_args[suite] = suite_args(current, suite)
+        with open(args.baseline, 'w', encoding='utf-8') as f: json.dump(baseline, f, ensure_ascii=False, indent=2);
+        print(f"기준값 저장: {args.baseline} ({', '.join(current['suites'])})")
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+""" 저장 경로 벤치마크: 단건 삽입(log_temperature_to_db)과 기록 스레드가 쓰는 일괄 삽입(log_temperatures_to_db) 처리량 """
+import time
+
+import database
+from benchmarks.common import metric, scratch_database, add_devices
+
+def run(args):
+    results = {}
+    with scratch_database('storage.db'):
+        devices = add_devices(100)
+        start = time.perf_counter()
+        for i in range(args.inserts):
+            database.log_temperature_to_db(devices[i % len(devices)]['name'], -18.0 + (i % 40) / 10)
+        results["단건 삽입"] = metric(args.inserts / (time.perf_counter() - start), 'rows/s')
+
+        conn = database.configure_writer_connection(database.get_db_connection())
+        try:
+            total = args.inserts * 20; batch_size = 200; base_ts = int(time.time()) - total
+            start = time.perf_counter()
+            for offset in range(0, total, batch_size):
+                batch = [(devices[i % len(devices)]['name'], devices[i % len(devices)]['id'], base_ts + i, -18.0 + (i % 40) / 10) for i in range(offset, offset + batch_size)]
+                database.log_temperatures_to_db(batch, conn)
+            results["일괄 삽입 (200건/트랜잭션)"] = metric(total / (time.perf_counter() - start), 'rows/s')
+        finally:
+            conn.close()
+    return results
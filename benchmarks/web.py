@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+""" 웹 요청 벤치마크: Flask 테스트 클라이언트로 /api/latest_data(전체/304)와 /detail/<name>(7일) 지연을 잽니다. """
+import logging
+import time
+
+import database
+import shared_state
+from device_registry import registry
+from benchmarks.common import latency_metrics, time_calls, scratch_database, add_devices
+
+def run(args):
+    import main # 앱 모듈 (가져올 때 로깅 설정을 바꾸므로 측정 직전에 가져와 되돌림)
+    level = logging.getLogger().level
+    with scratch_database('web.db'):
+        devices = add_devices(args.web_devices)
+        conn = database.configure_writer_connection(database.get_db_connection())
+        try:
+            # 상세 페이지 장치에 7일치 이력 (60초 간격). 링 버퍼 예열 범위(24시간)를 넘으므로 DB 경로를 탑니다.
+            now = int(time.time()); target = devices[0]
+            samples = [(target['name'], target['id'], ts, -18.0 + (ts % 600) / 300) for ts in range(now - 7 * 86400, now, 60)]
+            for i in range(0, len(samples), 1000): database.log_temperatures_to_db(samples[i:i + 1000], conn);
+        finally:
+            conn.close()
+        registry.invalidate(); shared_state.initialize_shared_state()
+        logging.getLogger().setLevel(level)
+        client = main.app.test_client()
+        etag = client.get('/api/latest_data').headers.get('ETag')
+        results = {}
+        results.update(latency_metrics("/api/latest_data", time_calls(lambda: client.get('/api/latest_data'), args.repeat)))
+        results.update(latency_metrics("/api/latest_data 304", time_calls(lambda: client.get('/api/latest_data', headers={'If-None-Match': etag}), args.repeat)))
+        results.update(latency_metrics("/detail/<name> 7일", time_calls(lambda: client.get(f"/detail/{target['name']}"), max(1, args.repeat // 5))))
+    registry.invalidate()
+    return results
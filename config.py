@@ -2,6 +2,7 @@
 import os
 import json
 import database
+from device_registry import registry
 
 # --- 1. 기본 설정 ---
 COMPANY_NAME = "진푸드시스템"
@@ -10,12 +11,61 @@ COMPANY_NAME = "진푸드시스템"
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATABASE = os.path.join(BASE_DIR, 'data', 'monitoring.db')
 TABLE_NAME = 'temp_logs'
+LEGACY_TABLE_NAME = 'temp_logs_legacy' # 구 스키마(TEXT timestamp) 테이블. migrate.py로 옮긴 뒤 삭제 가능
 POLL_INTERVAL = 10 # 데이터 수집 주기 (초)
+POLL_WORKERS = 16 # 동시에 폴링할 최대 버스(ip:port) 수 (1이면 기존처럼 순차 폴링)
+MIN_POLL_INTERVAL = 2 # 장치별 폴링 간격의 하한 (초)
+NEAR_ALARM_MARGIN = 2.0 # 알람 임계값까지 이 온도(°C) 이내면 더 자주 폴링
+NEAR_ALARM_INTERVAL_FACTOR = 0.5 # 임계값 근처일 때 폴링 간격 배율
+ALARM_HYSTERESIS = 0.5 # 알람 해제 기준: 임계값보다 이 온도(°C)만큼 내려가야 해제 (장치별 alarm_rules로 바꿀 수 있음)
+ALARM_REPEAT_MINUTES = 30 # 알람이 이어질 때 다시 알리는 간격 (분)
+DEFROST_GRACE_MINUTES = 15 # 제상이 끝난 뒤 온도가 회복될 때까지 새 알람을 보류하는 시간 (분)
+DEFROST_MAX_MINUTES = 60 # 제상 신호가 이보다 오래 켜져 있으면(신호 고착 등) 보류를 멈추고 알람 (분, 제상 시작부터)
+OFFLINE_BACKOFF_MAX = 300 # 오프라인 장치 재확인 간격의 상한 (초)
+OFFLINE_PROBES_PER_BUS = 1 # 한 주기에 버스당 확인할 오프라인 장치 수 (timeout이 한 주기에 몰리지 않도록)
+CHART_MAX_POINTS = 500 # 상세 페이지 그래프에 보낼 최대 점 수 (LTTB로 모양을 보존하며 줄임)
+RECENT_BUFFER_HOURS = 24 # 장치별 메모리 링 버퍼에 보관할 최근 샘플 시간 (샘플당 16바이트)
+DB_BATCH_SIZE = 200 # 이 건수가 쌓이면 즉시 DB에 일괄 기록
+DB_FLUSH_INTERVAL = 2.0 # 건수가 차지 않아도 이 시간(초)이 지나면 일괄 기록
+DB_QUEUE_MAX = 10000 # 기록 대기열 최대 길이 (초과분은 기록 실패로 처리)
+DB_CACHE_KB = 16384 # 오래 쓰는 연결마다의 SQLite 페이지 캐시 크기 (KB)
+DB_MMAP_BYTES = 256 * 1024 * 1024 # 메모리 매핑 읽기 크기 (바이트, 0이면 사용 안 함)
+SPOOL_PATH = os.path.join(BASE_DIR, 'data', 'samples.spool') # DB 기록 실패/대기열 초과 샘플의 로컬 스풀 (프로세스마다 이름을 붙인 파일, None이면 사용 안 함)
+SPOOL_INITIAL_RECORDS = 65536 # 스풀 파일 초기 용량 (레코드 24바이트, 넘치면 두 배로 늘림)
+SPOOL_MAX_BYTES = 256 * 1024 * 1024 # 스풀 파일 최대 크기 (약 1,100만 샘플, 넘치면 버리고 로그)
+SPOOL_REPLAY_CHUNK = 5000 # 스풀을 DB로 옮길 때 한 트랜잭션의 레코드 수
+DB_POOL_MAX = 8 # 끝난 스레드에서 돌려받아 보관할 연결 수 (읽기/쓰기 각각)
+REGISTRY_CHECK_INTERVAL = 2.0 # 다른 프로세스의 장치 목록 변경을 확인하는 간격 (초)
+
+# 폴러/웹 분리 실행 (poller_service.py + wsgi.py)
+STATE_SEGMENT_PATH = os.path.join(BASE_DIR, 'data', 'live_state.seg') # 폴러가 실시간 상태를 쓰고 웹 작업자가 읽는 mmap 파일
+STATE_SEGMENT_BYTES = 256 * 1024 # 상태 세그먼트 슬롯 초기 크기 (넘치면 두 배로 늘림)
+STATE_FOLLOW_INTERVAL = 0.25 # 웹 작업자가 상태 세그먼트 변경을 확인하는 간격 (초, 실시간 스트림용)
+POLLER_METRICS_PORT = 9101 # 폴러 프로세스의 /metrics 포트 (0이면 열지 않음)
+LEASE_TTL = 30 # 장치 임대 유효 시간 (초). 폴러가 죽으면 이 시간 안에 다른 폴러가 넘겨받음
+LEASE_RENEW_INTERVAL = 10 # 임대 연장/재배정 주기 (초)
+
+# 보존 정책 (일 단위, None이면 영구 보존). 원본이 지워진 구간은 1분 롤업으로, 1분 롤업이 지워진 구간은 1시간 롤업으로 조회됩니다.
+RETENTION_DAYS = {
+    'raw': 30,
+    'temp_rollup_1m': 365,
+    'temp_rollup_1h': None,
+    'temp_rollup_1d': None,
+}
+RETENTION_INTERVAL = 6 * 3600 # 보존 정책 작업 실행 주기 (초)
+RETENTION_CHUNK = 2000 # 한 트랜잭션에 삭제할 최대 행 수 (폴러의 쓰기를 오래 막지 않도록)
+EXPORT_CHUNK = 5000 # 이력 내보내기에서 한 번에 읽는 행 수 (메모리 사용량 상한)
+
+# 알림 발송 (notifier.py)
+PUSHOVER_API_URL = os.environ.get('PUSHOVER_API_URL', "https://api.pushover.net/1/messages.json") # 시험용 로컬 엔드포인트로 바꿀 수 있음
+NOTIFY_COALESCE_SECONDS = 3.0 # 첫 알림 뒤 이 시간(초) 동안 들어온 알림은 한 건으로 묶어 전송
+NOTIFY_MAX_RETRIES = 4 # 네트워크 오류/5xx/429 재시도 횟수
+NOTIFY_BACKOFF_BASE = 2.0 # 재시도 대기 기본값 (초, 시도마다 2배)
 
 # --- 2. 동적 설정 로딩 ---
 def load_devices():
-    """DB에서 장치 목록을 불러옵니다."""
-    return database.get_all_devices()
+    """장치 목록을 불러옵니다. (프로세스 내 캐시. 장치 변경 API가 무효화하면 DB에서 다시 읽음)"""
+    return registry.all()
 
 def load_pushover_config():
     """DB에서 Pushover 설정을 불러옵니다."""
@@ -1,27 +1,170 @@
 import sqlite3
 import logging
+import threading
+import weakref
 import config
-import datetime
+import time
+import metrics
 
 log = logging.getLogger()
 
+# --- 롤업(사전 집계) 테이블: (테이블 이름, 버킷 길이(초), 버킷 시작 계산식) - 굵은 단위부터 ---
+# 일 단위는 로컬 자정 기준, 분/시간 단위는 epoch 기준으로 정렬합니다.
+ROLLUP_LEVELS = [
+    ('temp_rollup_1d', 86400, "CAST(strftime('%s', {ts}, 'unixepoch', 'localtime', 'start of day', 'utc') AS INTEGER)"),
+    ('temp_rollup_1h', 3600, "({ts} / 3600) * 3600"),
+    ('temp_rollup_1m', 60, "({ts} / 60) * 60"),
+]
+ROLLUP_WATERMARK_KEY = 'rollup_complete_from_{table}' # 이 epoch 이후 구간은 롤업이 원본과 일치함
+RAW_WATERMARK_KEY = 'raw_complete_from' # 보존 정책으로 이 epoch 이전 원본은 삭제됨 (1분 롤업으로 대체)
+DEVICES_REVISION_KEY = 'devices_revision' # 장치 추가/수정/삭제 때마다 증가 (다른 프로세스의 장치 캐시 무효화용)
+SETTINGS_REVISION_KEY = 'settings_revision' # 설정 저장 때마다 증가 (다른 프로세스의 설정 캐시 무효화용)
+
 def get_db_connection():
-    """ DB 연결 생성 (Row 팩토리 사용) """
+    """ 호출한 쪽이 소유하는 새 DB 연결 (Row 팩토리 사용). 명령줄 도구와 전용 기록 스레드처럼 직접 닫는 곳에서 씁니다. """
     conn = sqlite3.connect(config.DATABASE)
     conn.row_factory = sqlite3.Row
     return conn
 
+def configure_writer_connection(conn):
+    """ 쓰기 전용 연결 튜닝: WAL 모드(읽기와 쓰기가 서로 막지 않음) + synchronous=NORMAL(커밋마다 fsync 하지 않음) """
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL") # 새 DB에만 적용됨. WAL 전환이 DB 헤더를 먼저 쓰면 적용되지 않으므로 그 전에
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+def configure_cache(conn):
+    """ 오래 쓰는 연결 공통 튜닝: 페이지 캐시, 메모리 매핑 읽기, 임시 테이블/정렬을 메모리에 """
+    conn.execute(f"PRAGMA cache_size=-{config.DB_CACHE_KB}")
+    conn.execute(f"PRAGMA mmap_size={config.DB_MMAP_BYTES}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+class _Lease:
+    """ 스레드가 빌린 연결. 스레드가 끝나 thread-local이 정리되면 finalize가 연결을 풀로 돌려주거나 닫습니다. """
+    __slots__ = ('conn', 'path', '__weakref__')
+    def __init__(self, conn, path):
+        self.conn = conn; self.path = path
+
+class ConnectionManager:
+    """
+    스레드별로 오래 쓰는 연결을 나눠 주는 관리자. (database.py 안의 조회/수정 함수가 사용)
+    - 읽기 연결은 mode=ro + query_only라 쓰기 잠금을 잡지 않으므로, 웹 처리기의 조회가 폴러의 기록과 다투지 않습니다. (WAL)
+    - 스레드가 끝나면 연결을 닫지 않고 풀(최대 DB_POOL_MAX개)에 돌려, 요청마다 새 스레드를 쓰는 웹 서버에서도 재사용합니다.
+    - config.DATABASE가 바뀌면(벤치마크 등) 예전 경로의 연결은 버리고 새로 엽니다.
+    재사용 횟수 등은 metrics.db_connections_total(스레드별 shard, 잠금 없음)에 기록합니다.
+    """
+    def __init__(self, pool_max=None):
+        self._pool_max = pool_max # None이면 config.DB_POOL_MAX (config와 순환 import라 생성 시점에는 읽지 않음)
+        self._local = threading.local()
+        self._idle = {'ro': [], 'rw': []} # 모드 -> [(연결, 경로)]
+        self._lock = threading.Lock() # 풀 목록에만 사용
+
+    def _open(self, mode, path):
+        if mode == 'ro':
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+            conn.execute("PRAGMA query_only=1"); conn.execute("PRAGMA busy_timeout=5000")
+        else:
+            conn = configure_writer_connection(sqlite3.connect(path, check_same_thread=False))
+        conn.row_factory = sqlite3.Row
+        metrics.db_connections_total.inc(mode, 'opened')
+        return configure_cache(conn)
+
+    def _close(self, mode, conn):
+        try: conn.close();
+        except Exception as e: log.debug(f"DB 연결 닫기 실패: {e}");
+        metrics.db_connections_total.inc(mode, 'closed')
+
+    def _release(self, mode, conn, path):
+        """ 스레드 종료 시(finalize) 호출: 같은 경로이고 풀에 자리가 있으면 돌려놓고, 아니면 닫습니다. """
+        try:
+            if conn.in_transaction: conn.rollback(); # 끝내지 않은 트랜잭션은 버림
+        except Exception:
+            self._close(mode, conn); return
+        with self._lock:
+            idle = self._idle[mode]
+            pooled = path == config.DATABASE and len(idle) < (config.DB_POOL_MAX if self._pool_max is None else self._pool_max)
+            if pooled: idle.append((conn, path));
+        if pooled: metrics.db_connections_total.inc(mode, 'pooled');
+        else: self._close(mode, conn);
+
+    def get(self, mode):
+        """ 이 스레드의 연결 (mode: 'ro' 읽기 전용, 'rw' 읽기/쓰기). 닫지 말고 그대로 쓰면 됩니다. """
+        path = config.DATABASE
+        lease = getattr(self._local, mode, None)
+        if lease is not None:
+            if lease.path == path: metrics.db_connections_total.inc(mode, 'reused'); return lease.conn;
+            setattr(self._local, mode, None); self._close(mode, lease.conn) # 경로가 바뀜: 예전 연결은 닫음
+        with self._lock:
+            idle = self._idle[mode]
+            stale = [conn for conn, idle_path in idle if idle_path != path]
+            fresh = [conn for conn, idle_path in idle if idle_path == path]
+            conn = fresh.pop() if fresh else None
+            self._idle[mode] = [(idle_conn, path) for idle_conn in fresh]
+        for stale_conn in stale: self._close(mode, stale_conn);
+        if conn is None: conn = self._open(mode, path);
+        else: metrics.db_connections_total.inc(mode, 'reused');
+        lease = _Lease(conn, path)
+        weakref.finalize(lease, self._release, mode, conn, path).atexit = False
+        setattr(self._local, mode, lease)
+        return conn
+
+    def close_all(self):
+        """ 풀의 연결과 이 스레드의 연결을 닫습니다. (종료/시험용) """
+        for mode in ('ro', 'rw'):
+            lease = getattr(self._local, mode, None)
+            if lease is not None: setattr(self._local, mode, None); self._close(mode, lease.conn);
+            with self._lock:
+                idle = self._idle[mode]; self._idle[mode] = []
+            for conn, _ in idle: self._close(mode, conn);
+
+    def stats(self):
+        """ 모드별 {opened, reused, pooled, closed, idle, reuse_ratio} """
+        totals = metrics.db_connections_total.values()
+        result = {}
+        for mode in ('ro', 'rw'):
+            counts = {event: totals.get((mode, event), 0) for event in ('opened', 'reused', 'pooled', 'closed')}
+            counts['idle'] = len(self._idle[mode])
+            checkouts = counts['opened'] + counts['reused']
+            counts['reuse_ratio'] = round(counts['reused'] / checkouts, 4) if checkouts else None
+            result[mode] = counts
+        return result
+
+connections = ConnectionManager()
+metrics.Gauge('tempmon_db_idle_connections', "풀에서 대기 중인 DB 연결 수", lambda: sum(len(idle) for idle in connections._idle.values()))
+
+def get_read_connection():
+    """ 이 스레드의 읽기 전용 연결 (재사용, 닫지 않음) """
+    return connections.get('ro')
+
+def get_write_connection():
+    """ 이 스레드의 읽기/쓰기 연결 (재사용, 닫지 않음). with 블록으로 감싸면 끝날 때 commit/rollback """
+    return connections.get('rw')
+
 def init_db():
     try:
-        with get_db_connection() as conn:
+        with get_write_connection() as conn:
             c = conn.cursor()
+            # 보존 정책 삭제 후 빈 페이지를 조금씩 반환하려면 incremental auto_vacuum(2)이 필요. 테이블이 없는 새 DB인데
+            # 설정되지 않았으면(다른 연결이 먼저 WAL로 바꾼 경우 등) 빈 DB를 VACUUM해서라도 적용합니다.
+            if not c.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone() and c.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                c.execute("PRAGMA auto_vacuum=INCREMENTAL"); c.execute("VACUUM")
+                if c.execute("PRAGMA auto_vacuum").fetchone()[0] != 2: log.warning("새 DB에 auto_vacuum=INCREMENTAL을 적용하지 못했습니다. 보존 정책이 디스크 공간을 반환하지 않습니다.");
+            c.execute("PRAGMA journal_mode=WAL") # WAL 모드는 DB 파일에 영구 저장됨
+            # 구 스키마(device_name TEXT, timestamp TEXT)의 temp_logs는 이름만 바꿔 보존하고, migrate.py가 옮깁니다.
+            columns = [row['name'] for row in c.execute(f"PRAGMA table_info({config.TABLE_NAME})")]
+            if 'device_name' in columns:
+                c.execute(f"ALTER TABLE {config.TABLE_NAME} RENAME TO {config.LEGACY_TABLE_NAME}")
+                log.warning(f"구 스키마 {config.TABLE_NAME} 테이블을 {config.LEGACY_TABLE_NAME}로 보존했습니다. 'python migrate.py'로 이력을 옮겨주세요.")
+            # (device_id, ts) 기본키 자체가 조회용 복합 인덱스이며, WITHOUT ROWID라 온도값까지 한 B-tree에 담겨 커버링됩니다.
             c.execute(f'''
                 CREATE TABLE IF NOT EXISTS {config.TABLE_NAME} (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp TEXT NOT NULL,  /* DATETIME 대신 TEXT로 지정 */
-                    device_name TEXT NOT NULL,
-                    temperature REAL NOT NULL
-                )
+                    device_id INTEGER NOT NULL REFERENCES devices(id),
+                    ts INTEGER NOT NULL,  /* Unix epoch (초) */
+                    temperature REAL NOT NULL,
+                    PRIMARY KEY (device_id, ts)
+                ) WITHOUT ROWID
             ''')
             c.execute('''
                 CREATE TABLE IF NOT EXISTS devices (
@@ -31,9 +174,16 @@ def init_db():
                     port INTEGER NOT NULL,
                     controller_id TEXT NOT NULL,
                     alarm_threshold REAL,
-                    memo TEXT
+                    memo TEXT,
+                    poll_interval INTEGER,  /* 장치별 폴링 간격(초). NULL이면 config.POLL_INTERVAL */
+                    alarm_rules TEXT  /* 알람 규칙 JSON (alarm_rules.py). NULL이면 임계값 + 기본 히스테리시스 */
                 )
             ''')
+            device_columns = [row['name'] for row in c.execute("PRAGMA table_info(devices)")]
+            if 'poll_interval' not in device_columns:
+                c.execute("ALTER TABLE devices ADD COLUMN poll_interval INTEGER")
+            if 'alarm_rules' not in device_columns:
+                c.execute("ALTER TABLE devices ADD COLUMN alarm_rules TEXT")
             c.execute('''
                 CREATE TABLE IF NOT EXISTS settings (
                     key TEXT PRIMARY KEY,
@@ -42,6 +192,31 @@ def init_db():
             ''')
             c.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('pushover_api_token', '')")
             c.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('pushover_user_keys', '[]')")
+            init_rollups(c)
+            # 폴러 샤딩: 장치별 임대(어느 폴러가 언제까지 맡는지), 살아 있는 폴러 목록, 알림 중복을 막는 장치별 알람/오프라인 상태
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS device_leases (
+                    device_id INTEGER PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL  /* epoch (초). 지나면 다른 폴러가 가져갈 수 있음 */
+                )
+            ''')
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS pollers (
+                    owner TEXT PRIMARY KEY,
+                    heartbeat_at REAL NOT NULL,
+                    started_at REAL NOT NULL
+                )
+            ''')
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS device_alarm_state (
+                    device_id INTEGER PRIMARY KEY,
+                    in_alarm INTEGER NOT NULL DEFAULT 0,
+                    last_alarm_at REAL,  /* 마지막으로 알람(최초/반복)을 보낸 epoch */
+                    offline INTEGER NOT NULL DEFAULT 0,
+                    updated_at REAL
+                )
+            ''')
 
             conn.commit()
             log.info(f"DB 테이블 초기화 완료 ({config.DATABASE})")
@@ -49,89 +224,361 @@ def init_db():
         log.critical(f"DB 초기화 실패 - {e}")
         raise
 
+def init_rollups(c):
+    """
+    1분/1시간/1일 롤업 테이블과, 원본 삽입 시 롤업을 갱신하는 트리거를 만듭니다.
+    트리거는 실제로 삽입된 행에만 동작하므로(INSERT OR IGNORE로 무시된 중복은 제외) 집계가 이중으로 쌓이지 않습니다.
+    """
+    has_raw_rows = c.execute(f"SELECT 1 FROM {config.TABLE_NAME} LIMIT 1").fetchone() is not None
+    trigger_body = []
+    for table, size, bucket_expr in ROLLUP_LEVELS:
+        created = c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone() is None
+        c.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                device_id INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,  /* 구간 시작 epoch (초) */
+                min_temp REAL NOT NULL,
+                max_temp REAL NOT NULL,
+                sum_temp REAL NOT NULL,
+                sample_count INTEGER NOT NULL,
+                PRIMARY KEY (device_id, bucket)
+            ) WITHOUT ROWID
+        ''')
+        if created:
+            # 원본 데이터가 이미 있던 DB라면, 지금 이후 구간만 롤업이 완전합니다. (rollup.py backfill로 과거 구간 채움)
+            watermark = (int(time.time()) // size + 1) * size if has_raw_rows else 0
+            c.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (ROLLUP_WATERMARK_KEY.format(table=table), str(watermark)))
+            if has_raw_rows: log.warning(f"롤업 테이블 {table} 생성: 기존 이력은 'python rollup.py backfill'로 채워주세요.");
+        trigger_body.append(f"""
+                INSERT INTO {table} (device_id, bucket, min_temp, max_temp, sum_temp, sample_count)
+                VALUES (NEW.device_id, {bucket_expr.format(ts='NEW.ts')}, NEW.temperature, NEW.temperature, NEW.temperature, 1)
+                ON CONFLICT(device_id, bucket) DO UPDATE SET
+                    min_temp = MIN(min_temp, excluded.min_temp), max_temp = MAX(max_temp, excluded.max_temp),
+                    sum_temp = sum_temp + excluded.sum_temp, sample_count = sample_count + 1;""")
+    c.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {config.TABLE_NAME}_rollup AFTER INSERT ON {config.TABLE_NAME}
+            BEGIN{''.join(trigger_body)}
+            END
+    """)
+
+def get_rollup_watermarks(conn):
+    """ {롤업 테이블: 집계가 완전한 구간의 시작 epoch} """
+    rows = conn.execute("SELECT key, value FROM settings WHERE key LIKE 'rollup_complete_from_%'").fetchall()
+    return {row['key'][len('rollup_complete_from_'):]: int(row['value']) for row in rows}
+
+def get_raw_watermark(conn):
+    row = conn.execute("SELECT value FROM settings WHERE key=?", (RAW_WATERMARK_KEY,)).fetchone()
+    return int(row['value']) if row else 0
+
+def choose_rollup(conn, interval_minutes, start_ts):
+    """
+    요청 간격을 나눠떨어지게 하는 가장 굵은 롤업 중, 요청 구간 전체에서 집계가 완전한 것을 고릅니다.
+    맞는 롤업이 없으면 None (원본 테이블 사용). 단, 보존 정책으로 원본까지 지워진 구간이면
+    간격보다 굵더라도 남아 있는 가장 세밀한 롤업을 씁니다.
+    """
+    interval_seconds = interval_minutes * 60
+    watermarks = get_rollup_watermarks(conn)
+    is_complete = lambda table: table in watermarks and start_ts >= watermarks[table]
+    for table, size, _ in ROLLUP_LEVELS:
+        if size == 86400 and interval_seconds != 86400: continue; # 일 버킷은 로컬 자정 기준이라 정확히 1일 간격에만 사용
+        if interval_seconds % size: continue;
+        if is_complete(table): return table, size;
+    if start_ts >= get_raw_watermark(conn): return None, None;
+    for table, size, _ in reversed(ROLLUP_LEVELS):
+        if is_complete(table): return table, size;
+    return None, None
+
+def to_epoch(dt_str, fmt='%Y-%m-%d %H:%M:%S'):
+    """ 로컬 시각 문자열을 Unix epoch(초)로 변환 """
+    return int(time.mktime(time.strptime(dt_str, fmt)))
+
+def date_range_to_epoch(start_date_str, end_date_str):
+    """ 'YYYY-MM-DD' 시작일 00:00:00 ~ 종료일 23:59:59 (로컬 시각)를 epoch 범위로 변환 """
+    return to_epoch(start_date_str, '%Y-%m-%d'), to_epoch(end_date_str + ' 23:59:59')
+
 def log_temperature_to_db(device_name, temperature):
     """ 측정된 현재 온도를 DB에 삽입 """
     try:
         if not isinstance(temperature, (int, float)) or temperature != temperature or abs(temperature) == float('inf'):
             log.warning(f"{device_name}: 유효하지 않은 온도 값({temperature})은 DB에 저장하지 않음."); return;
         
-        current_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        with get_db_connection() as conn:
+        current_ts = int(time.time())
+        with get_write_connection() as conn:
             c = conn.cursor();
-            c.execute(f"INSERT INTO {config.TABLE_NAME} (device_name, timestamp, temperature) VALUES (?, ?, ?)", (device_name, current_time, temperature));
+            c.execute(f"INSERT OR IGNORE INTO {config.TABLE_NAME} (device_id, ts, temperature) SELECT id, ?, ? FROM devices WHERE name = ?", (current_ts, temperature, device_name));
+            if c.rowcount == 0 and c.execute("SELECT 1 FROM devices WHERE name = ?", (device_name,)).fetchone() is None:
+                raise ValueError(f"등록되지 않은 장치: {device_name}"); # rowcount 0은 같은 초의 중복 샘플일 수도 있음
             conn.commit();
-            log.debug(f"DB 저장 성공: {device_name}={temperature}°C at {current_time}");
+            log.debug(f"DB 저장 성공: {device_name}={temperature}°C at {current_ts}");
     except Exception as e:
         log.error(f"{device_name}: DB 저장 실패 - {e}");
         raise # 에러를 다시 발생시켜 호출한 쪽에서 알 수 있도록 함
 
+def log_temperatures_to_db(samples, conn):
+    """
+    여러 샘플 [(device_name, device_id, ts, temperature), ...]을 executemany로 한 트랜잭션에 삽입.
+    유효하지 않은 온도 값은 제외하고, 실제 삽입한 건수를 반환합니다. 실패 시 롤백 후 예외를 다시 발생시킵니다.
+    같은 장치·같은 초의 중복 샘플은 먼저 기록된 값을 유지합니다.
+    """
+    rows = []
+    for device_name, device_id, ts, temperature in samples:
+        if not isinstance(temperature, (int, float)) or temperature != temperature or abs(temperature) == float('inf'):
+            log.warning(f"{device_name}: 유효하지 않은 온도 값({temperature})은 DB에 저장하지 않음."); continue;
+        rows.append((device_id, ts, temperature))
+    if not rows: return 0;
+    try:
+        with conn: # 성공 시 commit, 예외 시 rollback
+            conn.executemany(f"INSERT OR IGNORE INTO {config.TABLE_NAME} (device_id, ts, temperature) VALUES (?, ?, ?)", rows)
+        log.debug(f"DB 배치 저장 성공: {len(rows)}건")
+        return len(rows)
+    except Exception as e:
+        log.error(f"DB 배치 저장 실패 ({len(rows)}건) - {e}");
+        raise
+
 def get_historical_data(device_name, start_date_str, end_date_str, interval_minutes=None):
     """
     상세 페이지 그래프용 과거 데이터 가져오기.
-    interval_minutes가 지정되면 해당 분 간격으로 데이터의 평균을 계산합니다.
+    interval_minutes가 지정되면 해당 분 간격으로 데이터의 평균(및 최소/최대, 구간 시작 epoch bucket_ts)을 계산합니다.
+    이때 간격과 구간에 맞는 가장 굵은 롤업 테이블이 있으면 원본 대신 롤업에서 읽습니다.
     """
-    with get_db_connection() as conn:
+    with get_read_connection() as conn:
         c = conn.cursor();
-        end_date_inclusive = end_date_str + ' 23:59:59'
+        start_ts, end_ts = date_range_to_epoch(start_date_str, end_date_str)
 
+        rollup_table = None
         if interval_minutes:
-            # SQLite에서 unixepoch를 사용하여 시간 그룹화 및 평균 계산
-            query = """
+            rollup_table, rollup_size = choose_rollup(conn, interval_minutes, start_ts)
+
+        if rollup_table:
+            # 사전 집계된 롤업에서 가중 평균 (SUM(sum)/SUM(count))
+            group_expr = "bucket" if rollup_size == 86400 else f"(bucket / {interval_minutes * 60}) * {interval_minutes * 60}"
+            query = f"""
+                SELECT
+                    strftime('%Y-%m-%d %H:%M:00', {group_expr}, 'unixepoch', 'localtime') as timestamp,
+                    {group_expr} as bucket_ts,
+                    SUM(sum_temp) / SUM(sample_count) as temperature,
+                    MIN(min_temp) as min_temp, MAX(max_temp) as max_temp
+                FROM {rollup_table}
+                WHERE device_id = (SELECT id FROM devices WHERE name = ?) AND bucket BETWEEN ? AND ?
+                GROUP BY {group_expr}
+                ORDER BY {group_expr} ASC
+            """
+            params = (device_name, start_ts, end_ts)
+        elif interval_minutes:
+            # 정수 epoch를 구간 길이로 나눠 그룹화 (인덱스 범위 스캔, 행마다 문자열 변환 없음)
+            query = f"""
                 SELECT
-                    strftime('%Y-%m-%d %H:%M:00', datetime(CAST(strftime('%s', timestamp) / (60 * ?) AS INTEGER) * (60 * ?), 'unixepoch')) as timestamp,
-                    AVG(temperature) as temperature
-                FROM temp_logs
-                WHERE device_name = ? AND timestamp BETWEEN ? AND ?
-                GROUP BY 1
-                ORDER BY 1 ASC
+                    strftime('%Y-%m-%d %H:%M:00', (ts / (60 * ?)) * (60 * ?), 'unixepoch', 'localtime') as timestamp,
+                    (ts / (60 * ?)) * (60 * ?) as bucket_ts,
+                    AVG(temperature) as temperature,
+                    MIN(temperature) as min_temp, MAX(temperature) as max_temp
+                FROM {config.TABLE_NAME}
+                WHERE device_id = (SELECT id FROM devices WHERE name = ?) AND ts BETWEEN ? AND ?
+                GROUP BY ts / (60 * ?)
+                ORDER BY MIN(ts) ASC
             """
-            params = (interval_minutes, interval_minutes, device_name, start_date_str, end_date_inclusive)
+            params = (interval_minutes, interval_minutes, interval_minutes, interval_minutes, device_name, start_ts, end_ts, interval_minutes)
         else:
-            query = "SELECT timestamp, temperature FROM temp_logs WHERE device_name = ? AND timestamp BETWEEN ? AND ? ORDER BY timestamp ASC"
-            params = (device_name, start_date_str, end_date_inclusive)
+            source, rollup_table, params = raw_sample_source(conn, start_ts)
+            query = f"SELECT strftime('%Y-%m-%d %H:%M:%S', ts, 'unixepoch', 'localtime') as timestamp, temperature FROM ({source}) ORDER BY ts ASC"
+            params.update(device=device_name, start=start_ts, end=end_ts)
 
         c.execute(query, params)
         
         rows = c.fetchall();
-        log.info(f"DB 조회: {device_name} ({start_date_str}~{end_date_str}, 간격: {interval_minutes}분) -> {len(rows)}건")
+        log.info(f"DB 조회: {device_name} ({start_date_str}~{end_date_str}, 간격: {interval_minutes}분, 원천: {rollup_table or config.TABLE_NAME}) -> {len(rows)}건")
         return rows;
 
+def get_comparison_data(device_ids, start_ts, end_ts, interval_minutes):
+    """
+    여러 장치 비교용: interval_minutes 구간 평균을 한 번의 그룹 쿼리로 가져와 공통 시각 축에 맞춥니다.
+    get_historical_data와 같은 규칙으로 맞는 롤업이 있으면 원본 대신 롤업에서 읽습니다.
+    반환: (구간 시작 epoch 목록, {device_id: 평균 온도 목록(없는 구간은 None)}, 원천 이름)
+    """
+    if not device_ids: return [], {}, None;
+    bucket_seconds = interval_minutes * 60
+    placeholders = ','.join('?' * len(device_ids))
+    with get_read_connection() as conn:
+        rollup_table, rollup_size = choose_rollup(conn, interval_minutes, start_ts)
+        if rollup_table:
+            group_expr = "bucket" if rollup_size == 86400 else f"(bucket / {bucket_seconds}) * {bucket_seconds}"
+            query = f"""
+                SELECT device_id, {group_expr} AS bucket_ts, SUM(sum_temp) / SUM(sample_count) AS temperature
+                FROM {rollup_table}
+                WHERE device_id IN ({placeholders}) AND bucket BETWEEN ? AND ?
+                GROUP BY device_id, {group_expr}
+            """
+        else:
+            query = f"""
+                SELECT device_id, (ts / {bucket_seconds}) * {bucket_seconds} AS bucket_ts, AVG(temperature) AS temperature
+                FROM {config.TABLE_NAME}
+                WHERE device_id IN ({placeholders}) AND ts BETWEEN ? AND ?
+                GROUP BY device_id, ts / {bucket_seconds}
+            """
+        rows = conn.execute(query, (*device_ids, start_ts, end_ts)).fetchall()
+    timestamps = sorted({row['bucket_ts'] for row in rows})
+    position = {ts: i for i, ts in enumerate(timestamps)}
+    series = {device_id: [None] * len(timestamps) for device_id in device_ids}
+    for row in rows:
+        series[row['device_id']][position[row['bucket_ts']]] = row['temperature']
+    log.info(f"DB 조회: 비교 {len(device_ids)}개 장치 (간격: {interval_minutes}분, 원천: {rollup_table or config.TABLE_NAME}) -> {len(rows)}건")
+    return timestamps, series, rollup_table or config.TABLE_NAME
+
+def raw_sample_source(conn, start_ts):
+    """
+    원본 샘플 조회용 서브쿼리(열: ts, temperature; 인자: :device, :start, :end), 원천 이름, 추가 인자를 돌려줍니다.
+    원본이 보존 기간을 지나 삭제된 앞부분은 구간을 덮는 가장 세밀한 롤업(보통 1분)의 평균으로 채웁니다.
+    """
+    raw_sql = f"SELECT ts, temperature FROM {config.TABLE_NAME} WHERE device_id = (SELECT id FROM devices WHERE name = :device) AND ts BETWEEN :start AND :end"
+    raw_from = get_raw_watermark(conn)
+    if start_ts >= raw_from: return raw_sql, config.TABLE_NAME, {};
+    fill_table = choose_fill_rollup(conn, start_ts)
+    source = f"""
+        SELECT bucket AS ts, sum_temp / sample_count AS temperature FROM {fill_table}
+        WHERE device_id = (SELECT id FROM devices WHERE name = :device) AND bucket BETWEEN :start AND :end AND bucket < :raw_from
+        UNION ALL
+        {raw_sql} AND ts >= :raw_from
+    """
+    return source, f"{fill_table}+{config.TABLE_NAME}", {'raw_from': raw_from}
+
+def choose_fill_rollup(conn, start_ts):
+    """ 원본이 지워진 구간을 채울 롤업: start_ts부터 완전한 가장 세밀한 롤업, 없으면 가장 오래전부터 완전한 롤업 """
+    watermarks = get_rollup_watermarks(conn)
+    complete = [table for table, _, _ in reversed(ROLLUP_LEVELS) if watermarks.get(table, float('inf')) <= start_ts]
+    return complete[0] if complete else min(watermarks, key=watermarks.get)
+
+def iter_export_chunks(device_ids, start_ts, end_ts, chunk_size=None):
+    """
+    내보내기용: 장치별 시간순 샘플을 (device_id, 원천, [(ts, temperature), ...]) 청크로 하나씩 돌려줍니다.
+    청크마다 (device_id, ts) 기본키 범위를 이어 읽는 짧은 조회(키셋 페이지)를 새로 실행하므로,
+    구간이 아무리 길어도 메모리에는 청크 하나만 올라가고 읽기 트랜잭션을 오래 잡지 않습니다. (WAL 모드라 폴러의 쓰기도 막지 않음)
+    원본이 보존 정책으로 지워진 앞부분은 원본 대신 남아 있는 가장 세밀한 롤업의 구간 평균으로 채웁니다. (원천 이름으로 구분)
+    """
+    chunk_size = chunk_size or config.EXPORT_CHUNK
+    conn = get_read_connection()
+    raw_from = get_raw_watermark(conn)
+    sources = []
+    if start_ts < raw_from:
+        fill_table = choose_fill_rollup(conn, start_ts)
+        sources.append((fill_table, 'bucket', 'sum_temp / sample_count', start_ts, min(end_ts, raw_from - 1)))
+    if end_ts >= raw_from:
+        sources.append((config.TABLE_NAME, 'ts', 'temperature', max(start_ts, raw_from), end_ts))
+    for device_id in device_ids:
+        for table, key_col, value_expr, lower, upper in sources:
+            query = f"SELECT {key_col}, {value_expr} FROM {table} WHERE device_id = ? AND {key_col} > ? AND {key_col} <= ? ORDER BY {key_col} LIMIT ?"
+            last = lower - 1
+            while True:
+                # 청크마다 지금 스레드의 연결을 다시 받음 (응답 생성기가 다른 스레드에서 이어질 수도 있음)
+                rows = get_read_connection().execute(query, (device_id, last, upper, chunk_size)).fetchall()
+                if not rows: break;
+                yield device_id, table, [tuple(row) for row in rows]
+                if len(rows) < chunk_size: break;
+                last = rows[-1][0]
+
+def get_decimated_history(device_name, start_date_str, end_date_str, step_minutes=30):
+    """
+    상세 페이지 기록 표용: step_minutes 구간마다 마지막 샘플 하나씩 (최신순).
+    솎아내기를 SQL에서 끝내므로 원본 전체를 파이썬으로 가져오지 않습니다.
+    """
+    with get_read_connection() as conn:
+        start_ts, end_ts = date_range_to_epoch(start_date_str, end_date_str)
+        source, source_name, params = raw_sample_source(conn, start_ts)
+        params.update(device=device_name, start=start_ts, end=end_ts, step=step_minutes * 60)
+        # SQLite는 MAX()와 함께 고른 일반 열(temperature)을 MAX(ts)인 행에서 가져옵니다.
+        rows = conn.execute(f"""
+            SELECT strftime('%Y-%m-%d %H:%M:%S', MAX(ts), 'unixepoch', 'localtime') as timestamp, temperature
+            FROM ({source})
+            GROUP BY ts / :step
+            ORDER BY MAX(ts) DESC
+        """, params).fetchall()
+        log.info(f"DB 조회: {device_name} ({start_date_str}~{end_date_str}, {step_minutes}분 간격 솎아내기, 원천: {source_name}) -> {len(rows)}건")
+        return rows
+
+def get_recent_samples(since_ts):
+    """ since_ts 이후 모든 장치의 원본 샘플 (device_name, ts, temperature) - 장치별 시간순 (링 버퍼 예열용) """
+    with get_read_connection() as conn:
+        return conn.execute(f"""
+            SELECT d.name AS device_name, l.ts AS ts, l.temperature AS temperature
+            FROM devices d JOIN {config.TABLE_NAME} l ON l.device_id = d.id AND l.ts >= ?
+            ORDER BY d.id, l.ts
+        """, (since_ts,)).fetchall()
+
 def get_all_devices():
     """ DB에서 모든 장치 목록 가져오기 """
-    with get_db_connection() as conn:
+    with get_read_connection() as conn:
         c = conn.cursor()
-        c.execute("SELECT id, name, ip, port, controller_id, alarm_threshold, memo FROM devices ORDER BY name")
+        c.execute("SELECT id, name, ip, port, controller_id, alarm_threshold, memo, poll_interval, alarm_rules FROM devices ORDER BY name")
         return [dict(row) for row in c.fetchall()]
 
-def add_device(name, ip, port, controller_id, alarm_threshold, memo):
+def bump_revision(conn, key):
+    """ 리비전 카운터 증가 (호출한 쪽의 트랜잭션 안에서) """
+    conn.execute("INSERT INTO settings (key, value) VALUES (?, '1') ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1", (key,))
+
+def get_revision(key):
+    """ 리비전 카운터 현재 값 (없으면 0). 기본키 조회 한 번이라 자주 불러도 됩니다. """
+    row = get_read_connection().execute("SELECT value FROM settings WHERE key=?", (key,)).fetchone()
+    return int(row['value']) if row else 0
+
+def get_alarm_states(device_ids):
+    """ {device_id: {'in_alarm', 'last_alarm_at', 'offline'}} (기록이 없는 장치는 빠짐) """
+    if not device_ids: return {};
+    conn = get_read_connection()
+    rows = conn.execute(f"SELECT device_id, in_alarm, last_alarm_at, offline FROM device_alarm_state WHERE device_id IN ({','.join('?' * len(device_ids))})", tuple(device_ids)).fetchall()
+    return {row['device_id']: {'in_alarm': bool(row['in_alarm']), 'last_alarm_at': row['last_alarm_at'], 'offline': bool(row['offline'])} for row in rows}
+
+def transition_device_state(device_id, owner, expect, changes):
+    """
+    장치 알람/오프라인 상태를 expect(열: 지금 값)에서 changes(열: 새 값)로 바꿉니다. 바꿨으면 True.
+    owner가 주어지면 그 폴러가 유효한 임대를 가진 동안만 바꿉니다. 같은 전이는 한 폴러만 성공하므로,
+    True를 받은 쪽만 알림을 보내면 샤드가 바뀌거나 재시작해도 알림이 정확히 한 번 나갑니다.
+    """
+    now = time.time()
+    sets = ', '.join(f"{column} = :new_{column}" for column in changes)
+    conditions = ' AND '.join(f"{column} IS :old_{column}" for column in expect)
+    params = {'device_id': device_id, 'owner': owner, 'now': now}
+    params.update({f"new_{column}": value for column, value in changes.items()})
+    params.update({f"old_{column}": value for column, value in expect.items()})
+    lease_check = "AND EXISTS (SELECT 1 FROM device_leases WHERE device_id = :device_id AND owner = :owner AND expires_at > :now)" if owner else ""
+    with get_write_connection() as conn:
+        conn.execute("INSERT OR IGNORE INTO device_alarm_state (device_id, updated_at) VALUES (:device_id, :now)", params)
+        cursor = conn.execute(f"UPDATE device_alarm_state SET {sets}, updated_at = :now WHERE device_id = :device_id AND {conditions} {lease_check}", params)
+        return cursor.rowcount == 1
+
+def add_device(name, ip, port, controller_id, alarm_threshold, memo, poll_interval=None, alarm_rules=None):
     """ DB에 새 장치 추가 """
-    with get_db_connection() as conn:
+    with get_write_connection() as conn:
         conn.execute(
-            "INSERT INTO devices (name, ip, port, controller_id, alarm_threshold, memo) VALUES (?, ?, ?, ?, ?, ?)",
-            (name, ip, port, controller_id, alarm_threshold, memo)
+            "INSERT INTO devices (name, ip, port, controller_id, alarm_threshold, memo, poll_interval, alarm_rules) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (name, ip, port, controller_id, alarm_threshold, memo, poll_interval, alarm_rules)
         )
+        bump_revision(conn, DEVICES_REVISION_KEY)
         conn.commit()
 
-def update_device(device_id, name, ip, port, controller_id, alarm_threshold, memo):
+def update_device(device_id, name, ip, port, controller_id, alarm_threshold, memo, poll_interval=None, alarm_rules=None):
     """ DB의 장치 정보 수정 """
-    with get_db_connection() as conn:
+    with get_write_connection() as conn:
         conn.execute(
-            "UPDATE devices SET name=?, ip=?, port=?, controller_id=?, alarm_threshold=?, memo=? WHERE id=?",
-            (name, ip, port, controller_id, alarm_threshold, memo, device_id)
+            "UPDATE devices SET name=?, ip=?, port=?, controller_id=?, alarm_threshold=?, memo=?, poll_interval=?, alarm_rules=? WHERE id=?",
+            (name, ip, port, controller_id, alarm_threshold, memo, poll_interval, alarm_rules, device_id)
         )
+        bump_revision(conn, DEVICES_REVISION_KEY)
         conn.commit()
 
 def delete_device(device_id):
     """ DB에서 장치 삭제 """
-    with get_db_connection() as conn:
+    with get_write_connection() as conn:
         conn.execute("DELETE FROM devices WHERE id=?", (device_id,))
+        conn.execute("DELETE FROM device_leases WHERE device_id=?", (device_id,))
+        conn.execute("DELETE FROM device_alarm_state WHERE device_id=?", (device_id,))
+        bump_revision(conn, DEVICES_REVISION_KEY)
         conn.commit()
 
 def get_settings():
-    with get_db_connection() as conn:
+    with get_read_connection() as conn:
         return {row['key']: row['value'] for row in conn.execute("SELECT key, value FROM settings").fetchall()}
 
 def update_setting(key, value):
-    with get_db_connection() as conn:
+    with get_write_connection() as conn:
         conn.execute("UPDATE settings SET value=? WHERE key=?", (value, key))
+        bump_revision(conn, SETTINGS_REVISION_KEY)
         conn.commit()
\ No newline at end of file
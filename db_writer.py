@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+import queue
+import threading
+import time
+import atexit
+import os
+import logging
+
+import config
+import database
+import metrics
+import spool as spool_module
+
+log = logging.getLogger()
+
+class TemperatureWriter:
+    """
+    폴링 루프와 분리된 DB 기록 단계.
+    폴러는 submit()으로 샘플을 대기열에 넣기만 하고, 전용 스레드가 건수/시간 조건에 따라 한 트랜잭션으로 일괄 기록합니다.
+    배치 결과는 on_batch_result(device_names, error) 콜백으로 알려줍니다. (성공 시 error=None)
+    기록에 실패한 배치와 대기열이 가득 차 넣지 못한 샘플은 로컬 스풀(spool.py)에 보관했다가, DB가 정상이면 새 배치 사이사이에 옮깁니다.
+    """
+    def __init__(self, batch_size=None, flush_interval=None, max_queue=None, on_batch_result=None):
+        self.batch_size = batch_size or config.DB_BATCH_SIZE
+        self.flush_interval = flush_interval or config.DB_FLUSH_INTERVAL
+        self.on_batch_result = on_batch_result
+        self._queue = queue.Queue(maxsize=max_queue or config.DB_QUEUE_MAX)
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._conn = None
+        self.spool = None # start()에서 config.SPOOL_PATH가 있으면 엶
+        self._last_flush_ok = True
+
+    def submit(self, device_name, device_id, temperature, ts):
+        """ 샘플(ts: epoch 초)을 대기열에 넣습니다. 대기열이 가득 차면 False를 반환합니다. (블로킹 없음) """
+        try:
+            self._queue.put_nowait((device_name, device_id, ts, temperature))
+            return True
+        except queue.Full:
+            if self.spool is not None and self.spool.append_many([(device_id, ts, temperature)]):
+                log.warning(f"DB 기록 대기열 가득 참 ({self._queue.maxsize}건): {device_name} 샘플을 로컬 스풀에 보관")
+                return True
+            log.error(f"🚨 DB 기록 대기열 가득 참 ({self._queue.maxsize}건): {device_name} 샘플 누락")
+            return False
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def start(self, spool_owner=None):
+        """ spool_owner: 이 프로세스의 스풀 파일 이름에 붙일 이름 (폴러 이름. 생략하면 pid) """
+        if self._thread and self._thread.is_alive(): return;
+        if self.spool is None and config.SPOOL_PATH:
+            path = spool_module.spool_path(config.SPOOL_PATH, spool_owner or str(os.getpid()))
+            try:
+                self.spool = spool_module.SampleSpool(path)
+                log.info(f"로컬 스풀: {path} (남은 {self.spool.pending()}건)")
+            except (OSError, ValueError) as e:
+                log.error(f"로컬 스풀을 열지 못했습니다 ({path}): {e}. DB 기록 실패 시 샘플이 누락됩니다.")
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="DBWriterThread", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        log.info(f"DB 기록 스레드 시작 (배치 {self.batch_size}건 / {self.flush_interval}초)")
+
+    def stop(self, timeout=10.0):
+        """ 남은 샘플을 모두 기록하고 스레드를 종료합니다. """
+        self._stop_event.set()
+        if self._thread: self._thread.join(timeout);
+
+    def _run(self):
+        self._adopt_orphan_spools()
+        while not self._stop_event.is_set():
+            batch = self._collect_batch()
+            if batch: self._flush(batch);
+            if self._last_flush_ok or not batch: self._replay_spool(); # DB가 계속 실패하는 동안은 새 배치 기록만 시도
+        # 종료 시 대기열에 남은 샘플까지 기록
+        batch = self._drain()
+        while batch:
+            self._flush(batch); batch = self._drain();
+        if self.spool is not None:
+            self._replay_spool(max_chunks=None)
+            self.spool.close(remove_if_empty=True); self.spool = None
+        self._close_connection()
+
+    def _adopt_orphan_spools(self):
+        """ 죽은 프로세스가 남긴 스풀을 가져와 DB로 옮깁니다. (시작 시 한 번) """
+        if not config.SPOOL_PATH: return;
+        try:
+            spool_module.adopt_orphans(config.SPOOL_PATH, self._connection())
+        except Exception as e:
+            log.error(f"남은 스풀 옮기기 실패 (다음 시작 때 다시 시도): {e}"); self._close_connection()
+
+    def _replay_spool(self, max_chunks=1):
+        """ 스풀에 남은 샘플을 max_chunks 묶음만큼 DB로 옮깁니다. 실패하면 다음 차례에 다시 시도합니다. """
+        spool = self.spool
+        if spool is None or not spool.pending(): return;
+        try:
+            count = spool_module.replay(spool, self._connection(), max_chunks=max_chunks)
+            if count: log.info(f"로컬 스풀 {count}건을 DB로 옮겼습니다. (남은 {spool.pending()}건)");
+        except Exception as e:
+            log.warning(f"로컬 스풀 옮기기 실패 (남은 {spool.pending()}건, 다음에 다시 시도): {e}")
+            self._close_connection()
+        spool.sync()
+
+    def _collect_batch(self):
+        """ 첫 샘플을 받은 시점부터 batch_size건이 차거나 flush_interval이 지나면 배치를 반환 """
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop_event.is_set(): break;
+            try: batch.append(self._queue.get(timeout=remaining));
+            except queue.Empty: break;
+        return batch
+
+    def _drain(self):
+        batch = []
+        while len(batch) < self.batch_size:
+            try: batch.append(self._queue.get_nowait());
+            except queue.Empty: break;
+        return batch
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = database.configure_writer_connection(database.get_db_connection())
+        return self._conn
+
+    def _close_connection(self):
+        if self._conn is not None:
+            try: self._conn.close();
+            except Exception: pass;
+        self._conn = None
+
+    def _flush(self, batch):
+        error = None
+        start = time.perf_counter()
+        self._last_flush_ok = False
+        try:
+            database.log_temperatures_to_db(batch, self._connection())
+            metrics.db_batch_seconds.observe(time.perf_counter() - start); metrics.db_batch_size.observe(len(batch))
+            self._last_flush_ok = True
+        except Exception as e:
+            error = e
+            metrics.db_batch_failures_total.inc()
+            self._close_connection() # 다음 배치는 새 연결로 재시도
+            if self.spool is not None:
+                kept = self.spool.append_many([(device_id, ts, temperature) for _, device_id, ts, temperature in batch])
+                self.spool.sync()
+                log.warning(f"DB 기록 실패한 샘플 {kept}/{len(batch)}건을 로컬 스풀에 보관했습니다. (남은 {self.spool.pending()}건)")
+        if self.on_batch_result:
+            device_names = list(dict.fromkeys(sample[0] for sample in batch)) # 순서 유지 중복 제거
+            try: self.on_batch_result(device_names, error);
+            except Exception as e: log.error(f"DB 배치 결과 처리 중 오류: {e}");
+
+temperature_writer = TemperatureWriter()
+metrics.Gauge('tempmon_db_queue_depth', "DB 기록 대기열에 쌓인 샘플 수", temperature_writer.qsize)
+metrics.Gauge('tempmon_spool_pending', "로컬 스풀에 남아 DB로 옮기지 않은 샘플 수", lambda: (lambda spool: spool.pending() if spool else 0)(temperature_writer.spool)) # 종료 중 None으로 바뀌어도 안전하게
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+import logging
+
+import config
+import database
+
+log = logging.getLogger()
+
+class DeviceRegistry:
+    """
+    프로세스 안의 장치 목록 캐시. 처음 접근할 때 DB에서 한 번 읽고, 이름/ID로 색인합니다.
+    장치 추가·수정·삭제 API가 invalidate()를 부르면 다음 접근 때 다시 읽습니다.
+    다른 프로세스(웹 작업자 <-> 폴러)에서 바뀐 것은 DB의 장치 리비전을 REGISTRY_CHECK_INTERVAL초마다 한 번 확인해 반영합니다.
+    반환하는 목록과 dict는 공유 객체이므로 호출한 쪽에서 수정하면 안 됩니다.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._devices = None
+        self._by_name = {}
+        self._by_id = {}
+        self._revision = None
+        self._checked_at = 0.0
+        self.version = 0 # 다시 읽을 때마다 증가 (폴러가 장치 목록 변경을 감지하는 데 사용)
+
+    def _revision_changed(self):
+        """ 확인 간격이 지났으면 DB의 장치 리비전을 읽어 캐시와 비교합니다. """
+        now = time.monotonic()
+        if now - self._checked_at < config.REGISTRY_CHECK_INTERVAL: return False;
+        self._checked_at = now
+        try:
+            return database.get_revision(database.DEVICES_REVISION_KEY) != self._revision
+        except Exception as e:
+            log.warning(f"장치 리비전 확인 실패: {e}"); return False
+
+    def _ensure_loaded(self):
+        devices = self._devices
+        if devices is not None:
+            if not self._revision_changed(): return devices;
+            log.info("다른 프로세스에서 장치 목록이 바뀌어 다시 읽습니다.")
+            self.invalidate()
+        with self._lock:
+            if self._devices is None:
+                self._revision = database.get_revision(database.DEVICES_REVISION_KEY) # 목록보다 먼저 읽어, 그 사이의 변경은 다음 확인 때 잡히도록
+                self._checked_at = time.monotonic()
+                devices = database.get_all_devices()
+                self._by_name = {device['name']: device for device in devices}
+                self._by_id = {device['id']: device for device in devices}
+                self._devices = devices
+                self.version += 1
+                log.info(f"장치 목록 로드: {len(devices)}개 (버전 {self.version})")
+            return self._devices
+
+    def all(self):
+        """ 이름순 장치 목록 """
+        return self._ensure_loaded()
+
+    def get_by_name(self, name):
+        self._ensure_loaded()
+        return self._by_name.get(name)
+
+    def get_by_id(self, device_id):
+        self._ensure_loaded()
+        return self._by_id.get(device_id)
+
+    def invalidate(self):
+        """ 장치 정보가 바뀐 뒤 호출. 다음 접근 때 DB에서 다시 읽습니다. """
+        with self._lock:
+            self._devices = None
+
+registry = DeviceRegistry()
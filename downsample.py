@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+# 차트 조회 간격 후보 (분). 모두 롤업 버킷(1분/1시간/1일)으로 나눠떨어집니다.
+CHART_INTERVALS = [1, 5, 10, 30, 60, 180, 360, 720, 1440]
+OVERSAMPLE = 4 # LTTB가 모양을 고를 여지를 주기 위해 점 예산의 몇 배까지 DB에서 가져올지
+
+def pick_interval_minutes(span_seconds, max_points, oversample=OVERSAMPLE):
+    """ 구간 길이와 점 예산에 맞는 가장 세밀한 조회 간격 (결과 행 수 <= max_points * oversample). LTTB로 더 줄이지 않을 때는 oversample=1 """
+    limit = max_points * oversample
+    for minutes in CHART_INTERVALS:
+        if span_seconds / (minutes * 60) <= limit: return minutes;
+    return CHART_INTERVALS[-1]
+
+def pick_scan_bounded_interval(span_seconds, max_points, rollup_minutes=(1440, 60, 1)):
+    """
+    여러 장치를 공통 축으로 비교할 때의 간격: 점 예산 안에서 가장 세밀하되, 장치마다 읽을 롤업 행 수도
+    max_points * OVERSAMPLE 이하인 간격. (간격을 나눠떨어지게 하는 가장 굵은 롤업을 읽는다고 보고 계산. 일 롤업은 정확히 1일 간격에만)
+    장치 수가 늘어도 장치당 읽는 행 수가 묶여 있으므로 20대 비교가 1대와 비슷한 비용이 됩니다.
+    """
+    minimum = pick_interval_minutes(span_seconds, max_points, oversample=1)
+    for minutes in CHART_INTERVALS:
+        if minutes < minimum: continue;
+        rollup = next(r for r in rollup_minutes if minutes % r == 0 and (r != 1440 or minutes == 1440))
+        if span_seconds / (rollup * 60) <= max_points * OVERSAMPLE: return minutes;
+    return CHART_INTERVALS[-1]
+
+def lttb(points, threshold):
+    """
+    Largest-Triangle-Three-Buckets 다운샘플링.
+    points: x 오름차순 [(x, y), ...]. 처음/마지막 점은 유지하고, 나머지는 threshold - 2개 구간에서
+    이전 선택점·다음 구간 평균점과 가장 큰 삼각형을 이루는 점 하나씩을 골라 피크/골 모양을 보존합니다.
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3: return list(points);
+
+    sampled = [points[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0 # 직전에 고른 점의 위치
+    for i in range(threshold - 2):
+        # 다음 구간의 평균점
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = avg_y = 0.0
+        for x, y in points[next_start:next_end]:
+            avg_x += x; avg_y += y
+        count = next_end - next_start
+        avg_x /= count; avg_y /= count
+
+        # 현재 구간에서 삼각형 넓이가 가장 큰 점
+        range_start = int(i * every) + 1
+        range_end = int((i + 1) * every) + 1
+        ax, ay = points[a]
+        max_area = -1.0; max_index = range_start
+        for j in range(range_start, range_end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > max_area: max_area = area; max_index = j;
+        sampled.append(points[max_index])
+        a = max_index
+    sampled.append(points[-1])
+    return sampled
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+온도 이력 대량 내보내기 (CSV / 열 기반 바이너리). 웹의 /api/export와 명령줄에서 같이 씁니다.
+
+    python export.py --start 2024-01-01 --end 2024-03-31 -o audit.csv              # 모든 장치, CSV
+    python export.py --devices 냉동고1,냉동고2 --start ... --end ... --format columnar -o audit.tmc
+    python export.py --decode audit.tmc > audit.csv                                 # 열 기반 파일을 CSV로 풀기
+
+- DB에서 청크 단위로 읽어 바로 내보내므로 구간 길이와 상관없이 메모리 사용량이 일정하고, 폴러의 쓰기를 막지 않습니다.
+- 원본이 보존 정책으로 지워진 구간은 롤업의 구간 평균으로 채우며, source 열(원천 테이블)로 구분됩니다.
+
+열 기반 형식(.tmc, 리틀 엔디언):
+    머리말  MAGIC (6바이트)
+    블록    <HHIq: 장치명 길이, 원천 길이, 행 수 n, 기준 시각 base_ts> + 장치명(UTF-8) + 원천(UTF-8)
+            + uint32[n] (base_ts로부터의 초) + float32[n] (온도)
+    끝      장치명 길이 0, 원천 길이 0, n = 0 인 블록
+"""
+import argparse
+import csv
+import io
+import os
+import struct
+import sys
+import time
+import logging
+from array import array
+
+import config
+import database
+
+log = logging.getLogger()
+
+MAGIC = b'TMCOL\x01'
+BLOCK_HEADER = struct.Struct('<HHIq')
+CSV_HEADER = ('device', 'timestamp', 'epoch', 'temperature', 'source')
+FORMATS = {'csv': ('text/csv; charset=utf-8', 'csv'), 'columnar': ('application/octet-stream', 'tmc')}
+_U32 = 'I' if array('I').itemsize == 4 else 'L'
+_SWAP = sys.byteorder == 'big' # 파일은 항상 리틀 엔디언
+
+def resolve_devices(names=None):
+    """ 장치명 목록 -> [(id, 이름)]. names가 비어 있으면 모든 장치. 없는 이름이 있으면 ValueError """
+    devices = database.get_all_devices()
+    if not names: return [(device['id'], device['name']) for device in devices];
+    by_name = {device['name']: device['id'] for device in devices}
+    missing = [name for name in names if name not in by_name]
+    if missing: raise ValueError(f"등록되지 않은 장치: {', '.join(missing)}");
+    return [(by_name[name], name) for name in names]
+
+def iter_csv(devices, start_ts, end_ts):
+    """ CSV 본문을 청크(문자열) 단위로 돌려줍니다. 시각은 로컬 시각 문자열과 epoch를 함께 싣습니다. """
+    names = dict(devices)
+    buffer = io.StringIO(); writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(CSV_HEADER)
+    yield buffer.getvalue()
+    for device_id, source, rows in database.iter_export_chunks([device_id for device_id, _ in devices], start_ts, end_ts):
+        buffer.seek(0); buffer.truncate()
+        name = names[device_id]
+        writer.writerows((name, time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts)), ts, round(temperature, 2), source) for ts, temperature in rows)
+        yield buffer.getvalue()
+
+def iter_columnar(devices, start_ts, end_ts):
+    """ 열 기반 바이너리 본문을 청크(블록 하나씩) 단위로 돌려줍니다. """
+    names = dict(devices)
+    yield MAGIC
+    for device_id, source, rows in database.iter_export_chunks([device_id for device_id, _ in devices], start_ts, end_ts):
+        base_ts = rows[0][0]
+        offsets = array(_U32, [ts - base_ts for ts, _ in rows]); temperatures = array('f', [temperature for _, temperature in rows])
+        if _SWAP: offsets.byteswap(); temperatures.byteswap();
+        name = names[device_id].encode('utf-8'); source = source.encode('utf-8')
+        yield BLOCK_HEADER.pack(len(name), len(source), len(rows), base_ts) + name + source + offsets.tobytes() + temperatures.tobytes()
+    yield BLOCK_HEADER.pack(0, 0, 0, 0)
+
+def iter_export(devices, start_ts, end_ts, fmt='csv'):
+    if fmt not in FORMATS: raise ValueError(f"지원하지 않는 형식: {fmt} (csv, columnar)");
+    log.info(f"이력 내보내기: 장치 {len(devices)}개, {time.strftime('%Y-%m-%d', time.localtime(start_ts))}~{time.strftime('%Y-%m-%d', time.localtime(end_ts))}, 형식 {fmt}")
+    return iter_csv(devices, start_ts, end_ts) if fmt == 'csv' else iter_columnar(devices, start_ts, end_ts)
+
+def read_columnar(fp):
+    """ 열 기반 파일을 블록 단위로 읽습니다: (장치명, 원천, [epoch...], [온도...]) """
+    if fp.read(len(MAGIC)) != MAGIC: raise ValueError("열 기반 내보내기 파일이 아닙니다.");
+    while True:
+        header = fp.read(BLOCK_HEADER.size)
+        if len(header) < BLOCK_HEADER.size: raise ValueError("파일이 중간에 잘렸습니다.");
+        name_len, source_len, count, base_ts = BLOCK_HEADER.unpack(header)
+        if count == 0 and name_len == 0: return;
+        name = fp.read(name_len).decode('utf-8'); source = fp.read(source_len).decode('utf-8')
+        offsets = array(_U32); offsets.frombytes(fp.read(count * 4))
+        temperatures = array('f'); temperatures.frombytes(fp.read(count * 4))
+        if _SWAP: offsets.byteswap(); temperatures.byteswap();
+        yield name, source, [base_ts + offset for offset in offsets], temperatures.tolist()
+
+def decode_to_csv(fp, out):
+    """ 열 기반 파일을 CSV로 풉니다. (iter_csv와 같은 열) """
+    writer = csv.writer(out, lineterminator='\n')
+    writer.writerow(CSV_HEADER)
+    for name, source, timestamps, temperatures in read_columnar(fp):
+        writer.writerows((name, time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts)), ts, round(temperature, 2), source) for ts, temperature in zip(timestamps, temperatures))
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+    parser = argparse.ArgumentParser(description="온도 이력 내보내기 (CSV / 열 기반 바이너리)")
+    parser.add_argument('--devices', help="쉼표로 구분한 장치명 (생략하면 모든 장치)")
+    parser.add_argument('--start', help="시작일 YYYY-MM-DD")
+    parser.add_argument('--end', help="종료일 YYYY-MM-DD (포함)")
+    parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+    parser.add_argument('-o', '--output', default='-', help="출력 파일 (기본: 표준 출력)")
+    parser.add_argument('--decode', metavar='FILE', help="열 기반 파일을 CSV로 풀어 출력")
+    args = parser.parse_args()
+
+    if args.decode:
+        with open(args.decode, 'rb') as fp: decode_to_csv(fp, sys.stdout);
+        sys.exit(0)
+    if not args.start or not args.end: parser.error("--start와 --end가 필요합니다.");
+    os.makedirs(os.path.dirname(config.DATABASE), exist_ok=True)
+    database.init_db()
+    try:
+        devices = resolve_devices([name.strip() for name in args.devices.split(',') if name.strip()] if args.devices else None)
+    except ValueError as e:
+        parser.error(str(e))
+    start_ts, end_ts = database.date_range_to_epoch(args.start, args.end)
+    binary = args.format == 'columnar'
+    out = (open(args.output, 'wb' if binary else 'w', encoding=None if binary else 'utf-8', newline=None if binary else '')
+           if args.output != '-' else (sys.stdout.buffer if binary else sys.stdout))
+    try:
+        for chunk in iter_export(devices, start_ts, end_ts, args.format): out.write(chunk);
+    finally:
+        if out not in (sys.stdout, sys.stdout.buffer): out.close();
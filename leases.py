@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+여러 폴러(프로세스/호스트)가 devices 테이블을 나눠 맡도록 하는 DB 임대(lease) 관리.
+
+- 폴러마다 owner 이름(기본: 호스트명:pid)으로 pollers 테이블에 심장 박동을 남기고, 맡은 장치의 임대(device_leases)를
+  LEASE_RENEW_INTERVAL초마다 LEASE_TTL초 뒤로 연장합니다. 폴러가 죽으면 임대가 만료되고 다른 폴러가 가져갑니다.
+- 같은 컨버터(ip:port)의 장치는 RS-485 버스를 공유하므로 버스 단위로 통째로 맡습니다. (두 폴러가 한 버스에 동시에 묻지 않도록)
+- 살아 있는 폴러 수로 장치 수를 나눈 몫만큼 맡고, 새 폴러가 합류하면 많이 맡은 쪽이 버스를 하나씩 내놓아 균형을 맞춥니다.
+- 배정 계산은 BEGIN IMMEDIATE 트랜잭션 하나에서 하므로 폴러끼리 같은 버스를 동시에 가져가지 않습니다.
+  임대 만료는 각 호스트의 시계를 쓰므로 호스트 간 시계는 NTP 등으로 맞춰 두어야 합니다. (TTL보다 충분히 작은 오차)
+"""
+import math
+import os
+import socket
+import threading
+import time
+import logging
+
+import config
+import database
+
+log = logging.getLogger()
+
+def default_owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class LeaseManager:
+    """ 폴러 하나(owner)의 임대. start() 후에는 백그라운드 스레드가 연장/재배정하고, 폴링 스레드는 owned_ids()만 봅니다. """
+    def __init__(self, owner=None, ttl=None, renew_interval=None):
+        self.owner = owner or default_owner()
+        self.ttl = config.LEASE_TTL if ttl is None else ttl
+        self.renew_interval = config.LEASE_RENEW_INTERVAL if renew_interval is None else renew_interval
+        self._owned = frozenset()
+        self._valid_until = 0.0 # 마지막으로 연장에 성공한 임대의 만료 시각 (monotonic 기준)
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event() # request_refresh(): 갱신 주기를 기다리지 않고 바로 재배정
+        self._thread = None
+        self.version = 0 # 맡은 장치 집합이 바뀔 때마다 증가
+
+    @property
+    def active(self):
+        """ start()로 임대 관리를 시작했는지 (시작 전에는 알람/오프라인 전이에 임대 확인을 하지 않음: 벤치마크/단독 도구) """
+        return self._thread is not None
+
+    def owned_ids(self):
+        """ 지금 맡고 있는 장치 id 집합. 연장에 실패한 채 임대가 끝나 가면 빈 집합 (다른 폴러가 가져갔을 수 있음) """
+        if time.monotonic() >= self._valid_until: return frozenset();
+        return self._owned
+
+    def refresh(self, devices=None):
+        """ 심장 박동, 임대 연장, 새 버스 확보/초과분 반납을 한 트랜잭션에서 합니다. 맡은 집합이 바뀌었으면 True """
+        devices = config.load_devices() if devices is None else devices
+        started = time.monotonic(); now = time.time()
+        conn = database.get_write_connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            owned = self._assign(conn, devices, now)
+            conn.commit()
+        except Exception:
+            conn.rollback(); raise
+        self._valid_until = started + self.ttl * 0.8 # 시계 오차와 지연을 감안해 실제 만료보다 먼저 손을 뗌
+        changed = owned != self._owned
+        if changed:
+            gained = len(owned - self._owned); lost = len(self._owned - owned)
+            self._owned = owned; self.version += 1
+            log.info(f"임대 변경 ({self.owner}): {len(owned)}개 장치 담당 (+{gained}, -{lost})")
+        return changed
+
+    def _assign(self, conn, devices, now):
+        conn.execute("INSERT INTO pollers (owner, heartbeat_at, started_at) VALUES (?, ?, ?) ON CONFLICT(owner) DO UPDATE SET heartbeat_at = excluded.heartbeat_at", (self.owner, now, now))
+        conn.execute("DELETE FROM pollers WHERE heartbeat_at < ?", (now - self.ttl * 3,))
+        conn.execute("DELETE FROM device_leases WHERE device_id NOT IN (SELECT id FROM devices)")
+        live = [row['owner'] for row in conn.execute("SELECT owner FROM pollers WHERE heartbeat_at >= ? ORDER BY owner", (now - self.ttl,))]
+        leases = {row['device_id']: row['owner'] for row in conn.execute("SELECT device_id, owner FROM device_leases WHERE expires_at > ?", (now,))}
+
+        buses = {}
+        for device in devices: buses.setdefault((device['ip'], int(device['port'])), []).append(device['id']);
+        # 버스마다 주인은 하나: 장치를 옮겨(ip/port 수정) 한 버스에 여러 폴러의 임대가 섞이면 가장 많이 맡은 폴러(같으면 이름순)가 갖고,
+        # 나머지는 자기 임대를 내놓습니다. 모든 폴러가 같은 규칙으로 고르므로 서로 가져가려 다투지 않습니다.
+        bus_owner = {}
+        for bus, ids in buses.items():
+            held = {}
+            for device_id in ids:
+                if device_id in leases: held[leases[device_id]] = held.get(leases[device_id], 0) + 1;
+            bus_owner[bus] = min(held, key=lambda owner: (-held[owner], owner)) if held else None
+            if self.owner in held and bus_owner[bus] != self.owner:
+                conn.executemany("DELETE FROM device_leases WHERE device_id = ? AND owner = ?", [(device_id, self.owner) for device_id in ids])
+                log.info(f"임대 반납 ({self.owner}): 버스 {bus[0]}:{bus[1]}는 {bus_owner[bus]}가 담당 - 장치가 다른 폴러의 버스로 옮겨짐")
+        counts = {owner: 0 for owner in live}
+        for bus, owner in bus_owner.items():
+            if owner is not None: counts[owner] = counts.get(owner, 0) + len(buses[bus]);
+        target = math.ceil(len(devices) / max(1, len(live)))
+
+        mine = [bus for bus, owner in bus_owner.items() if owner == self.owner]
+        free = sorted(bus for bus, owner in bus_owner.items() if owner is None)
+        count = counts.get(self.owner, 0)
+        for bus in free:
+            if count >= target: break;
+            mine.append(bus); count += len(buses[bus])
+        # 다른 폴러가 몫보다 적게 맡고 있으면, 몫을 넘는 만큼 버스 하나를 내놓음 (한 번에 하나씩: 흔들림 방지)
+        if count > target and any(counts.get(owner, 0) < target for owner in live if owner != self.owner):
+            for bus in sorted(mine, key=lambda bus: len(buses[bus])):
+                if count - len(buses[bus]) >= target: # 내놓아도 몫 이상이 남을 때만 (되찾아 오는 왕복 방지)
+                    mine.remove(bus); count -= len(buses[bus])
+                    conn.executemany("DELETE FROM device_leases WHERE device_id = ? AND owner = ?", [(device_id, self.owner) for device_id in buses[bus]])
+                    log.info(f"임대 반납 ({self.owner}): 버스 {bus[0]}:{bus[1]} ({len(buses[bus])}개 장치) - 균형 맞추기")
+                    break
+        owned = [device_id for bus in mine for device_id in buses[bus]]
+        conn.executemany("""
+            INSERT INTO device_leases (device_id, owner, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT(device_id) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+            WHERE device_leases.owner = excluded.owner OR device_leases.expires_at <= ?
+        """, [(device_id, self.owner, now + self.ttl, now) for device_id in owned])
+        held = {row['device_id'] for row in conn.execute("SELECT device_id FROM device_leases WHERE owner = ? AND expires_at > ?", (self.owner, now))}
+        return frozenset(held)
+
+    def release(self):
+        """ 맡은 임대를 모두 내놓고 폴러 목록에서 빠집니다. (정상 종료 시: 다른 폴러가 TTL을 기다리지 않고 바로 가져감) """
+        self._stop_event.set(); self._wake_event.set()
+        try:
+            with database.get_write_connection() as conn:
+                conn.execute("DELETE FROM device_leases WHERE owner = ?", (self.owner,))
+                conn.execute("DELETE FROM pollers WHERE owner = ?", (self.owner,))
+            log.info(f"임대 모두 반납 ({self.owner})")
+        except Exception as e:
+            log.error(f"임대 반납 실패: {e}")
+        self._owned = frozenset(); self.version += 1
+
+    def request_refresh(self):
+        """ 장치 목록이 바뀌었을 때(버스 이동 등) 다음 갱신 주기를 기다리지 않고 바로 재배정하도록 깨웁니다. """
+        self._wake_event.set()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wake_event.wait(self.renew_interval); self._wake_event.clear()
+            if self._stop_event.is_set(): break;
+            try: self.refresh();
+            except Exception as e: log.error(f"임대 갱신 실패 ({self.owner}): {e}");
+
+    def start(self):
+        """ 처음 배정을 바로 받고, 이후 백그라운드 스레드에서 주기적으로 갱신합니다. """
+        if self._thread and self._thread.is_alive(): return;
+        self._stop_event.clear()
+        try: self.refresh();
+        except Exception as e: log.error(f"임대 첫 배정 실패 ({self.owner}): {e}");
+        self._thread = threading.Thread(target=self._run, name="LeaseThread", daemon=True)
+        self._thread.start()
+        log.info(f"임대 관리 시작: {self.owner} (TTL {self.ttl}초, 갱신 {self.renew_interval}초마다)")
+
+leases = LeaseManager()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import collections
+import json
+import threading
+import logging
+
+import metrics
+
+log = logging.getLogger()
+
+KEEPALIVE_SECONDS = 15 # 변화가 없을 때 연결 유지를 위해 보내는 주석 간격 (프록시의 유휴 연결 종료 방지)
+EVENT_BACKLOG = 256 # 늦게 깨어난 구독자를 위해 보관할 최근 이벤트 수 (이보다 뒤처지면 전체 상태를 다시 보냄)
+
+class StateBroadcaster:
+    """
+    장치 상태를 Server-Sent Events로 구독자에게 밀어주는 단일 생산자-다수 구독자 방송기.
+    폴러가 publish()로 전체 상태를 넘기면 이전과 달라진 장치만 골라 JSON으로 한 번 직렬화하고,
+    구독자(HTTP 응답 스레드)는 Condition에서 잠들어 있다가 새 이벤트 문자열을 그대로 내보냅니다. (구독자 수만큼 다시 계산하지 않음)
+    """
+    def __init__(self, backlog=EVENT_BACKLOG, keepalive=KEEPALIVE_SECONDS):
+        self.keepalive = keepalive
+        self._cond = threading.Condition()
+        self._events = collections.deque(maxlen=backlog) # (순번, SSE 문자열)
+        self._seq = 0
+        self._state = {} # 장치명 -> 마지막으로 보낸 항목
+        self._snapshot = None # 전체 상태 SSE 문자열 (새 구독자용, 변경 시에만 다시 만듦)
+        self.subscribers = 0
+
+    def publish(self, items):
+        """ 전체 장치 상태 목록을 받아 바뀐 장치(changed)와 사라진 장치(removed)만 이벤트로 내보냅니다. 변화가 없으면 아무것도 하지 않습니다. """
+        new_state = {item['device_name']: item for item in items}
+        with self._cond:
+            changed = [item for name, item in new_state.items() if self._state.get(name) != item]
+            removed = [name for name in self._state if name not in new_state]
+            if not changed and not removed: return;
+            self._state = new_state
+            self._snapshot = None
+            self._seq += 1
+            payload = json.dumps({'changed': changed, 'removed': removed}, ensure_ascii=False, separators=(',', ':'))
+            self._events.append((self._seq, f"id: {self._seq}\nevent: update\ndata: {payload}\n\n"))
+            self._cond.notify_all()
+
+    def _snapshot_event(self):
+        """ 현재 전체 상태 이벤트 (cond 안에서 호출) """
+        if self._snapshot is None:
+            payload = json.dumps(list(self._state.values()), ensure_ascii=False, separators=(',', ':'))
+            self._snapshot = f"id: {self._seq}\nevent: snapshot\ndata: {payload}\n\n"
+        return self._snapshot
+
+    def stream(self):
+        """ 구독자 한 명의 SSE 문자열 제너레이터. 처음에 전체 상태를 보내고, 이후에는 변경분만 보냅니다. """
+        with self._cond:
+            self.subscribers += 1
+            last_seq = self._seq
+            first = self._snapshot_event()
+        log.info(f"실시간 스트림 구독 시작 (구독자 {self.subscribers}명)")
+        try:
+            yield "retry: 3000\n" + first
+            while True:
+                with self._cond:
+                    if self._seq == last_seq: self._cond.wait(self.keepalive);
+                    if self._seq == last_seq:
+                        chunks = None
+                    elif not self._events or self._events[0][0] > last_seq + 1:
+                        chunks = [self._snapshot_event()] # 보관분보다 뒤처짐 -> 전체 상태로 따라잡기
+                    else:
+                        chunks = [event for seq, event in self._events if seq > last_seq]
+                    last_seq = self._seq
+                yield "".join(chunks) if chunks else ": keepalive\n\n"
+        finally:
+            with self._cond: self.subscribers -= 1;
+            log.info(f"실시간 스트림 구독 종료 (구독자 {self.subscribers}명)")
+
+broadcaster = StateBroadcaster()
+metrics.Gauge('tempmon_stream_subscribers', "실시간 스트림(SSE) 구독자 수", lambda: broadcaster.subscribers)
@@ -2,16 +2,26 @@
 import logging
 import threading
 import datetime
+import time
 import json
 import os
 from urllib.parse import unquote
 
-from flask import Flask, jsonify, render_template as rt, request
+from flask import Flask, Response, g, jsonify, render_template as rt, request, stream_with_context
 
 import config
 import database
+import export
+import metrics
+from alarm_rules import parse_rules
+from downsample import lttb, pick_interval_minutes, pick_scan_bounded_interval
 from poller import data_polling_thread, initialize_shared_state
-from shared_state import data_lock, alarm_status, current_set_temps, current_temperatures, last_alarm_times
+from retention import retention_thread
+from device_registry import registry
+from notifier import dispatcher
+from live_stream import broadcaster
+from shared_state import attach_segment_reader, get_sample_ring, get_snapshot, publish_snapshot, reads_from_segment, recent_samples
+from state_segment import SegmentDirectoryReader
 
 # --- 1. 로깅 및 Flask 앱 설정 ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - [%(threadName)s] - %(message)s')
@@ -19,55 +29,37 @@ log = logging.getLogger()
 
 app = Flask(__name__)
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    """ 처리기 소요 시간을 엔드포인트(경로 변수 제외)별로 기록합니다. (스트림은 응답 객체를 만든 시점까지) """
+    start = g.get('request_start')
+    if start is not None:
+        metrics.http_request_seconds.observe(time.perf_counter() - start, request.endpoint or 'unknown', request.method, str(response.status_code))
+    return response
+
 # --- 2. 웹 서버 데이터 처리 함수 ---
+def current_snapshot():
+    """ 폴러가 게시한 최신 상태 스냅샷 (잠금 없음). 장치 설정이 바뀐 뒤 아직 반영 전이면 여기서 새로 게시합니다. """
+    snapshot = get_snapshot()
+    if reads_from_segment(): return snapshot; # 웹 작업자: 세그먼트를 합칠 때 장치 목록 변경도 반영함
+    config.load_devices() # 무효화된 레지스트리면 다시 읽어 버전을 올림
+    if snapshot.registry_version != registry.version: snapshot = publish_snapshot();
+    return snapshot
+
 def get_latest_data():
-    """ 대시보드 표시용 최신 데이터 + 알람 상태 + 설정 온도 가져오기 """
-    latest_data = [];
-    try:
-        devices = config.load_devices()
-        with data_lock:
-            for device in devices:
-                device_name = device['name'];
-                is_in_alarm = alarm_status.get(device_name, False);
-                read_set_temp = current_set_temps.get(device_name)
-
-                mem_data = current_temperatures.get(device_name, {'temp': None, 'timestamp': None, 'op_status': None})
-                current_temp_val = mem_data['temp']
-                op_status_val = mem_data['op_status']
-                timestamp_str = mem_data['timestamp']
-
-                set_temp_val = None
-                try:
-                    if read_set_temp is not None: set_temp_val = float(read_set_temp)
-                except (ValueError, TypeError):
-                    log.warning(f"장치 {device_name}: 메모리 설정 온도 값 '{read_set_temp}'를 float으로 변환 실패. None으로 처리합니다.")
-                    set_temp_val = None
-
-                # 상태 결정 로직: 오프라인 > 알람 > 정상 순으로 판단
-                if current_temp_val is None:
-                    status = "오프라인"
-                elif is_in_alarm:
-                    status = "알람"
-                else:
-                    status = "정상"
-
-
-
-                latest_data.append({
-                    "name": device_name,
-                    "temperature": current_temp_val,
-                    "status": status,
-                    "timestamp": timestamp_str,
-                    "device_name": device_name,
-                    "is_alarm": is_in_alarm,
-                    "alarm_threshold": device.get('alarm_threshold'),
-                    "set_temp": set_temp_val,
-                    "op_status": op_status_val
-                });
+    """ 대시보드 표시용 최신 데이터 + 알람 상태 + 설정 온도 가져오기 (읽기 전용 항목들의 튜플) """
+    return current_snapshot().items
 
-    except Exception as e:
-        log.error(f"대시보드 데이터 생성 오류: {e}");
-    return latest_data
+def conditional_json(body, etag):
+    """ 미리 직렬화한 JSON 응답. If-None-Match가 ETag와 같으면 본문 없이 304를 돌려줍니다. """
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache' # 브라우저가 매번 ETag로 재검증하도록
+    return response.make_conditional(request)
 
 # --- 3. Flask 라우트 (웹 페이지 및 API) ---
 @app.route('/')
@@ -80,8 +72,7 @@ def dashboard_home():
 def detail_page(device_name):
     """ 상세 정보 페이지 (그래프 + 이력) """
     device_name = unquote(device_name);
-    all_data = get_latest_data();
-    current_status = next((item for item in all_data if item['device_name'] == device_name), None);
+    current_status = current_snapshot().by_name.get(device_name);
     if not current_status: return "장비 없음", 404;
 
     today = datetime.date.today()
@@ -89,31 +80,24 @@ def detail_page(device_name):
     start_date_str = request.args.get('start_date', seven_days_ago.strftime('%Y-%m-%d'))
     end_date_str = request.args.get('end_date', today.strftime('%Y-%m-%d'))
 
-    try:
-        # 💡 [사용자 요청] 그래프 데이터를 1시간(60분) 간격의 평균으로 가져오도록 수정
-        rows = database.get_historical_data(device_name, start_date_str, end_date_str, interval_minutes=60)
-        history_chart_data = []
-        for row in rows:
-            # temperature 값이 None이 아닐 경우에만 float으로 변환하여 추가
-            if row['temperature'] is not None:
-                history_chart_data.append({"timestamp": row['timestamp'], "temperature": float(row['temperature'])})
+    max_points = max(50, min(request.args.get('points', config.CHART_MAX_POINTS, type=int), 5000))
 
-        history_table_data = []
-        last_added_timestamp = None
-        # 테이블 데이터는 모든 기록을 대상으로 해야 하므로, DB를 한 번 더 조회합니다.
-        table_rows = database.get_historical_data(device_name, start_date_str, end_date_str)
-
-        for row in reversed(table_rows):
-            try:
-                current_timestamp = datetime.datetime.strptime(row['timestamp'], '%Y-%m-%d %H:%M:%S')
-                if last_added_timestamp is None:
-                    history_table_data.append({"timestamp": current_timestamp.strftime('%Y-%m-%d %H:%M:%S'), "temperature": float(row['temperature'])})
-                    last_added_timestamp = current_timestamp
-                elif (last_added_timestamp - current_timestamp).total_seconds() >= 30 * 60:
-                    history_table_data.append({"timestamp": current_timestamp.strftime('%Y-%m-%d %H:%M:%S'), "temperature": float(row['temperature'])})
-                    last_added_timestamp = current_timestamp
-            except (ValueError, TypeError) as e:
-                log.error(f"상세 페이지 테이블 데이터 처리 오류 (row: {row}): {e}"); continue;
+    try:
+        start_ts, end_ts = database.date_range_to_epoch(start_date_str, end_date_str)
+        # 구간 길이와 점 예산에 맞는 간격으로 평균을 가져온 뒤 LTTB로 예산만큼 줄입니다. (1일이든 1년이든 응답 크기 일정)
+        interval_minutes = pick_interval_minutes(end_ts - start_ts, max_points)
+        ring = get_sample_ring(device_name)
+        if ring.covers(start_ts):
+            # 최근 구간(링 버퍼 보관 범위 안)은 DB 없이 메모리에서 그래프와 기록 표(30분 간격)를 만듭니다.
+            series = ring.buckets(start_ts, end_ts, interval_minutes * 60)
+            history_table_data = [{"timestamp": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts)), "temperature": temp} for ts, temp in ring.last_per_bucket(start_ts, end_ts, 30 * 60)]
+        else:
+            rows = database.get_historical_data(device_name, start_date_str, end_date_str, interval_minutes=interval_minutes)
+            series = [(row['bucket_ts'], row['temperature']) for row in rows if row['temperature'] is not None]
+            # 기록 표는 30분 구간마다 마지막 샘플 하나씩, DB에서 솎아낸 결과만 받습니다.
+            history_table_data = [{"timestamp": row['timestamp'], "temperature": float(row['temperature'])} for row in database.get_decimated_history(device_name, start_date_str, end_date_str, step_minutes=30)]
+        # 그래프 데이터: [[epoch 밀리초, 온도], ...] (Chart.js time 축에 바로 사용)
+        history_chart_data = [[ts * 1000, round(temp, 2)] for ts, temp in lttb(series, max_points)]
 
     except Exception as e:
         log.error(f"상세 페이지 데이터 조회 중 오류: {e}")
@@ -122,26 +106,110 @@ def detail_page(device_name):
 
     return rt('detail.html',
         item=current_status,
-        history_chart_data_json=json.dumps(history_chart_data),
+        history_chart_data_json=json.dumps(history_chart_data, separators=(',', ':')),
         history_table_data=history_table_data,
         company_name=config.COMPANY_NAME,
         start_date=start_date_str,
         end_date=end_date_str
     )
 
+@app.route('/metrics')
+def metrics_page():
+    """ Prometheus 수집용 런타임 지표 (텍스트 형식) """
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/api/latest_data')
 def api_latest_data():
-    """ 최신 데이터를 JSON으로 제공하는 API 엔드포인트 """
-    return jsonify(get_latest_data())
+    """ 최신 데이터를 JSON으로 제공하는 API 엔드포인트 (스냅샷 버전이 그대로면 304) """
+    snapshot = current_snapshot()
+    return conditional_json(snapshot.json(), snapshot.etag())
+
+@app.route('/api/stream')
+def api_stream():
+    """ 장치 상태 실시간 스트림 (Server-Sent Events). 처음에 전체 상태(snapshot), 이후 폴러가 갱신할 때마다 바뀐 장치만(update) 보냅니다. """
+    return Response(stream_with_context(broadcaster.stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/sparklines')
+def api_sparklines():
+    """ 대시보드 미니 그래프용 최근 온도 추이 (링 버퍼에서, DB 조회 없음) {장치명: [[epoch, 평균 온도], ...]} """
+    hours = min(request.args.get('hours', 2, type=float), config.RECENT_BUFFER_HOURS)
+    points = max(1, min(request.args.get('points', 60, type=int), 500))
+    start_ts = int(time.time() - hours * 3600)
+    bucket_seconds = max(config.POLL_INTERVAL, int(hours * 3600 / points))
+    devices = config.load_devices()
+    rings = {device['name']: recent_samples.get(device['name']) for device in devices}
+    result = {name: [[ts, round(avg, 2)] for ts, avg in ring.buckets(start_ts, None, bucket_seconds)] for name, ring in rings.items() if ring is not None and ring.covers(start_ts)}
+    uncovered = [device for device in devices if device['name'] not in result]
+    if uncovered:
+        # 링 버퍼가 없는 경우(폴러와 분리된 웹 작업자 등): 한 번의 그룹 쿼리로 DB에서 (분 단위 간격)
+        timestamps, series, _ = database.get_comparison_data([device['id'] for device in uncovered], start_ts, int(time.time()), max(1, bucket_seconds // 60))
+        for device in uncovered:
+            result[device['name']] = [[ts, round(value, 2)] for ts, value in zip(timestamps, series[device['id']]) if value is not None]
+    return jsonify(result)
 
 @app.route('/api/device_data/<device_name>')
 def api_device_data(device_name):
     """ 개별 장비의 현재 상태를 실시간으로 반환하는 API """
     device_name = unquote(device_name)
-    item = next((x for x in get_latest_data() if x['device_name'] == device_name), None)
-    if not item:
+    snapshot = current_snapshot()
+    if device_name not in snapshot.by_name:
         return jsonify({"error": "device not found or no data"}), 404
-    return jsonify(item)
+    return conditional_json(snapshot.device_json(device_name), snapshot.etag(device_name))
+
+@app.route('/api/export')
+def api_export():
+    """
+    온도 이력 대량 내보내기. ?devices=이름1,이름2(생략 시 전체)&start_date=YYYY-MM-DD&end_date=YYYY-MM-DD&format=csv|columnar
+    DB에서 청크 단위로 읽어 바로 흘려보내므로 구간이 길어도 메모리 사용량이 일정합니다.
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in export.FORMATS:
+        return jsonify({"success": False, "message": f"지원하지 않는 형식: {fmt} (csv, columnar)"}), 400
+    names = [name.strip() for name in request.args.get('devices', '').split(',') if name.strip()]
+    today = datetime.date.today().strftime('%Y-%m-%d')
+    start_date_str = request.args.get('start_date', today); end_date_str = request.args.get('end_date', today)
+    try:
+        start_ts, end_ts = database.date_range_to_epoch(start_date_str, end_date_str)
+    except ValueError:
+        return jsonify({"success": False, "message": "날짜는 YYYY-MM-DD 형식이어야 합니다."}), 400
+    try:
+        devices = export.resolve_devices(names)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 404
+    mimetype, extension = export.FORMATS[fmt]
+    filename = f"temperatures_{start_date_str}_{end_date_str}.{extension}"
+    return Response(stream_with_context(export.iter_export(devices, start_ts, end_ts, fmt)), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/compare')
+def api_compare():
+    """
+    여러 장치 온도 비교. ?devices=이름1,이름2&start_date=YYYY-MM-DD&end_date=YYYY-MM-DD[&interval=분 | &points=최대 점 수]
+    한 번의 그룹 쿼리로 읽어, 공통 시각 축(timestamps, epoch 초) 하나와 장치별 평균 온도 배열(series)로 돌려줍니다. (데이터 없는 구간은 null)
+    """
+    names = [name.strip() for name in request.args.get('devices', '').split(',') if name.strip()]
+    if not names:
+        return jsonify({"success": False, "message": "devices에 비교할 장치명을 쉼표로 구분해 지정해주세요."}), 400
+    today = datetime.date.today()
+    start_date_str = request.args.get('start_date', (today - datetime.timedelta(days=1)).strftime('%Y-%m-%d'))
+    end_date_str = request.args.get('end_date', today.strftime('%Y-%m-%d'))
+    try:
+        start_ts, end_ts = database.date_range_to_epoch(start_date_str, end_date_str)
+    except ValueError:
+        return jsonify({"success": False, "message": "날짜는 YYYY-MM-DD 형식이어야 합니다."}), 400
+    by_name = {device['name']: device['id'] for device in config.load_devices()}
+    missing = [name for name in names if name not in by_name]
+    if missing:
+        return jsonify({"success": False, "message": f"등록되지 않은 장치: {', '.join(missing)}"}), 404
+    interval_minutes = request.args.get('interval', type=int)
+    if not interval_minutes or interval_minutes < 1:
+        max_points = max(50, min(request.args.get('points', config.CHART_MAX_POINTS, type=int), 5000))
+        interval_minutes = pick_scan_bounded_interval(end_ts - start_ts, max_points) # 공통 축을 유지해야 하므로 LTTB 없이 간격만으로 맞춤
+    timestamps, series, source = database.get_comparison_data([by_name[name] for name in names], start_ts, end_ts, interval_minutes)
+    body = {"interval": interval_minutes, "source": source, "timestamps": timestamps,
+            "series": {name: [round(value, 2) if value is not None else None for value in series[by_name[name]]] for name in names}}
+    return Response(json.dumps(body, ensure_ascii=False, separators=(',', ':')), mimetype='application/json')
 
 @app.route('/settings')
 def settings_page():
@@ -151,6 +219,7 @@ def settings_page():
     return rt('settings.html',
               devices=devices,
               pushover_config=pushover_config,
+              poll_interval=config.POLL_INTERVAL,
               company_name=config.COMPANY_NAME)
 
 @app.route('/api/devices', methods=['POST'])
@@ -165,8 +234,16 @@ def add_device_api():
     if not controller_id or len(str(controller_id)) != 2:
         return jsonify({"success": False, "message": "컨트롤러 ID는 필수이며, 두 자리로 입력해야 합니다. (예: 01, 07, 15)"}), 400
 
+    # 알람 규칙 JSON 검사 (비우면 임계값 + 기본 히스테리시스)
+    alarm_rules = (data.get('alarm_rules') or '').strip() or None
+    try:
+        parse_rules(alarm_rules)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
     try:
-        database.add_device(data['name'], data['ip'], int(data['port']), data['controller_id'], float(data['alarm_threshold']) if data.get('alarm_threshold') else None, data.get('memo'))
+        database.add_device(data['name'], data['ip'], int(data['port']), data['controller_id'], float(data['alarm_threshold']) if data.get('alarm_threshold') else None, data.get('memo'), int(data['poll_interval']) if data.get('poll_interval') else None, alarm_rules)
+        registry.invalidate() # 폴러와 API가 다음 접근 때 새 장치 목록을 사용
         return jsonify({"success": True, "message": "장치가 추가되었습니다."})
     except Exception as e:
         log.error(f"장치 추가 API 오류: {e}")
@@ -184,8 +261,16 @@ def update_device_api(device_id):
     if not controller_id or len(str(controller_id)) != 2:
         return jsonify({"success": False, "message": "컨트롤러 ID는 필수이며, 두 자리로 입력해야 합니다. (예: 01, 07, 15)"}), 400
 
+    # 알람 규칙 JSON 검사 (비우면 임계값 + 기본 히스테리시스)
+    alarm_rules = (data.get('alarm_rules') or '').strip() or None
     try:
-        database.update_device(device_id, data['name'], data['ip'], int(data['port']), data['controller_id'], float(data['alarm_threshold']) if data.get('alarm_threshold') else None, data.get('memo'))
+        parse_rules(alarm_rules)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    try:
+        database.update_device(device_id, data['name'], data['ip'], int(data['port']), data['controller_id'], float(data['alarm_threshold']) if data.get('alarm_threshold') else None, data.get('memo'), int(data['poll_interval']) if data.get('poll_interval') else None, alarm_rules)
+        registry.invalidate() # 폴러와 API가 다음 접근 때 새 장치 목록을 사용
         return jsonify({"success": True, "message": "장치 정보가 수정되었습니다."})
     except Exception as e:
         log.error(f"장치 수정 API 오류: {e}")
@@ -195,6 +280,7 @@ def update_device_api(device_id):
 def delete_device_api(device_id):
     try:
         database.delete_device(device_id)
+        registry.invalidate() # 폴러와 API가 다음 접근 때 새 장치 목록을 사용
         return jsonify({"success": True, "message": "장치가 삭제되었습니다."})
     except Exception as e:
         log.error(f"장치 삭제 API 오류: {e}")
@@ -211,12 +297,25 @@ def update_pushover_settings_api():
         
         database.update_setting('pushover_api_token', api_token)
         database.update_setting('pushover_user_keys', json.dumps(user_keys_list))
+        dispatcher.invalidate_config() # 발송 스레드가 다음 알림부터 새 설정을 사용
         
         return jsonify({"success": True, "message": "Pushover 설정이 저장되었습니다."})
     except Exception as e:
         log.error(f"Pushover 설정 저장 API 오류: {e}")
         return jsonify({"success": False, "message": str(e)}), 500
 
+@app.route('/api/notifications/metrics')
+def api_notification_metrics():
+    """ 알림 발송 대기열 깊이, 발송/실패/재시도 건수, 전달 지연(초) """
+    if reads_from_segment(): # 폴러/웹 분리 실행: 알림은 폴러 프로세스가 보내므로 작업자의 발송기는 늘 비어 있음
+        return jsonify({"success": False, "message": f"알림은 폴러 프로세스에서 발송합니다. 폴러의 :{config.POLLER_METRICS_PORT}/api/notifications/metrics (폴러마다 --metrics-port)에서 확인하세요."}), 404
+    return jsonify(dispatcher.metrics())
+
+@app.route('/api/db/connections')
+def api_db_connections():
+    """ DB 연결 재사용 현황 (읽기 전용 ro / 읽기·쓰기 rw 별 새로 연 횟수, 재사용 횟수, 풀 반납 수, 재사용률) """
+    return jsonify(database.connections.stats())
+
 @app.route('/api/test_connection', methods=['POST'])
 def test_connection_api():
     """ 장치와의 통신을 테스트하는 API """
@@ -237,6 +336,26 @@ def test_connection_api():
         return jsonify({"success": False, "message": "장치에서 응답이 없습니다."}), 500
 
 # --- 4. 서버 실행 ---
+def state_follower_thread():
+    """ (웹 작업자) 상태 세그먼트가 바뀔 때마다 이 프로세스의 실시간 스트림 구독자에게 전달합니다. """
+    last = None
+    while True:
+        try:
+            snapshot = get_snapshot()
+            if snapshot is not last: broadcaster.publish(snapshot.items); last = snapshot;
+        except Exception as e:
+            log.error(f"상태 세그먼트 따라가기 오류: {e}")
+        time.sleep(config.STATE_FOLLOW_INTERVAL)
+
+def start_web_worker():
+    """
+    폴러와 분리된 웹 작업자 프로세스 초기화 (wsgi.py에서 호출).
+    폴러/보존 정책 스레드는 띄우지 않고, 실시간 상태는 poller_service.py 프로세스들이 쓰는 폴러별 상태 세그먼트를 합쳐 읽습니다.
+    """
+    attach_segment_reader(SegmentDirectoryReader(config.STATE_SEGMENT_PATH))
+    threading.Thread(target=state_follower_thread, name="StateFollowerThread", daemon=True).start()
+    log.info(f"웹 작업자 시작 (pid {os.getpid()}, 상태 세그먼트: {config.STATE_SEGMENT_PATH})")
+
 if __name__ == '__main__':
     os.makedirs(os.path.dirname(config.DATABASE), exist_ok=True)
     database.init_db();
@@ -244,6 +363,7 @@ if __name__ == '__main__':
     
     poller = threading.Thread(target=data_polling_thread, name="PollerThread", daemon=True);
     poller.start();
+    threading.Thread(target=retention_thread, name="RetentionThread", daemon=True).start()
     
     log.info(f"Flask 서버 시작 (http://0.0.0.0:5000)");
     app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False);
\ No newline at end of file
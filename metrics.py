@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+가벼운 런타임 지표 수집기 (Prometheus 텍스트 형식으로 내보냄).
+기록은 스레드마다 따로 가진 저장소(shard)에만 하므로 폴링 경로에서 잠금을 잡지 않습니다.
+/metrics 요청 때 모든 shard를 합산하며, 끝난 스레드(HTTP 요청 스레드 등)의 shard는 그때 공용 누적값으로 접어 넣습니다.
+"""
+import bisect
+import threading
+
+_local = threading.local()
+_shards = [] # [(스레드, shard)]
+_retired = {} # 끝난 스레드의 누적값
+_shards_lock = threading.Lock() # shard 등록/접기/합산에만 사용 (기록 경로에서는 쓰지 않음)
+_metrics = [] # 등록 순서대로 (출력 순서)
+_FOLD_EVERY = 256 # 새 shard를 이만큼 등록할 때마다 끝난 스레드의 shard를 접음
+_registered_since_fold = 0
+
+def _shard():
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        global _registered_since_fold
+        shard = _local.shard = {}
+        with _shards_lock:
+            _shards.append((threading.current_thread(), shard))
+            _registered_since_fold += 1
+            if _registered_since_fold >= _FOLD_EVERY: _fold_dead_locked();
+    return shard
+
+def _merge(target, key, value):
+    if isinstance(value, list):
+        current = target.get(key)
+        if current is None: target[key] = list(value);
+        else:
+            for i, v in enumerate(value): current[i] += v;
+    else:
+        target[key] = target.get(key, 0) + value
+
+def _fold_dead_locked():
+    """ 끝난 스레드의 shard를 _retired로 합치고 목록에서 뺍니다. (_shards_lock 안에서 호출) """
+    global _registered_since_fold
+    alive = []
+    for thread, shard in _shards:
+        if thread.is_alive(): alive.append((thread, shard)); continue;
+        for key, value in list(shard.items()): _merge(_retired, key, value);
+    _shards[:] = alive
+    _registered_since_fold = 0
+
+def _collect():
+    """ 모든 shard의 합계 {(지표, 라벨값): 값} """
+    with _shards_lock:
+        _fold_dead_locked()
+        total = {}
+        for key, value in _retired.items(): _merge(total, key, value);
+        for _, shard in _shards:
+            for key, value in list(shard.items()): _merge(total, key, value);
+    return total
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=None):
+    pairs = ['%s="%s"' % (n, _escape(v)) for n, v in zip(names, values)]
+    if extra: pairs.append(extra);
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value):
+    if value == float('inf'): return '+Inf';
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """ 단조 증가 카운터. inc(라벨값..., amount=1) """
+    kind = 'counter'
+    def __init__(self, name, help_text, labels=()):
+        self.name = name; self.help = help_text; self.labels = tuple(labels)
+        _metrics.append(self)
+
+    def inc(self, *label_values, amount=1):
+        shard = _shard(); key = (self, label_values)
+        shard[key] = shard.get(key, 0) + amount
+
+    def values(self):
+        """ 현재 합계 {라벨값 튜플: 값} (모든 스레드 합산) """
+        return {label_values: value for (metric, label_values), value in _collect().items() if metric is self}
+
+    def render(self, total):
+        lines = []
+        for (metric, label_values), value in sorted(((k, v) for k, v in total.items() if k[0] is self), key=lambda kv: kv[0][1]):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    """ 누적 버킷 히스토그램. observe(값, 라벨값...) """
+    kind = 'histogram'
+    def __init__(self, name, help_text, buckets, labels=()):
+        self.name = name; self.help = help_text; self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        _metrics.append(self)
+
+    def observe(self, value, *label_values):
+        shard = _shard(); key = (self, label_values)
+        counts = shard.get(key)
+        if counts is None: counts = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]; # 버킷별 개수 + (+Inf) + 합계
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def render(self, total):
+        lines = []
+        for (metric, label_values), counts in sorted(((k, v) for k, v in total.items() if k[0] is self), key=lambda kv: kv[0][1]):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="%s"' % _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, label_values)} {_format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, label_values)} {cumulative}")
+        return lines
+
+class Gauge:
+    """ 내보낼 때 함수를 불러 값을 읽는 게이지 (대기열 깊이 등) """
+    kind = 'gauge'
+    def __init__(self, name, help_text, read):
+        self.name = name; self.help = help_text; self.read = read
+        _metrics.append(self)
+
+    def render(self, total):
+        try: return [f"{self.name} {_format_value(self.read())}"];
+        except Exception: return [];
+
+def render():
+    """ 등록된 모든 지표를 Prometheus 텍스트 형식(0.0.4)으로 """
+    total = _collect()
+    lines = []
+    for metric in list(_metrics):
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render(total))
+    return '\n'.join(lines) + '\n'
+
+# --- 지표 정의 (모듈마다 필요한 것을 가져다 씀) ---
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+poll_cycle_seconds = Histogram('tempmon_poll_cycle_seconds', "폴링 한 주기 소요 시간", (0.5, 1, 2, 5, 10, 20, 30, 60))
+device_rtt_seconds = Histogram('tempmon_device_rtt_seconds', "컨트롤러 명령 왕복 시간 (응답을 받은 경우)", LATENCY_BUCKETS, ('bus', 'controller', 'command'))
+device_timeouts_total = Counter('tempmon_device_timeouts_total', "응답 timeout 횟수", ('bus', 'controller', 'command'))
+device_errors_total = Counter('tempmon_device_errors_total', "연결 거부/소켓 오류 횟수", ('bus', 'controller', 'command', 'kind'))
+frame_errors_total = Counter('tempmon_frame_errors_total', "응답 프레임 오류 횟수 (bcc: BCC 불일치, sensor: 센서 오픈/쇼트, malformed: 그 밖의 형식 오류)", ('controller', 'command', 'kind'))
+alarm_evaluation_seconds = Histogram('tempmon_alarm_evaluation_seconds', "주기 끝 알람 규칙 일괄 판정 소요 시간 (상태 전이/알림 접수 포함)", (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5))
+db_batch_seconds = Histogram('tempmon_db_batch_seconds', "DB 일괄 삽입 소요 시간", (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+db_batch_size = Histogram('tempmon_db_batch_size', "DB 일괄 삽입 건수", (1, 5, 10, 25, 50, 100, 200, 500))
+db_connections_total = Counter('tempmon_db_connections_total', "DB 연결 관리 이벤트 (opened: 새로 엶, reused: 재사용, pooled: 스레드 종료 후 풀에 반납, closed: 닫음)", ('mode', 'event'))
+db_batch_failures_total = Counter('tempmon_db_batch_failures_total', "DB 일괄 삽입 실패 횟수")
+notification_send_seconds = Histogram('tempmon_notification_send_seconds', "Pushover API 요청 한 번의 소요 시간", LATENCY_BUCKETS, ('outcome',))
+notification_delivery_seconds = Histogram('tempmon_notification_delivery_seconds', "알림 접수부터 전달 완료까지 걸린 시간 (묶음 대기, 재시도 포함)", (0.5, 1, 2, 5, 10, 30, 60, 300))
+http_request_seconds = Histogram('tempmon_http_request_seconds', "HTTP 처리기 소요 시간", LATENCY_BUCKETS, ('endpoint', 'method', 'status'))
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+구 스키마 temp_logs(TEXT timestamp, device_name) 이력을 새 temp_logs(device_id, INTEGER epoch)로 옮기는 온라인 마이그레이션 도구.
+
+    python migrate.py [--chunk 5000] [--pause 0.05] [--drop-legacy]
+
+- 서버(폴러)가 실행 중이어도 됩니다. 청크마다 짧은 트랜잭션으로 커밋하고 잠시 쉬어 폴러의 쓰기를 막지 않습니다.
+- 최신 기록부터 거꾸로 옮기므로, 상세 페이지의 최근 이력이 가장 먼저 보입니다.
+- 진행 위치는 settings 테이블에 저장되어, 중단 후 다시 실행하면 이어서 진행합니다.
+- devices 테이블에 없는(삭제된) 장치의 기록은 옮기지 않고 구 테이블에 남겨 둡니다.
+"""
+import argparse
+import logging
+import os
+import time
+
+import config
+import database
+
+log = logging.getLogger()
+
+CHECKPOINT_KEY = 'legacy_migration_low_id' # 여기까지(이 id 이상) 옮김 완료
+
+def legacy_table_exists(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (config.LEGACY_TABLE_NAME,)).fetchone() is not None
+
+def get_checkpoint(conn):
+    row = conn.execute("SELECT value FROM settings WHERE key=?", (CHECKPOINT_KEY,)).fetchone()
+    return int(row['value']) if row else None
+
+def migrate_chunk(conn, low_id, high_id):
+    """ 구 테이블의 id 범위 [low_id, high_id) 를 한 트랜잭션으로 옮기고 체크포인트를 함께 커밋합니다. """
+    with conn:
+        cur = conn.execute(f"""
+            INSERT OR IGNORE INTO {config.TABLE_NAME} (device_id, ts, temperature)
+            SELECT d.id, CAST(strftime('%s', l.timestamp, 'utc') AS INTEGER), l.temperature
+            FROM {config.LEGACY_TABLE_NAME} l JOIN devices d ON d.name = l.device_name
+            WHERE l.id >= ? AND l.id < ? AND l.temperature IS NOT NULL
+        """, (low_id, high_id))
+        conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (CHECKPOINT_KEY, str(low_id)))
+    return cur.rowcount
+
+def run_migration(chunk_size=5000, pause=0.05, drop_legacy=False):
+    conn = database.configure_writer_connection(database.get_db_connection())
+    try:
+        if not legacy_table_exists(conn):
+            log.info(f"{config.LEGACY_TABLE_NAME} 테이블이 없습니다. 옮길 이력이 없습니다."); return;
+
+        bounds = conn.execute(f"SELECT MIN(id), MAX(id), COUNT(*) FROM {config.LEGACY_TABLE_NAME}").fetchone()
+        min_id, max_id, total = bounds[0], bounds[1], bounds[2]
+        if not total:
+            log.info("구 테이블이 비어 있습니다.")
+        else:
+            checkpoint = get_checkpoint(conn)
+            high_id = checkpoint if checkpoint is not None else max_id + 1
+            if checkpoint is not None: log.info(f"체크포인트(id {checkpoint})부터 이어서 진행합니다.");
+            migrated = 0; start_time = time.time()
+            while high_id > min_id:
+                low_id = max(min_id, high_id - chunk_size)
+                migrated += migrate_chunk(conn, low_id, high_id)
+                done = max_id + 1 - low_id
+                log.info(f"마이그레이션 진행: id {low_id}~{high_id - 1} 완료 ({done}/{max_id - min_id + 1} 범위, 누적 {migrated}건, {time.time() - start_time:.1f}초)")
+                high_id = low_id
+                time.sleep(pause) # 폴러의 쓰기 트랜잭션이 끼어들 틈을 줌
+            log.info(f"마이그레이션 완료: {migrated}건 이동")
+
+        orphans = conn.execute(f"SELECT l.device_name, COUNT(*) AS cnt FROM {config.LEGACY_TABLE_NAME} l LEFT JOIN devices d ON d.name = l.device_name WHERE d.id IS NULL GROUP BY l.device_name").fetchall()
+        for row in orphans:
+            log.warning(f"등록되지 않은 장치 '{row['device_name']}'의 기록 {row['cnt']}건은 옮기지 않았습니다.")
+
+        if drop_legacy:
+            if orphans:
+                log.warning(f"옮기지 못한 기록이 있어 {config.LEGACY_TABLE_NAME} 테이블을 삭제하지 않습니다.")
+            else:
+                with conn:
+                    conn.execute(f"DROP TABLE {config.LEGACY_TABLE_NAME}")
+                    conn.execute("DELETE FROM settings WHERE key=?", (CHECKPOINT_KEY,))
+                log.info(f"{config.LEGACY_TABLE_NAME} 테이블을 삭제했습니다. (파일 크기를 줄이려면 서버 정지 후 VACUUM)")
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="temp_logs 구 스키마 -> 새 스키마 온라인 마이그레이션")
+    parser.add_argument('--chunk', type=int, default=5000, help="한 트랜잭션에 옮길 구 테이블 id 범위 (기본 5000)")
+    parser.add_argument('--pause', type=float, default=0.05, help="청크 사이 대기 시간(초) (기본 0.05)")
+    parser.add_argument('--drop-legacy', action='store_true', help="완료 후 구 테이블 삭제")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(config.DATABASE), exist_ok=True)
+    database.init_db() # 구 테이블 이름 변경 + 새 테이블 생성
+    run_migration(args.chunk, args.pause, args.drop_legacy)
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+import heapq
+import queue
+import random
+import threading
+import time
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import config
+import database
+import metrics
+
+log = logging.getLogger()
+
+PUSHOVER_MESSAGE_LIMIT = 1024 # Pushover 메시지 최대 길이
+
+class NotificationDispatcher:
+    """
+    Pushover 알림 전송을 폴링 루프에서 분리한 백그라운드 발송기.
+    - notify()는 대기열에 넣기만 하고 바로 반환합니다.
+    - 첫 알림 뒤 coalesce_window초 동안 들어온 알림은 수신자별로 한 건으로 합쳐 보냅니다. (여러 장치가 한꺼번에 알람일 때)
+    - 네트워크 오류/5xx/429는 지수 백오프(+지터)로 재시도하고, 연결은 Session으로 재사용합니다.
+    - Pushover 설정은 캐시하며, 설정 저장 API가 invalidate_config()로 갱신합니다. (다른 프로세스에서 저장한 것은 DB의 설정 리비전으로 감지)
+    """
+    def __init__(self, api_url=None, coalesce_window=None, max_retries=None, backoff_base=None, timeout=10, config_loader=None):
+        self.api_url = api_url or config.PUSHOVER_API_URL
+        self.coalesce_window = config.NOTIFY_COALESCE_SECONDS if coalesce_window is None else coalesce_window
+        self.max_retries = config.NOTIFY_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = config.NOTIFY_BACKOFF_BASE if backoff_base is None else backoff_base
+        self.timeout = timeout
+        self._config_loader = config_loader or config.load_pushover_config
+        self._pushover_config = None
+        self._config_revision = None
+        self._config_warning_sent = False
+        self._queue = queue.Queue()
+        self._retries = [] # (재시도 시각, 순번, 수신자, payload, 시도 횟수, 최초 접수 시각) 힙
+        self._retry_seq = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._session = requests.Session()
+        self._session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self._session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self._metrics_lock = threading.Lock()
+        self._metrics = {'enqueued': 0, 'sent': 0, 'failed': 0, 'retried': 0, 'coalesced': 0,
+                         'latency_count': 0, 'latency_sum': 0.0, 'latency_max': 0.0, 'latency_last': None}
+
+    # --- 공개 API ---
+    def notify(self, title, message, priority=0):
+        """ 알림을 대기열에 넣습니다. (블로킹 없음) """
+        self._queue.put((time.monotonic(), title, message, priority))
+        with self._metrics_lock: self._metrics['enqueued'] += 1;
+
+    def invalidate_config(self):
+        """ Pushover 설정이 바뀐 뒤 호출. 다음 발송 때 DB에서 다시 읽습니다. """
+        self._pushover_config = None
+        self._config_warning_sent = False
+
+    def metrics(self):
+        """ 대기열 깊이, 재시도 대기 수, 발송/실패 건수, 전달 지연(접수~전달 완료, 초) 통계 """
+        with self._metrics_lock:
+            m = dict(self._metrics)
+        m['queue_depth'] = self._queue.qsize()
+        m['retry_pending'] = len(self._retries)
+        m['latency_avg'] = m['latency_sum'] / m['latency_count'] if m['latency_count'] else None
+        return m
+
+    def start(self):
+        if self._thread and self._thread.is_alive(): return;
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="NotifierThread", daemon=True)
+        self._thread.start()
+        log.info(f"알림 발송 스레드 시작 (묶음 대기 {self.coalesce_window}초, 재시도 최대 {self.max_retries}회)")
+
+    def stop(self, timeout=5.0):
+        self._stop_event.set()
+        if self._thread: self._thread.join(timeout);
+
+    # --- 내부 동작 ---
+    def _load_config(self):
+        try:
+            revision = database.get_revision(database.SETTINGS_REVISION_KEY)
+        except Exception:
+            revision = self._config_revision
+        if revision != self._config_revision: self.invalidate_config(); # 웹 작업자 프로세스에서 설정을 저장한 경우
+        if self._pushover_config is None:
+            self._pushover_config = self._config_loader(); self._config_revision = revision
+        return self._pushover_config
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            wait = 1.0
+            if self._retries: wait = max(0.0, min(wait, self._retries[0][0] - time.monotonic()));
+            try:
+                batch = [self._queue.get(timeout=wait)]
+            except queue.Empty:
+                batch = []
+            if batch:
+                deadline = time.monotonic() + self.coalesce_window
+                while not self._stop_event.is_set():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0: break;
+                    try: batch.append(self._queue.get(timeout=remaining));
+                    except queue.Empty: break;
+                try: self._dispatch(batch);
+                except Exception as e: log.error(f"알림 발송 처리 중 오류: {e}");
+            self._process_due_retries()
+
+    def _dispatch(self, batch):
+        pushover_config = self._load_config()
+        api_token = pushover_config.get('api_token')
+        user_keys = pushover_config.get('user_keys', [])
+        if not api_token or not user_keys or api_token == 'YOUR_API_TOKEN_HERE':
+            if not self._config_warning_sent:
+                log.warning("Pushover 설정(API 토큰 또는 사용자 키)이 비어있어 알림을 보내지 않습니다. 설정 페이지에서 구성해주세요.")
+                self._config_warning_sent = True # 경고는 한 번만 보냅니다.
+            else:
+                log.debug("Pushover 설정이 없어 알림을 건너뜁니다.") # 이후에는 디버그 레벨로 조용히 처리
+            return
+
+        title, message, priority = self._coalesce(batch)
+        if len(batch) > 1:
+            with self._metrics_lock: self._metrics['coalesced'] += len(batch) - 1;
+            log.info(f"알림 {len(batch)}건을 한 건으로 묶어 전송합니다.")
+        enqueued_at = min(item[0] for item in batch)
+        for user_key in user_keys:
+            payload = {"token": api_token, "user": user_key, "title": title, "message": message, "priority": priority}
+            self._attempt(user_key, payload, 0, enqueued_at)
+
+    def _coalesce(self, batch):
+        """ 여러 알림을 (제목, 메시지, 우선순위) 하나로 합칩니다. 우선순위는 가장 높은 것을 따릅니다. """
+        if len(batch) == 1:
+            _, title, message, priority = batch[0]
+            return title, message, priority
+        title = f"{batch[0][1]} 외 {len(batch) - 1}건"
+        message = "\n".join(f"• {item[1]}: {item[2]}" for item in batch)
+        if len(message) > PUSHOVER_MESSAGE_LIMIT: message = message[:PUSHOVER_MESSAGE_LIMIT - 1] + "…";
+        return title, message, max(item[3] for item in batch)
+
+    def _attempt(self, user_key, payload, attempt, enqueued_at):
+        start = time.monotonic()
+        try:
+            response = self._session.post(self.api_url, data=payload, timeout=self.timeout)
+            if response.status_code == 429 or response.status_code >= 500:
+                raise requests.exceptions.HTTPError(f"{response.status_code} 서버 응답", response=response)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            status = e.response.status_code if e.response is not None else None
+            retryable = status is None or status == 429 or status >= 500
+            metrics.notification_send_seconds.observe(time.monotonic() - start, 'error')
+            if retryable and attempt < self.max_retries:
+                delay = self.backoff_base * (2 ** attempt) * (0.5 + random.random()) # 지수 백오프 + 지터
+                log.warning(f"Pushover 알림 전송 실패 ({user_key}): {e} - {delay:.1f}초 후 재시도 ({attempt + 1}/{self.max_retries})")
+                self._retry_seq += 1
+                heapq.heappush(self._retries, (time.monotonic() + delay, self._retry_seq, user_key, payload, attempt + 1, enqueued_at))
+                with self._metrics_lock: self._metrics['retried'] += 1;
+            else:
+                log.error(f"Pushover 알림 전송 실패 ({user_key}): {e}")
+                with self._metrics_lock: self._metrics['failed'] += 1;
+            return
+        metrics.notification_send_seconds.observe(time.monotonic() - start, 'ok')
+        latency = time.monotonic() - enqueued_at
+        metrics.notification_delivery_seconds.observe(latency)
+        log.info(f"Pushover 알림 전송 성공: {user_key}에게 '{payload['title']}' 전송 (지연 {latency:.1f}초)")
+        with self._metrics_lock:
+            m = self._metrics
+            m['sent'] += 1; m['latency_count'] += 1; m['latency_sum'] += latency
+            m['latency_max'] = max(m['latency_max'], latency); m['latency_last'] = latency
+
+    def _process_due_retries(self):
+        now = time.monotonic()
+        while self._retries and self._retries[0][0] <= now:
+            _, _, user_key, payload, attempt, enqueued_at = heapq.heappop(self._retries)
+            self._attempt(user_key, payload, attempt, enqueued_at)
+
+dispatcher = NotificationDispatcher()
+metrics.Gauge('tempmon_notification_queue_depth', "발송 대기 중인 알림 수 (재시도 대기 포함)", lambda: dispatcher._queue.qsize() + len(dispatcher._retries))
@@ -2,149 +2,232 @@
 import time
 import datetime
 import logging
-import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import config
+import metrics
 import protocol
 import database
-from shared_state import data_lock, alarm_status, last_alarm_times, comm_fail_status, comm_fail_counters, current_set_temps, current_temperatures, initialize_shared_state
+from db_writer import temperature_writer
+from notifier import dispatcher
+from shared_state import data_lock, alarm_status, last_alarm_times, comm_fail_status, comm_fail_counters, current_set_temps, current_temperatures, publish_snapshot, initialize_shared_state, sync_shared_state, get_sample_ring, load_persisted_state
+from device_registry import registry
+from live_stream import broadcaster
+from scheduler import PollScheduler
+from leases import leases
+from alarm_rules import alarm_engine
 
 log = logging.getLogger()
 
-db_fail_counters = {} # DB 로깅 연속 실패 횟수 카운터
-
-def check_alarm(device_name, temperature, threshold):
-    """ 알람 상태 확인, 로깅, 반복 알람 처리 """
-    if not isinstance(temperature, (int, float)): return;
-
-    now = datetime.datetime.now()
-    is_currently_in_alarm = temperature > threshold;
+db_fail_counters = {} # DB 로깅 연속 실패 횟수 카운터 (DB 기록 스레드에서 갱신)
+
+def transition_state(device, expect, changes):
+    """
+    장치 알람/오프라인 상태 전이를 DB에서 비교 후 교체합니다. True를 받은 폴러만 알림을 보냅니다.
+    (임대를 가진 폴러 하나만 성공하므로 샤드가 바뀌거나 재시작해도 같은 알림이 두 번 나가지 않음)
+    DB 오류 시에는 알림을 놓치지 않도록 True로 처리합니다. (중복 가능성보다 누락이 더 나쁨)
+    """
+    try:
+        return database.transition_device_state(device['id'], leases.owner if leases.active else None, expect, changes)
+    except Exception as e:
+        log.error(f"{device['name']}: 알람/오프라인 상태 기록 실패, 메모리 상태로 알림을 판단합니다. ({e})")
+        return True
+
+def apply_alarm(device, active, reasons, repeat_seconds, temperature):
+    """ 규칙 엔진의 판정을 알람 상태에 반영하고 발생/반복 알림을 보냅니다. (발생/반복/해제 전이는 DB에서 한 폴러만 성공) """
+    device_name = device['name']
+    now = datetime.datetime.now().replace(microsecond=0) # DB에는 초 단위 epoch로 남김 (반복 알람 비교 시 그대로 일치하도록)
     was_previously_in_alarm = alarm_status.get(device_name, False);
     last_alarm_time = last_alarm_times.get(device_name)
+    last_alarm_at = int(last_alarm_time.timestamp()) if last_alarm_time else None
+    reason_text = ', '.join(reasons)
 
-    if is_currently_in_alarm and not was_previously_in_alarm:
+    if active and not was_previously_in_alarm:
         # 상태 변경: 정상 -> 알람 (최초 알람)
-        log.warning(f"[알람 발생] {device_name}: 현재({temperature}°C) > 임계값({threshold}°C)!");
         alarm_status[device_name] = True;
         last_alarm_times[device_name] = now
-        send_pushover_notification(f"{device_name} 온도 알람", f"장치 '{device_name}'의 온도가 임계값({threshold}°C)을 초과했습니다. (현재: {temperature}°C)", priority=1)
-    elif is_currently_in_alarm and was_previously_in_alarm:
+        if not transition_state(device, {'in_alarm': 0}, {'in_alarm': 1, 'last_alarm_at': int(now.timestamp())}):
+            load_persisted_state([device]); return; # 이미 다른 폴러(또는 이전 실행)가 알림을 보냄
+        log.warning(f"[알람 발생] {device_name}: {reason_text} (현재 {temperature}°C)");
+        send_pushover_notification(f"{device_name} 온도 알람", f"장치 '{device_name}' 온도 알람: {reason_text}. (현재: {temperature}°C)", priority=1)
+    elif active and was_previously_in_alarm:
         # 상태 유지: 알람 -> 알람 (반복 알람 확인)
-        if last_alarm_time and (now - last_alarm_time).total_seconds() >= 30 * 60:
-            log.warning(f"[반복 알람] {device_name}: 30분 이상 알람 상태 지속. 현재({temperature}°C) > 임계값({threshold}°C)!");
+        if last_alarm_time and (now - last_alarm_time).total_seconds() >= repeat_seconds:
             last_alarm_times[device_name] = now # 마지막 알람 시간 갱신
-            send_pushover_notification(f"{device_name} 온도 알람 지속", f"장치 '{device_name}'의 온도가 30분 이상 임계값({threshold}°C)을 초과하고 있습니다. (현재: {temperature}°C)", priority=1)
-    elif not is_currently_in_alarm and was_previously_in_alarm:
+            if not transition_state(device, {'in_alarm': 1, 'last_alarm_at': last_alarm_at}, {'last_alarm_at': int(now.timestamp())}):
+                load_persisted_state([device]); return;
+            log.warning(f"[반복 알람] {device_name}: {repeat_seconds / 60:g}분 이상 알람 상태 지속. {reason_text} (현재 {temperature}°C)");
+            send_pushover_notification(f"{device_name} 온도 알람 지속", f"장치 '{device_name}'의 온도 알람이 {repeat_seconds / 60:g}분 이상 이어지고 있습니다: {reason_text}. (현재: {temperature}°C)", priority=1)
+    elif not active and was_previously_in_alarm:
         # 상태 변경: 알람 -> 정상 (알람 해제)
-        log.info(f"[알람 해제] {device_name}: 현재({temperature}°C) <= 임계값({threshold}°C) 복구.");
+        log.info(f"[알람 해제] {device_name}: 현재({temperature}°C) 모든 알람 규칙 해제.");
         alarm_status[device_name] = False;
         last_alarm_times[device_name] = None # 알람 해제 시, 마지막 알람 시간 초기화
-
-pushover_config_warning_sent = False
+        transition_state(device, {'in_alarm': 1}, {'in_alarm': 0, 'last_alarm_at': None})
+
+def evaluate_alarms():
+    """ 이번 주기에 샘플이 들어온 장치들의 알람 규칙을 한꺼번에 판정해 반영합니다. 상태가 바뀐 장치가 있으면 True """
+    started = time.perf_counter()
+    changed = False
+    for device, active, reasons, repeat_seconds, temperature in alarm_engine.evaluate(alarm_status):
+        was_in_alarm = alarm_status.get(device['name'], False)
+        apply_alarm(device, active, reasons, repeat_seconds, temperature)
+        changed = changed or alarm_status.get(device['name'], False) != was_in_alarm
+    metrics.alarm_evaluation_seconds.observe(time.perf_counter() - started)
+    return changed
 
 def send_pushover_notification(title, message, priority=0):
-    """ Pushover를 통해 스마트폰으로 푸시 알림을 보냅니다. """
-    pushover_config = config.load_pushover_config()
-    api_token = pushover_config.get('api_token')
-    user_keys = pushover_config.get('user_keys', [])
-
-    if not api_token or not user_keys or api_token == 'YOUR_API_TOKEN_HERE':
-        global pushover_config_warning_sent
-        if not pushover_config_warning_sent:
-            log.warning("Pushover 설정(API 토큰 또는 사용자 키)이 비어있어 알림을 보내지 않습니다. 설정 페이지에서 구성해주세요.")
-            pushover_config_warning_sent = True # 경고는 한 번만 보냅니다.
+    """ Pushover를 통해 스마트폰으로 푸시 알림을 보냅니다. (발송 스레드의 대기열에 넣고 바로 반환) """
+    dispatcher.notify(title, message, priority)
+
+def record_db_result(device_names, error=None):
+    """ DB 배치 기록 결과(기록 스레드에서 호출)로 장치별 연속 실패 카운터를 갱신하고 알림을 보냅니다. """
+    for device_name in device_names:
+        if error is None:
+            # DB 저장이 성공했고, 이전에 실패 기록이 있었다면 복구 로그를 남김
+            if db_fail_counters.get(device_name, 0) > 0:
+                log.info(f"✅ [DB 복구] {device_name} 장치의 데이터베이스 로깅이 정상적으로 복구되었습니다.")
+                db_fail_counters[device_name] = 0 # DB 실패 카운터 리셋
         else:
-            log.debug("Pushover 설정이 없어 알림을 건너뜁니다.") # 이후에는 디버그 레벨로 조용히 처리
-        return # 알림 전송 중단
-
-    for user_key in user_keys:
+            # DB 저장 실패 시 카운터 증가 및 알림
+            log.error(f"🚨 DB 로깅 실패: {device_name} 온도 기록 중 오류 발생: {error}")
+            db_fail_counters[device_name] = db_fail_counters.get(device_name, 0) + 1
+            # 정확히 3회 실패 시점에 한 번만 알림
+            if db_fail_counters.get(device_name, 0) == 3:
+                kept = " (샘플은 로컬 스풀에 보관 중이며 DB가 복구되면 옮겨집니다.)" if temperature_writer.spool is not None else ""
+                send_pushover_notification(f"시스템 경고: DB 로깅 실패", f"장치 '{device_name}'의 온도 데이터 기록에 3회 연속 실패했습니다. 서버 상태를 확인해주세요.{kept}", priority=1)
+
+def read_device(device):
+    """ 한 장치의 현재 온도와 설정 온도를 읽어옵니다. (작업자 스레드에서 실행, 공유 상태는 건드리지 않음) """
+    device_name = device['name']; ip = device['ip']; port = device['port']; controller_id = device['controller_id']; log.info(f"{device_name}: 수집 시도...");
+
+    # --- [디버깅] 현재 온도 + 설정 온도 읽기 핵심 로직 (같은 TCP 세션에서 연달아 요청) ---
+    return protocol.get_device_readings(ip, port, controller_id)
+
+def handle_poll_result(device, current_temp, op_status, set_temp):
+    """ 수집 결과를 공유 상태, 알람, DB에 반영합니다. (폴링 스레드에서 순서대로 실행) """
+    device_name = device['name']
+
+    # 💡 [사용자 요청] 통신 성공 시, op_status의 'run' 상태를 항상 True로 설정
+    if op_status is not None:
+        op_status['run'] = True
+
+    if current_temp is not None:
+        log.info(f"✅ 수집 성공: {device_name} = {current_temp:.1f}°C")
+        # 수집 성공 시, 공유 변수 업데이트 및 DB 저장 (핵심 기능 유지)
+        with data_lock:
+            was_previously_failed = comm_fail_counters.get(device_name, 0) >= 3
+            comm_fail_counters[device_name] = 0 # 실패 카운터 리셋
+            current_temperatures[device_name]['temp'] = current_temp
+            current_temperatures[device_name]['op_status'] = op_status
+            now = datetime.datetime.now()
+            current_temperatures[device_name]['timestamp'] = now.strftime('%Y-%m-%d %H:%M:%S')
+            current_set_temps[device_name] = set_temp
+
+        if was_previously_failed and transition_state(device, {'offline': 1}, {'offline': 0}):
+            log.info(f"✅ [상태 복구] {device_name} 장치가 다시 온라인 상태가 되었습니다.")
+            send_pushover_notification(f"{device_name} 온라인 복구", f"장치 '{device_name}'의 통신이 정상적으로 복구되었습니다.")
+
+        # --- 알람 규칙 상태 갱신 (판정은 주기 끝에 evaluate_alarms에서 한꺼번에) ---
+        alarm_engine.observe(device, int(now.timestamp()), current_temp, op_status)
+
+        # --- 링 버퍼 + DB 저장 (기록 스레드 대기열에 넣기만 함. 실패 처리는 record_db_result에서 배치 결과로) ---
+        get_sample_ring(device_name).append(int(now.timestamp()), current_temp)
+        if not temperature_writer.submit(device_name, device['id'], current_temp, int(now.timestamp())):
+            record_db_result([device_name], "DB 기록 대기열 가득 참")
+    else:
+        # 수집 실패 시, 연속 실패 횟수를 1 증가시킴
+        with data_lock:
+            comm_fail_counters[device_name] += 1
+            fail_count = comm_fail_counters[device_name]
+        alarm_engine.observe(device, int(time.time()), None)
+        log.warning(f"🚨 수집 실패: {device_name}의 현재 온도를 읽을 수 없습니다. (연속 {fail_count}회)")
+
+        # 연속 3회 이상 실패 시에만 오프라인 처리
+        if fail_count == 3 and transition_state(device, {'offline': 0}, {'offline': 1}): # 정확히 3회가 되는 시점에 한 번만 알림 (이미 다른 폴러가 알렸으면 생략)
+            log.error(f"🚨 {device_name} 장치가 3회 연속 통신에 실패하여 오프라인으로 처리합니다.")
+            send_pushover_notification(f"{device_name} 오프라인", f"장치 '{device_name}'이 3회 연속 통신에 실패하여 오프라인으로 처리됩니다.", priority=1)
+
+        if fail_count >= 3:
+            with data_lock:
+                current_temperatures[device_name].update({'temp': None, 'op_status': None, 'timestamp': None})
+                current_set_temps[device_name] = None
+
+def group_devices_by_bus(devices):
+    """ 같은 컨버터(ip:port)를 공유하는 장치들을 하나의 RS-485 버스로 묶고, 버스 안에서는 controller_id 순서로 정렬합니다. """
+    buses = {}
+    for device in devices:
+        buses.setdefault((device['ip'], int(device['port'])), []).append(device)
+    for bus_devices in buses.values():
+        bus_devices.sort(key=lambda device: device['controller_id'])
+    return buses
+
+def read_bus(bus_devices):
+    """ 한 버스의 장치들을 같은 세션에서 순서대로 읽습니다. (버스 안에서는 동시 요청이 충돌하므로 순차 처리) """
+    return [(device, read_device(device)) for device in bus_devices]
+
+def poll_cycle(devices, executor, all_devices=None):
+    """
+    한 주기 동안 버스(ip:port)별로 작업자 풀에 동시에 요청하고, 완료되는 순서대로 결과를 처리합니다.
+    버스끼리는 병렬, 버스 안에서는 순차로 읽으므로 주기 소요 시간은 가장 느린 버스 하나의 수준이 됩니다.
+    devices는 이번에 읽을 장치(스케줄러가 고른 일부일 수 있음), all_devices는 스냅샷에 실을 전체 장치 목록입니다.
+    주기가 끝나면 이번에 읽은 장치들의 알람 규칙을 한꺼번에 판정합니다. (evaluate_alarms)
+    처리한 [(장치, (현재 온도, 운전 상태, 설정 온도))]를 반환합니다.
+    """
+    all_devices = devices if all_devices is None else all_devices
+    processed = []
+    buses = group_devices_by_bus(devices)
+    futures = {executor.submit(read_bus, bus_devices): bus_devices for bus_devices in buses.values()}
+    for future in as_completed(futures):
         try:
-            payload = {"token": api_token, "user": user_key, "title": title, "message": message, "priority": priority}
-            response = requests.post("https://api.pushover.net/1/messages.json", data=payload, timeout=10)
-            response.raise_for_status()
-            log.info(f"Pushover 알림 전송 성공: {user_key}에게 '{title}' 전송")
-        except requests.exceptions.RequestException as e:
-            log.error(f"Pushover 알림 전송 실패 ({user_key}): {e}")
+            results = future.result()
+        except Exception as e:
+            log.error(f"{futures[future][0]['ip']}:{futures[future][0]['port']}: 버스 폴링 작업 예외 - {e}")
+            results = [(device, (None, None, None)) for device in futures[future]]
+        for device, result in results:
+            handle_poll_result(device, *result)
+        processed.extend(results)
+        broadcaster.publish(publish_snapshot(all_devices).items) # 버스 하나가 끝날 때마다 새 스냅샷을 게시하고 바뀐 장치를 실시간 구독자에게 전송
+    if evaluate_alarms(): broadcaster.publish(publish_snapshot(all_devices).items); # 주기 끝에 알람 규칙을 한꺼번에 판정
+    return processed
 
 def data_polling_thread():
-    """ 주기적으로 모든 장치의 현재 온도와 설정 온도를 읽어오는 스레드 """
-    log.info("폴링 스레드 시작");
+    """
+    장치별 마감 시각에 맞춰 현재 온도와 설정 온도를 읽어오는 스레드.
+    스케줄러가 마감이 지난 장치만 골라 주므로, 오프라인 장치는 백오프 간격으로 드물게, 알람 임계값 근처 장치는 더 자주 읽습니다.
+    """
+    log.info(f"폴링 스레드 시작 (동시 버스 작업자: {config.POLL_WORKERS})");
+    temperature_writer.on_batch_result = record_db_result
+    temperature_writer.start(spool_owner=leases.owner)
+    dispatcher.start()
+    executor = ThreadPoolExecutor(max_workers=max(1, config.POLL_WORKERS), thread_name_prefix="PollWorker")
+    scheduler = PollScheduler()
+    leases.start()
+    synced = None
     while True:
-        start_time = time.time();
-        
-        # 매 주기마다 DB에서 최신 장치 목록을 다시 불러옵니다.
-        devices = config.load_devices()
+        # 매 주기마다 장치 레지스트리(캐시)에서 최신 장치 목록을 가져와 이 폴러가 임대한 장치만 남기고,
+        # 장치 목록이나 임대가 바뀌었으면 공유 상태와 스케줄러에 반영합니다.
+        all_devices = config.load_devices()
+        owned = leases.owned_ids()
+        devices = [device for device in all_devices if device['id'] in owned]
+        if (registry.version, owned) != synced:
+            if synced is not None and registry.version != synced[0]: leases.request_refresh(); # 장치가 다른 버스로 옮겨졌으면 바로 재배정
+            sync_shared_state(devices); scheduler.sync(devices); alarm_engine.sync(devices); synced = (registry.version, owned)
+            broadcaster.publish(publish_snapshot(devices).items)
         if not devices:
-            log.warning("등록된 장치가 없습니다. 설정 페이지에서 장치를 추가해주세요.")
+            if all_devices: log.info(f"이 폴러({leases.owner})에 할당된 장치가 없습니다. (장치 {len(all_devices)}개는 다른 폴러가 담당)");
+            else: log.warning("등록된 장치가 없습니다. 설정 페이지에서 장치를 추가해주세요.");
             time.sleep(config.POLL_INTERVAL)
             continue
-        log.info(f"--- 새 폴링 주기 시작 ({len(devices)}개 장치) ---");
-
-        for device in devices:
-            device_name = device['name']; ip = device['ip']; port = device['port']; controller_id = device['controller_id']; alarm_threshold = device.get('alarm_threshold'); log.info(f"{device_name}: 수집 시도...");
-
-            # --- [디버깅] 현재 온도 읽기 핵심 로직 ---
-            current_temp, op_status = protocol.get_temperature_from_device(ip, port, controller_id);
-
-            # 💡 [사용자 요청] 통신 성공 시, op_status의 'run' 상태를 항상 True로 설정
-            if op_status is not None:
-                op_status['run'] = True
-
-            if current_temp is not None:
-                log.info(f"✅ 수집 성공: {device_name} = {current_temp:.1f}°C")
-                # 수집 성공 시, 공유 변수 업데이트 및 DB 저장 (핵심 기능 유지)
-                with data_lock:
-                    was_previously_failed = comm_fail_counters.get(device_name, 0) >= 3
-                    comm_fail_counters[device_name] = 0 # 실패 카운터 리셋
-                    current_temperatures[device_name]['temp'] = current_temp
-                    current_temperatures[device_name]['op_status'] = op_status
-                    current_temperatures[device_name]['timestamp'] = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-                # --- 설정 온도 읽기 (실패해도 전체 로직에 영향 없도록) ---
-                try:
-                    set_temp = protocol.get_set_temperature_from_device(ip, port, controller_id)
-                    with data_lock:
-                        current_set_temps[device_name] = set_temp
-                except Exception as e:
-                    log.warning(f"설정 온도 읽기 실패 ({device_name}): {e}")
-
-                if was_previously_failed:
-                    log.info(f"✅ [상태 복구] {device_name} 장치가 다시 온라인 상태가 되었습니다.")
-                    send_pushover_notification(f"{device_name} 온라인 복구", f"장치 '{device_name}'의 통신이 정상적으로 복구되었습니다.")
-
-                # --- 알람 확인 ---
-                if alarm_threshold is not None:
-                    check_alarm(device_name, current_temp, alarm_threshold)
-
-                # --- DB 저장 및 실패 처리 ---
-                try:
-                    database.log_temperature_to_db(device_name, current_temp)
-                    # DB 저장이 성공했고, 이전에 실패 기록이 있었다면 복구 로그를 남김
-                    if db_fail_counters.get(device_name, 0) > 0:
-                        log.info(f"✅ [DB 복구] {device_name} 장치의 데이터베이스 로깅이 정상적으로 복구되었습니다.")
-                        db_fail_counters[device_name] = 0 # DB 실패 카운터 리셋
-                except Exception as db_e:
-                    # DB 저장 실패 시 카운터 증가 및 알림
-                    log.error(f"🚨 DB 로깅 실패: {device_name} 온도 {current_temp}°C 기록 중 오류 발생: {db_e}")
-                    db_fail_counters[device_name] = db_fail_counters.get(device_name, 0) + 1
-                    # 정확히 3회 실패 시점에 한 번만 알림
-                    if db_fail_counters.get(device_name, 0) == 3:
-                        send_pushover_notification(f"시스템 경고: DB 로깅 실패", f"장치 '{device_name}'의 온도 데이터 기록에 3회 연속 실패했습니다. 서버 상태를 확인해주세요.", priority=1)
-            else:
-                # 수집 실패 시, 연속 실패 횟수를 1 증가시킴
-                with data_lock:
-                    comm_fail_counters[device_name] += 1
-                    fail_count = comm_fail_counters[device_name]
-                log.warning(f"🚨 수집 실패: {device_name}의 현재 온도를 읽을 수 없습니다. (연속 {fail_count}회)")
-
-                # 연속 3회 이상 실패 시에만 오프라인 처리
-                if fail_count == 3: # 정확히 3회가 되는 시점에 한 번만 알림
-                    log.error(f"🚨 {device_name} 장치가 3회 연속 통신에 실패하여 오프라인으로 처리합니다.")
-                    send_pushover_notification(f"{device_name} 오프라인", f"장치 '{device_name}'이 3회 연속 통신에 실패하여 오프라인으로 처리됩니다.", priority=1)
-                
-                if fail_count >= 3:
-                    with data_lock:
-                        current_temperatures[device_name].update({'temp': None, 'op_status': None, 'timestamp': None})
-                        current_set_temps[device_name] = None
-
-        elapsed = time.time() - start_time; sleep_time = max(0, config.POLL_INTERVAL - elapsed); log.info(f"--- 폴링 완료 (소요: {elapsed:.1f}초). {sleep_time:.1f}초 후 다음 폴링 ---"); time.sleep(sleep_time);
\ No newline at end of file
+
+        start_time = time.monotonic()
+        due = scheduler.pop_due(start_time, lambda device: comm_fail_counters.get(device['name'], 0) >= 3)
+        if due:
+            log.info(f"--- 새 폴링 주기 시작 ({len(due)}/{len(devices)}개 장치) ---");
+            for device, (current_temp, _, _) in poll_cycle(due, executor, devices):
+                scheduler.reschedule(device, current_temp, comm_fail_counters.get(device['name'], 0))
+            elapsed = time.monotonic() - start_time; metrics.poll_cycle_seconds.observe(elapsed)
+        next_due = scheduler.next_due()
+        sleep_time = config.POLL_INTERVAL if next_due is None else min(config.POLL_INTERVAL, max(0.05, next_due - time.monotonic()))
+        if due: log.info(f"--- 폴링 완료 (소요: {elapsed:.1f}초). {sleep_time:.1f}초 후 다음 폴링 ---");
+        time.sleep(sleep_time)
\ No newline at end of file
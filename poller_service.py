@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+폴러 프로세스 (웹과 분리해 실행할 때의 진입점).
+
+    python poller_service.py                                          # 폴러 (여러 개 띄우면 장치를 나눠 맡음)
+    python poller_service.py --metrics-port 9102                      # 같은 호스트의 두 번째 폴러
+    gunicorn -w 4 -k gthread --threads 16 -b 0.0.0.0:5000 wsgi:app    # 웹 작업자 N개 (별도 프로세스)
+
+- 장치 폴링, DB 기록, 알림 발송, 보존 정책을 폴러 프로세스에서만 실행합니다.
+- 폴러가 여러 개면 DB의 장치 임대(leases.py)로 버스 단위로 나눠 맡고, 하나가 죽으면 LEASE_TTL 안에 나머지가 넘겨받습니다.
+  알람/오프라인 알림은 DB의 장치별 상태 전이에 성공한 폴러만 보내므로 장치마다 한 번만 나갑니다.
+- 실시간 상태(현재/설정 온도, 알람·오프라인 여부)는 스냅샷을 게시할 때마다 폴러별 상태 세그먼트(mmap 파일)에 씁니다.
+- 이 프로세스의 런타임 지표는 POLLER_METRICS_PORT의 /metrics로, 알림 발송 현황은 같은 포트의 /api/notifications/metrics로 제공합니다.
+  (웹 작업자의 /metrics는 작업자 자신의 지표)
+"""
+import argparse
+import atexit
+import json
+import os
+import signal
+import sys
+import threading
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+import database
+import metrics
+from poller import data_polling_thread
+from retention import retention_thread
+from leases import leases
+from notifier import dispatcher
+from shared_state import attach_segment_writer, initialize_shared_state
+from state_segment import StateSegmentWriter, remove_dead_segments, segment_path
+
+log = logging.getLogger()
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path == '/metrics':
+            body = metrics.render().encode('utf-8'); content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        elif path == '/api/notifications/metrics': # 웹의 같은 경로는 분리 실행 시 이쪽을 가리킴
+            body = json.dumps(dispatcher.metrics()).encode('utf-8'); content_type = 'application/json'
+        else:
+            self.send_error(404); return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # 수집기의 주기적 요청은 로그에 남기지 않음
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - [%(threadName)s] - %(message)s')
+    parser = argparse.ArgumentParser(description="폴러 프로세스")
+    parser.add_argument('--owner', help="임대에 쓸 폴러 이름 (기본: 호스트명:pid)")
+    parser.add_argument('--metrics-port', type=int, default=config.POLLER_METRICS_PORT, help="/metrics 포트 (0이면 열지 않음)")
+    args = parser.parse_args()
+    if args.owner: leases.owner = args.owner;
+
+    os.makedirs(os.path.dirname(config.DATABASE), exist_ok=True)
+    database.init_db()
+    initialize_shared_state()
+    remove_dead_segments(config.STATE_SEGMENT_PATH)
+    path = segment_path(config.STATE_SEGMENT_PATH, leases.owner)
+    try:
+        attach_segment_writer(StateSegmentWriter(path, config.STATE_SEGMENT_BYTES))
+    except RuntimeError as e:
+        log.error(f"{e} (같은 --owner로 폴러가 이미 실행 중)"); sys.exit(1)
+    atexit.register(leases.release) # 정상 종료 시 임대를 바로 내놓아 다른 폴러가 TTL을 기다리지 않도록
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    threading.Thread(target=retention_thread, name="RetentionThread", daemon=True).start()
+    if args.metrics_port:
+        try:
+            server = ThreadingHTTPServer(('0.0.0.0', args.metrics_port), MetricsHandler)
+            threading.Thread(target=server.serve_forever, name="MetricsThread", daemon=True).start()
+            log.info(f"폴러 지표: http://0.0.0.0:{args.metrics_port}/metrics")
+        except OSError as e:
+            log.error(f"폴러 지표 포트 {args.metrics_port}를 열지 못했습니다: {e} (--metrics-port로 다른 포트 지정)")
+    log.info(f"폴러 프로세스 시작 ({leases.owner}, 상태 세그먼트: {path})")
+    threading.current_thread().name = "PollerThread"
+    data_polling_thread()
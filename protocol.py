@@ -1,7 +1,13 @@
 # -*- coding: utf-8 -*-
 import socket
+import select
+import threading
 import time
 import logging
+from functools import reduce
+from operator import xor
+
+import metrics
 
 log = logging.getLogger()
 
@@ -84,31 +90,244 @@ def parse_set_temperature_response(response_bytes, expected_id_bytes):
         return ascii_hex_to_temperature(data_bytes, decimal_flag);
     except Exception as e: log.error(f"ID {expected_id_bytes.decode()}: 설정온도 파싱 예외: {e} (응답: {response_bytes})"); return None;
 
-# --- 3. 통신 실행 함수 ---
+# --- 2-1. 테이블 기반 코덱 (빠른 경로) ---
+# 정상 프레임은 조회 테이블과 바이트 인덱싱만으로 해석하고, 조금이라도 벗어나면 위의 기존 파서로 넘겨
+# 잘못된 프레임의 예외/로그 메시지는 기존과 똑같이 유지합니다. (benchmarks/codec.py가 두 경로의 결과를 비교)
+HEX_VALUE = tuple(ascii_to_hex_val(b) for b in range(256)) # ascii_to_hex_val과 같은 식을 256개 바이트에 미리 적용
+_STX = STX[0]; _ETX = ETX[0]; _DECIMAL_ONE = ord('1')
+_RESP_HEADER_END = 3 + len(HEADER_READ_DATA) # 응답 헤더(RDTP0/RDTS0)는 모두 5바이트
+_command_cache = {}
+
+def command_frame(controller_id, header):
+    """ 컨트롤러 ID와 명령 헤더의 요청 프레임 (STX+ID+헤더+ETX+BCC). 한 번 만든 프레임은 재사용합니다. """
+    key = (controller_id, header)
+    frame = _command_cache.get(key)
+    if frame is None:
+        packet_without_bcc = STX + controller_id.encode('ascii') + header + ETX
+        frame = _command_cache[key] = packet_without_bcc + bytes([reduce(xor, packet_without_bcc, 0)])
+    return frame
+
+def _fast_payload_start(buf, start, end, expected_id_bytes, expected_header, min_payload):
+    """ buf[start:end]가 STX로 시작하는 정상 프레임이면 페이로드 시작 위치, 아니면 None (기존 파서로 넘김) """
+    header_end = start + _RESP_HEADER_END
+    if end - header_end < min_payload + 2 or buf[start] != _STX or buf[end - 2] != _ETX: return None;
+    if buf[start + 1:start + 3] != expected_id_bytes or buf[start + 3:header_end] != expected_header: return None;
+    if reduce(xor, buf[start:end], 0) != 0: return None; # 프레임 전체 XOR이 0이면 BCC 일치
+    return header_end
+
+def _temperature_at(buf, i):
+    """ buf[i:i+4] ASCII-Hex + buf[i+4] 소수점 플래그 -> 온도 (ascii_hex_to_temperature와 같은 결과) """
+    value = (HEX_VALUE[buf[i]] << 12) | (HEX_VALUE[buf[i + 1]] << 8) | (HEX_VALUE[buf[i + 2]] << 4) | HEX_VALUE[buf[i + 3]]
+    if value & 0x8000: value = value - 0x10000;
+    if buf[i + 4] == _DECIMAL_ONE: value = value / 10.0;
+    return value
+
+def _count_frame_error(buf, start, end, expected_id_bytes, command, kind=None):
+    """ 빠른 경로를 벗어난 프레임의 오류 종류를 세어 둡니다. (해석과 로그는 기존 파서가 담당) """
+    if kind is None:
+        framed = end - start >= 2 and buf[start] == _STX and buf[end - 2] == _ETX
+        kind = 'bcc' if framed and reduce(xor, buf[start:end], 0) != 0 else 'malformed'
+    metrics.frame_errors_total.inc(bytes(expected_id_bytes).decode('ascii', 'replace'), command, kind)
+
+def _decode_temperature_at(buf, start, end, expected_id_bytes):
+    i = _fast_payload_start(buf, start, end, expected_id_bytes, HEADER_READ_DATA, 6)
+    if i is not None:
+        error_val = HEX_VALUE[buf[i + 5]]
+        if not error_val & 0b0011: # 센서 오픈/쇼트는 기존 경로에서 예외 로그
+            op_status = {
+                'run': bool(error_val & 0b10000000), 'comp': bool(error_val & 0b01000000),
+                'defrost': bool(error_val & 0b00100000), 'fan': bool(error_val & 0b00010000)
+            }
+            return _temperature_at(buf, i), op_status
+        _count_frame_error(buf, start, end, expected_id_bytes, 'RXTP0', 'sensor')
+    else:
+        _count_frame_error(buf, start, end, expected_id_bytes, 'RXTP0')
+    return parse_temperature_response(buf[start:end], expected_id_bytes)
+
+def _decode_set_temperature_at(buf, start, end, expected_id_bytes):
+    i = _fast_payload_start(buf, start, end, expected_id_bytes, HEADER_READ_SETTING_RESP, 5)
+    if i is not None: return _temperature_at(buf, i);
+    _count_frame_error(buf, start, end, expected_id_bytes, 'RXTS0')
+    return parse_set_temperature_response(buf[start:end], expected_id_bytes)
+
+def decode_temperature(response_bytes, expected_id_bytes):
+    """ 현재 온도 응답 (RDTP0) 해석. parse_temperature_response와 같은 (온도, 운전상태)를 반환합니다. """
+    if not response_bytes: return parse_temperature_response(response_bytes, expected_id_bytes);
+    return _decode_temperature_at(response_bytes, 0, len(response_bytes), expected_id_bytes)
+
+def decode_set_temperature(response_bytes, expected_id_bytes):
+    """ 설정 온도 응답 (RDTS0) 해석. parse_set_temperature_response와 같은 값을 반환합니다. """
+    if not response_bytes: return parse_set_temperature_response(response_bytes, expected_id_bytes);
+    return _decode_set_temperature_at(response_bytes, 0, len(response_bytes), expected_id_bytes)
+
+def frame_bounds(buffer):
+    """ 여러 응답이 이어진 버퍼에서 STX..ETX+BCC 프레임의 (시작, 끝) 위치를 차례로 찾습니다. (잡음/불완전 꼬리는 건너뜀) """
+    pos = buffer.find(STX)
+    while pos != -1:
+        etx_index = buffer.find(ETX, pos + 1)
+        if etx_index == -1 or etx_index + 2 > len(buffer): return;
+        yield pos, etx_index + 2
+        pos = buffer.find(STX, etx_index + 2)
+
+def iter_frames(buffer):
+    """ 버퍼 안의 프레임을 memoryview 조각으로 꺼냅니다. (복사 없음) """
+    view = memoryview(buffer)
+    for start, end in frame_bounds(buffer): yield view[start:end];
+
+def decode_frames(buffer, expected_ids, header=HEADER_READ_DATA):
+    """
+    한 버퍼에 담긴 여러 응답 프레임을 한꺼번에 해석합니다. (시뮬레이터 부하 시험, 캡처 재생 등)
+    프레임을 잘라 복사하지 않고 버퍼 안의 위치로 바로 해석하며, 잘못된 프레임만 잘라서 기존 파서로 넘깁니다.
+    expected_ids: 프레임 순서대로 기대하는 ID 바이트 목록. 결과는 decode_temperature(또는 decode_set_temperature)의 반환값 목록입니다.
+    """
+    decode = _decode_temperature_at if header == HEADER_READ_DATA else _decode_set_temperature_at
+    buffer = bytes(buffer)
+    return [decode(buffer, start, end, expected_id) for (start, end), expected_id in zip(frame_bounds(buffer), expected_ids)]
+
+# --- 3. TCP 세션 풀 ---
+SOCKET_TIMEOUT = 5.0   # 연결/응답 대기 시간 (초)
+SESSION_MAX_IDLE = 60.0 # 이 시간 이상 쉬었던 세션은 재사용하지 않고 새로 연결 (초)
+MAX_FRAME_LEN = 64      # 정상 응답 프레임은 20바이트 내외. 이보다 길면 잡음으로 판단
+
+def read_frame(sock):
+    """
+    STX부터 ETX+BCC까지 정확히 한 프레임을 읽어 반환합니다.
+    응답이 여러 조각으로 나뉘어 도착해도 합쳐서 처리하며, STX 앞의 잡음 바이트는 버립니다.
+    """
+    buffer = b''
+    while True:
+        try: chunk = sock.recv(256);
+        except socket.timeout:
+            if buffer: raise ValueError(f"프레임 수신 중 timeout (불완전 프레임): {buffer.hex()}");
+            raise
+        if not chunk:
+            if buffer: raise EOFError(f"프레임 수신 중 연결 종료: {buffer.hex()}");
+            raise EOFError("상대가 연결을 종료함");
+        buffer += chunk
+        stx_index = buffer.find(STX)
+        if stx_index == -1: buffer = b''; continue;
+        if stx_index: buffer = buffer[stx_index:];
+        etx_index = buffer.find(ETX, 1)
+        if etx_index != -1 and len(buffer) >= etx_index + 2:
+            if len(buffer) > etx_index + 2: log.debug(f"프레임 뒤 잉여 바이트 폐기: {buffer[etx_index + 2:].hex()}");
+            return buffer[:etx_index + 2]
+        if len(buffer) > MAX_FRAME_LEN: raise ValueError(f"프레임 길이 초과 (ETX 없음): {buffer.hex()}");
+
+class DeviceSession:
+    """ 하나의 (ip, port) 컨버터에 대한 지속 TCP 세션. 같은 엔드포인트로의 명령은 lock으로 직렬화됩니다. """
+    def __init__(self, ip, port):
+        self.ip = ip; self.port = port
+        self.lock = threading.RLock()
+        self.sock = None
+        self.last_used = 0.0
+
+    def _connect(self):
+        self.close()
+        sock = socket.create_connection((self.ip, self.port), timeout=SOCKET_TIMEOUT)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self.sock = sock
+        log.debug(f"{self.ip}:{self.port} 새 세션 연결")
+
+    def _is_healthy(self):
+        """ 유휴 세션 점검: 오래 쉬었거나, 상대가 연결을 끊었으면 False. 남아 있던 지연 응답은 버립니다. """
+        if self.sock is None: return False;
+        if time.monotonic() - self.last_used > SESSION_MAX_IDLE: return False;
+        try:
+            while True:
+                readable, _, _ = select.select([self.sock], [], [], 0)
+                if not readable: return True;
+                stale = self.sock.recv(1024)
+                if not stale: return False; # 상대가 연결 종료 (FIN)
+                log.debug(f"{self.ip}:{self.port} 세션에 남은 지연 응답 폐기: {stale.hex()}")
+        except OSError:
+            return False
+
+    def close(self):
+        if self.sock is not None:
+            try: self.sock.close();
+            except OSError: pass;
+        self.sock = None
+
+    def transact(self, command_bytes):
+        """ 명령 한 프레임 전송 후 응답 수신. 재사용 세션이 리셋되어 있으면 새로 연결해 한 번 재시도합니다. """
+        with self.lock:
+            reused = self._is_healthy()
+            if not reused: self._connect();
+            try:
+                response_bytes = self._send_and_recv(command_bytes)
+            except (ConnectionResetError, BrokenPipeError, ConnectionAbortedError, EOFError) as e:
+                if not reused: self.close(); raise;
+                log.debug(f"{self.ip}:{self.port} 재사용 세션 끊김({e}), 재연결 후 재시도")
+                self._connect()
+                try: response_bytes = self._send_and_recv(command_bytes);
+                except Exception: self.close(); raise;
+            except socket.timeout:
+                # 컨버터는 살아 있고 해당 컨트롤러만 응답이 없는 경우(멀티드롭 버스) 세션은 유지합니다.
+                # 늦게 도착하는 응답은 다음 명령 전에 _is_healthy()가 비웁니다.
+                self.last_used = time.monotonic(); raise;
+            except Exception:
+                self.close(); raise; # 불완전 프레임 등: 남은 바이트가 다음 명령과 섞이지 않도록 세션 폐기
+            self.last_used = time.monotonic()
+            return response_bytes
+
+    def _send_and_recv(self, command_bytes):
+        self.sock.sendall(command_bytes)
+        return read_frame(self.sock)
+
+class ConnectionPool:
+    """ (ip, port)별 DeviceSession 보관소. 세션은 폴링 주기를 넘어 유지됩니다. """
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, ip, port):
+        key = (ip, int(port))
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = self._sessions[key] = DeviceSession(*key)
+            return session
+
+    def close_all(self):
+        with self._lock:
+            sessions = list(self._sessions.values()); self._sessions.clear()
+        for session in sessions:
+            with session.lock: session.close();
+
+connection_pool = ConnectionPool()
+
+# --- 4. 통신 실행 함수 ---
 def send_command_and_receive(ip, port, controller_id, command_bytes, expected_header_str=""):
-    """ 소켓 통신 공통 함수 """
+    """ 소켓 통신 공통 함수 (풀링된 세션 사용). 왕복 시간과 timeout/오류 횟수를 버스·컨트롤러별 지표로 남깁니다. """
     log.debug(f"ID {controller_id}: -> {ip}:{port} | CMD({expected_header_str}): {command_bytes.hex()}")
+    bus = f"{ip}:{port}"; start = time.perf_counter()
     try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.settimeout(5.0); s.connect((ip, port)); s.sendall(command_bytes);
-            log.debug(f"ID {controller_id}: CMD 전송 완료, 응답 대기 시작...");
-            response_bytes = s.recv(1024);
+        response_bytes = connection_pool.get(ip, port).transact(command_bytes)
+        metrics.device_rtt_seconds.observe(time.perf_counter() - start, bus, controller_id, expected_header_str)
         log.debug(f"ID {controller_id}: <- {ip}:{port} | RCV({expected_header_str}): {response_bytes.hex() if response_bytes else '응답 없음'}")
         return response_bytes
-    except socket.timeout: log.error(f"ID {controller_id}: {ip}:{port} 5초간 {expected_header_str} 응답 없음 (send 후 timeout)"); return None;
-    except ConnectionRefusedError: log.error(f"ID {controller_id}: {ip}:{port} 연결 거부됨. 대상 장치(컨버터)가 해당 포트에서 실행 중인지, 전원/네트워크 연결이 올바른지 확인해주세요."); return None;
-    except Exception as e: log.error(f"ID {controller_id}: {ip}:{port} {expected_header_str} 소켓 오류 - {e}"); return None;
+    except socket.timeout: metrics.device_timeouts_total.inc(bus, controller_id, expected_header_str); log.error(f"ID {controller_id}: {ip}:{port} 5초간 {expected_header_str} 응답 없음 (send 후 timeout)"); return None;
+    except ConnectionRefusedError: metrics.device_errors_total.inc(bus, controller_id, expected_header_str, 'refused'); log.error(f"ID {controller_id}: {ip}:{port} 연결 거부됨. 대상 장치(컨버터)가 해당 포트에서 실행 중인지, 전원/네트워크 연결이 올바른지 확인해주세요."); return None;
+    except Exception as e: metrics.device_errors_total.inc(bus, controller_id, expected_header_str, 'socket'); log.error(f"ID {controller_id}: {ip}:{port} {expected_header_str} 소켓 오류 - {e}"); return None;
 
 def get_temperature_from_device(ip, port, controller_id):
     """ 현재 온도 읽기 (RXTP0) """
-    controller_id_bytes = controller_id.encode('ascii'); packet_without_bcc = STX + controller_id_bytes + HEADER_READ_TEMP + ETX; bcc = calculate_bcc(packet_without_bcc); command = packet_without_bcc + bcc;
+    controller_id_bytes = controller_id.encode('ascii'); command = command_frame(controller_id, HEADER_READ_TEMP);
     response_bytes = send_command_and_receive(ip, port, controller_id, command, "RXTP0");
-    if response_bytes: return parse_temperature_response(response_bytes, controller_id_bytes);
+    if response_bytes: return decode_temperature(response_bytes, controller_id_bytes);
     else: return None, None;
 
 def get_set_temperature_from_device(ip, port, controller_id):
     """ 설정 온도 읽기 (RX TS0) """
-    controller_id_bytes = controller_id.encode('ascii'); packet_without_bcc = STX + controller_id_bytes + HEADER_READ_SETTING + ETX; bcc = calculate_bcc(packet_without_bcc); command = packet_without_bcc + bcc;
+    controller_id_bytes = controller_id.encode('ascii'); command = command_frame(controller_id, HEADER_READ_SETTING);
     response_bytes = send_command_and_receive(ip, port, controller_id, command, "RXTS0")
-    if response_bytes: return parse_set_temperature_response(response_bytes, controller_id_bytes);
-    else: return None;
\ No newline at end of file
+    if response_bytes: return decode_set_temperature(response_bytes, controller_id_bytes);
+    else: return None;
+
+def get_device_readings(ip, port, controller_id):
+    """ 현재 온도(RXTP0)와 설정 온도(RXTS0)를 같은 세션에서 연달아 읽기. (현재온도, 운전상태, 설정온도) 반환 """
+    with connection_pool.get(ip, port).lock:
+        current_temp, op_status = get_temperature_from_device(ip, port, controller_id);
+        set_temp = get_set_temperature_from_device(ip, port, controller_id) if current_temp is not None else None;
+    return current_temp, op_status, set_temp
\ No newline at end of file
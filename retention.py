@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+보존 정책(config.RETENTION_DAYS)에 따라 오래된 원본/롤업 데이터를 단계적으로 정리하는 백그라운드 작업.
+
+    python retention.py            # 한 번 실행하고 결과 출력
+
+- 원본(10초 샘플)을 지우기 전에 1분 롤업이, 1분 롤업을 지우기 전에 1시간 롤업이 해당 구간을 완전히 덮는지 확인합니다.
+  덮지 못하면(backfill 전 등) 그 단계는 건너뜁니다. 상세 페이지 그래프/기록 표는 남은 롤업으로 계속 조회됩니다.
+- 장치별·청크별 짧은 트랜잭션으로 지우고 사이사이 쉬므로, 폴러의 삽입을 오래 막지 않습니다.
+"""
+import logging
+import os
+import time
+
+import config
+import database
+from rollup import local_midnight
+
+log = logging.getLogger()
+
+# 지우는 순서 = 세밀한 단계부터. 각 단계는 바로 다음(더 굵은) 단계로 대체됩니다.
+TIERS = [('raw', config.TABLE_NAME, 'ts')] + [(table, table, 'bucket') for table, _, _ in reversed(database.ROLLUP_LEVELS)]
+
+def watermark_key(tier):
+    return database.RAW_WATERMARK_KEY if tier == 'raw' else database.ROLLUP_WATERMARK_KEY.format(table=tier)
+
+def get_watermark(conn, tier):
+    row = conn.execute("SELECT value FROM settings WHERE key=?", (watermark_key(tier),)).fetchone()
+    return int(row['value']) if row else 0
+
+def delete_before(conn, table, key_col, cutoff, chunk_size, pause):
+    """ 장치별로 key_col < cutoff 인 행을 chunk_size씩 나눠 삭제합니다. (모두 기본키 범위 탐색) """
+    deleted = 0; device_id = -1
+    while True:
+        row = conn.execute(f"SELECT device_id FROM {table} WHERE device_id > ? ORDER BY device_id LIMIT 1", (device_id,)).fetchone()
+        if not row: break;
+        device_id = row['device_id']
+        while True:
+            bound = conn.execute(f"SELECT {key_col} FROM {table} WHERE device_id = ? AND {key_col} < ? ORDER BY {key_col} LIMIT 1 OFFSET ?", (device_id, cutoff, chunk_size - 1)).fetchone()
+            upper = bound[key_col] if bound else cutoff - 1
+            with conn:
+                deleted += conn.execute(f"DELETE FROM {table} WHERE device_id = ? AND {key_col} <= ?", (device_id, upper)).rowcount
+            if not bound: break;
+            time.sleep(pause) # 폴러의 쓰기 트랜잭션이 끼어들 틈을 줌
+    return deleted
+
+def validate_policies(policies):
+    """ 굵은 단계일수록 보존 기간이 같거나 길어야 합니다. (None = 영구) """
+    previous = 0
+    for tier, _, _ in TIERS:
+        days = policies.get(tier)
+        limit = float('inf') if days is None else days
+        if limit < previous:
+            raise ValueError(f"보존 정책 오류: {tier}({days}일)가 더 세밀한 단계({previous}일)보다 짧습니다.")
+        previous = limit
+
+def incremental_vacuum(conn, pages_per_step=1000, pause=0.05):
+    """ auto_vacuum=INCREMENTAL DB에서 빈 페이지를 조금씩 파일 시스템에 반환합니다. 반환한 페이지 수를 돌려줍니다. """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2: return 0;
+    released = 0
+    while True:
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if free_pages == 0: break;
+        conn.execute(f"PRAGMA incremental_vacuum({pages_per_step})").fetchall()
+        released += min(free_pages, pages_per_step)
+        time.sleep(pause)
+    return released
+
+def run_retention(policies=None, chunk_size=None, pause=0.05, now=None):
+    """ 보존 정책을 한 번 적용합니다. {'deleted': {단계: 행 수}, 'freed_bytes': ..., 'released_bytes': ...} 반환 """
+    policies = policies or config.RETENTION_DAYS
+    chunk_size = chunk_size or config.RETENTION_CHUNK
+    validate_policies(policies)
+    now = now or time.time()
+    conn = database.configure_writer_connection(database.get_db_connection())
+    try:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        free_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        file_pages_before = conn.execute("PRAGMA page_count").fetchone()[0]
+        deleted = {}
+        for index, (tier, table, key_col) in enumerate(TIERS):
+            days = policies.get(tier)
+            if days is None: continue;
+            cutoff = local_midnight(now - days * 86400) # 자정 기준으로 잘라 일 버킷이 쪼개지지 않도록
+            if cutoff <= get_watermark(conn, tier): continue; # 이미 정리됨 (워터마크가 그 이전 구간은 비어 있다고 보장)
+            if index + 1 < len(TIERS):
+                replacement = TIERS[index + 1][0]
+                if get_watermark(conn, replacement) > get_watermark(conn, tier):
+                    log.warning(f"보존 정책: {replacement}가 {tier} 구간을 완전히 덮지 못해 {tier} 정리를 건너뜁니다. ('python rollup.py backfill' 필요)")
+                    continue
+            started = time.time()
+            deleted[tier] = delete_before(conn, table, key_col, cutoff, chunk_size, pause)
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (watermark_key(tier), str(cutoff)))
+            log.info(f"보존 정책: {tier} {time.strftime('%Y-%m-%d', time.localtime(cutoff))} 이전 {deleted[tier]}건 삭제 ({time.time() - started:.1f}초)")
+
+        freed_pages = conn.execute("PRAGMA freelist_count").fetchone()[0] - free_before
+        released_pages = incremental_vacuum(conn, pause=pause)
+        file_pages_after = conn.execute("PRAGMA page_count").fetchone()[0]
+        result = {
+            'deleted': deleted,
+            'freed_bytes': max(0, freed_pages) * page_size, # DB 안에서 재사용 가능해진 공간
+            'released_bytes': max(0, file_pages_before - file_pages_after) * page_size, # 파일 크기에서 실제로 줄어든 공간
+        }
+        if deleted:
+            hint = "" if released_pages or not freed_pages else " (auto_vacuum이 꺼진 기존 DB: 파일 크기를 줄이려면 서버 정지 후 VACUUM)"
+            log.info(f"보존 정책 완료: 재사용 가능 {result['freed_bytes'] / 1048576:.1f}MB, 파일 축소 {result['released_bytes'] / 1048576:.1f}MB{hint}")
+        return result
+    finally:
+        conn.close()
+
+def retention_thread():
+    """ RETENTION_INTERVAL마다 보존 정책을 적용하는 스레드 """
+    log.info(f"보존 정책 스레드 시작 ({config.RETENTION_INTERVAL}초 주기)")
+    while True:
+        try:
+            run_retention()
+        except Exception as e:
+            log.error(f"보존 정책 작업 실패: {e}")
+        time.sleep(config.RETENTION_INTERVAL)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    os.makedirs(os.path.dirname(config.DATABASE), exist_ok=True)
+    database.init_db()
+    print(run_retention())
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import threading
+from array import array
+
+class SampleRing:
+    """
+    장치 하나의 최근 샘플 (epoch 초, 온도)을 담는 고정 크기 원형 버퍼.
+    array('q') + array('d')로 샘플당 16바이트만 쓰며, 시간순으로 쌓인다는 가정 아래 구간 조회는 이진 탐색으로 합니다.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._ts = array('q', bytes(8 * capacity))
+        self._temps = array('d', bytes(8 * capacity))
+        self._start = 0   # 가장 오래된 샘플의 물리 위치
+        self._count = 0
+        self._lock = threading.Lock()
+        self.valid_from = None # 이 epoch 이후 구간은 버퍼가 DB와 같은 내용을 갖고 있음 (None이면 미보장)
+
+    def __len__(self):
+        return self._count
+
+    def append(self, ts, temperature):
+        with self._lock:
+            if self._count and ts < self._ts[(self._start + self._count - 1) % self.capacity]: return; # 시간 역행 샘플 무시
+            if self._count < self.capacity:
+                pos = (self._start + self._count) % self.capacity; self._count += 1
+            else:
+                pos = self._start; self._start = (self._start + 1) % self.capacity
+                self.valid_from = self._ts[pos] + 1 # 가장 오래된 샘플이 밀려남
+            self._ts[pos] = ts; self._temps[pos] = temperature
+
+    def extend(self, samples):
+        for ts, temperature in samples: self.append(ts, temperature);
+
+    def mark_valid_from(self, ts):
+        """ DB에서 ts 이후를 모두 채워 넣은 뒤 호출 (예열 완료 표시) """
+        with self._lock:
+            self.valid_from = max(ts, self.valid_from) if self.valid_from is not None else ts
+
+    def covers(self, start_ts):
+        """ start_ts 이후 구간을 DB 없이 버퍼만으로 답할 수 있는지 """
+        return self.valid_from is not None and start_ts >= self.valid_from
+
+    def _bisect(self, ts):
+        """ ts 이상인 첫 논리 위치 (lock 안에서 호출) """
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._ts[(self._start + mid) % self.capacity] < ts: lo = mid + 1;
+            else: hi = mid;
+        return lo
+
+    def _slice(self, start_ts, end_ts):
+        """ start_ts <= ts <= end_ts 인 샘플의 (ts 리스트, 온도 리스트) """
+        with self._lock:
+            first = self._bisect(start_ts)
+            last = self._bisect(end_ts + 1) if end_ts is not None else self._count
+            a = (self._start + first) % self.capacity; n = last - first
+            if n <= 0: return [], [];
+            if a + n <= self.capacity:
+                return self._ts[a:a + n].tolist(), self._temps[a:a + n].tolist()
+            b = a + n - self.capacity
+            return self._ts[a:].tolist() + self._ts[:b].tolist(), self._temps[a:].tolist() + self._temps[:b].tolist()
+
+    def window(self, start_ts, end_ts=None):
+        """ 구간의 샘플 [(ts, 온도), ...] (오래된 것부터) """
+        ts_list, temps = self._slice(start_ts, end_ts)
+        return list(zip(ts_list, temps))
+
+    def stats(self, start_ts, end_ts=None):
+        """ 구간의 {'min', 'max', 'avg', 'count'} (샘플이 없으면 값은 None) """
+        _, temps = self._slice(start_ts, end_ts)
+        if not temps: return {'min': None, 'max': None, 'avg': None, 'count': 0};
+        return {'min': min(temps), 'max': max(temps), 'avg': sum(temps) / len(temps), 'count': len(temps)}
+
+    def buckets(self, start_ts, end_ts, bucket_seconds):
+        """ 구간을 bucket_seconds 단위로 나눈 평균 [(구간 시작 epoch, 평균 온도), ...] (get_historical_data의 간격 평균과 같은 경계) """
+        ts_list, temps = self._slice(start_ts, end_ts)
+        result = []; current = None; total = 0.0; n = 0
+        for ts, temperature in zip(ts_list, temps):
+            bucket = ts // bucket_seconds * bucket_seconds
+            if bucket != current:
+                if n: result.append((current, total / n));
+                current = bucket; total = 0.0; n = 0
+            total += temperature; n += 1
+        if n: result.append((current, total / n));
+        return result
+
+    def last_per_bucket(self, start_ts, end_ts, bucket_seconds):
+        """ bucket_seconds 구간마다 마지막 샘플 하나씩 [(ts, 온도), ...] (최신순, get_decimated_history와 같은 규칙) """
+        ts_list, temps = self._slice(start_ts, end_ts)
+        result = []; last_bucket = None
+        for i in range(len(ts_list) - 1, -1, -1):
+            bucket = ts_list[i] // bucket_seconds
+            if bucket != last_bucket:
+                result.append((ts_list[i], temps[i])); last_bucket = bucket
+        return result
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+롤업(1분/1시간/1일 사전 집계) 테이블 관리 도구.
+
+    python rollup.py backfill [--days 7] [--pause 0.05]
+
+새 샘플은 temp_logs 삽입 트리거가 실시간으로 집계하므로, backfill은 트리거가 생기기 전에 쌓인 이력에만 필요합니다.
+원본에서 다시 계산해 덮어쓰므로 여러 번 실행해도 결과가 같고, 서버 실행 중에도 청크 단위로 진행됩니다.
+"""
+import argparse
+import logging
+import os
+import time
+
+import config
+import database
+
+log = logging.getLogger()
+
+def local_midnight(ts):
+    """ ts가 속한 날의 로컬 자정 epoch """
+    lt = time.localtime(ts)
+    return int(time.mktime((lt.tm_year, lt.tm_mon, lt.tm_mday, 0, 0, 0, 0, 0, -1)))
+
+def backfill_chunk(conn, chunk_start, chunk_end):
+    """ [chunk_start, chunk_end) 구간의 모든 롤업 버킷을 원본에서 다시 계산합니다. (한 트랜잭션) """
+    with conn:
+        for table, size, bucket_expr in database.ROLLUP_LEVELS:
+            # 각 단위의 버킷 경계에 맞춰 구간을 잡아, 이웃 청크와 버킷이 나뉘지 않도록 합니다.
+            low = chunk_start if size == 86400 else chunk_start // size * size
+            high = chunk_end if size == 86400 else chunk_end // size * size
+            conn.execute(f"""
+                INSERT OR REPLACE INTO {table} (device_id, bucket, min_temp, max_temp, sum_temp, sample_count)
+                SELECT device_id, {bucket_expr.format(ts='ts')} AS bucket, MIN(temperature), MAX(temperature), SUM(temperature), COUNT(*)
+                FROM {config.TABLE_NAME}
+                WHERE ts >= ? AND ts < ?
+                GROUP BY device_id, bucket
+            """, (low, high))
+
+def backfill(days_per_chunk=7, pause=0.05):
+    """
+    남아 있는 원본 temp_logs 전체에 대해 롤업을 다시 계산하고, 그 시작 시점까지 watermark를 내립니다.
+    보존 정책으로 원본이 지워진 구간의 롤업은 건드리지 않습니다. (원본 경계가 걸친 날은 다음 자정부터 다시 계산)
+    """
+    conn = database.configure_writer_connection(database.get_db_connection())
+    try:
+        raw_from = database.get_raw_watermark(conn)
+        bounds = conn.execute(f"SELECT MIN(ts), MAX(ts) FROM {config.TABLE_NAME}").fetchone()
+        first_ts = 0
+        if bounds[0] is None:
+            log.info("원본 데이터가 없어 backfill할 것이 없습니다.")
+        else:
+            chunk_start = local_midnight(bounds[0])
+            if raw_from and chunk_start < raw_from:
+                chunk_start = raw_from if local_midnight(raw_from) == raw_from else local_midnight(raw_from + 86400 + 3 * 3600)
+            first_ts = chunk_start if raw_from else 0
+            last_ts = bounds[1]; started = time.time()
+            while chunk_start <= last_ts:
+                chunk_end = local_midnight(chunk_start + days_per_chunk * 86400 + 3 * 3600) # DST로 23/25시간인 날 대비
+                backfill_chunk(conn, chunk_start, chunk_end)
+                log.info(f"롤업 backfill: {time.strftime('%Y-%m-%d', time.localtime(chunk_start))} ~ {time.strftime('%Y-%m-%d', time.localtime(chunk_end - 1))} 완료 ({time.time() - started:.1f}초)")
+                chunk_start = chunk_end
+                time.sleep(pause) # 폴러의 쓰기 트랜잭션이 끼어들 틈을 줌
+        watermarks = database.get_rollup_watermarks(conn)
+        with conn:
+            for table, _, _ in database.ROLLUP_LEVELS:
+                watermark = min(watermarks.get(table, first_ts), first_ts)
+                conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (database.ROLLUP_WATERMARK_KEY.format(table=table), str(watermark)))
+        log.info("롤업 backfill 완료")
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="temp_logs 롤업 테이블 관리")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_backfill = sub.add_parser('backfill', help="기존 이력으로 롤업 테이블 채우기")
+    p_backfill.add_argument('--days', type=int, default=7, help="한 트랜잭션에 처리할 일 수 (기본 7)")
+    p_backfill.add_argument('--pause', type=float, default=0.05, help="청크 사이 대기 시간(초) (기본 0.05)")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(config.DATABASE), exist_ok=True)
+    database.init_db()
+    if args.command == 'backfill':
+        backfill(args.days, args.pause)
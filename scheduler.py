@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import heapq
+import random
+import time
+import logging
+
+import config
+
+log = logging.getLogger()
+
+class PollScheduler:
+    """
+    장치별 다음 폴링 시각(마감)을 우선순위 큐로 관리하는 스케줄러.
+    - 정상 장치: 장치별 poll_interval(없으면 config.POLL_INTERVAL)마다. 알람 임계값 근처면 더 자주.
+    - 오프라인 장치(연속 실패 3회 이상): 지수 백오프 + 지터로 점점 드물게 확인 (최대 OFFLINE_BACKOFF_MAX초).
+    - 한 번에 꺼내는 오프라인 장치는 버스당 OFFLINE_PROBES_PER_BUS개로 제한해, 응답 없는 장치의 timeout이 한 주기에 몰리지 않도록 합니다.
+    힙에는 (마감, 순번, 장치 id)를 넣고, 일정이 바뀐 장치의 옛 항목은 꺼낼 때 버립니다. (지연 삭제)
+    """
+    def __init__(self, rng=None):
+        self._heap = []
+        self._seq = 0
+        self._entries = {} # 장치 id -> {'device', 'due', 'seq'}
+        self._rng = rng or random.Random()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def base_interval(self, device):
+        interval = device.get('poll_interval') or config.POLL_INTERVAL
+        return max(config.MIN_POLL_INTERVAL, interval)
+
+    def _push(self, device_id, due):
+        self._seq += 1
+        entry = self._entries[device_id]
+        entry['due'] = due; entry['seq'] = self._seq
+        heapq.heappush(self._heap, (due, self._seq, device_id))
+
+    def sync(self, devices, now=None):
+        """ 장치 목록 변경 반영: 새 장치는 곧바로 예약, 사라진 장치는 제거, 남은 장치는 정보만 갱신 """
+        now = time.monotonic() if now is None else now
+        current = {device['id']: device for device in devices}
+        for device_id in list(self._entries):
+            if device_id not in current: del self._entries[device_id];
+        added = 0
+        for device_id, device in current.items():
+            entry = self._entries.get(device_id)
+            if entry is None:
+                self._entries[device_id] = {'device': device, 'due': None, 'seq': None}
+                self._push(device_id, now); added += 1 # 같은 간격의 장치는 같은 마감에 모여 한 주기에 함께 읽힘
+            else:
+                entry['device'] = device
+        if added: log.info(f"스케줄러: 장치 {added}개 예약 (총 {len(self._entries)}개)");
+
+    def next_due(self):
+        """ 가장 이른 마감 시각 (없으면 None) """
+        while self._heap:
+            due, seq, device_id = self._heap[0]
+            entry = self._entries.get(device_id)
+            if entry is not None and entry['seq'] == seq: return due;
+            heapq.heappop(self._heap) # 지난 항목 정리
+        return None
+
+    def pop_due(self, now, is_offline):
+        """ 마감이 지난 장치 목록. 버스당 오프라인 장치는 OFFLINE_PROBES_PER_BUS개까지만 꺼내고 나머지는 한 주기 뒤로 미룹니다. """
+        due_devices = []; deferred = []; probes = {}
+        while self._heap and self._heap[0][0] <= now:
+            due, seq, device_id = heapq.heappop(self._heap)
+            entry = self._entries.get(device_id)
+            if entry is None or entry['seq'] != seq: continue;
+            device = entry['device']
+            if is_offline(device):
+                bus = (device['ip'], int(device['port']))
+                if probes.get(bus, 0) >= config.OFFLINE_PROBES_PER_BUS: deferred.append(device_id); continue;
+                probes[bus] = probes.get(bus, 0) + 1
+            entry['seq'] = None # 다시 예약될 때까지 힙에 없음
+            due_devices.append(device)
+        for device_id in deferred: self._push(device_id, now + config.POLL_INTERVAL);
+        return due_devices
+
+    def reschedule(self, device, temperature, fail_count, now=None):
+        """ 폴링 결과에 따라 다음 마감을 정합니다. 다음 마감까지의 간격(초)을 반환합니다. """
+        now = time.monotonic() if now is None else now
+        entry = self._entries.get(device['id'])
+        if entry is None: return None; # 그 사이 삭제된 장치
+        base = self.base_interval(entry['device'])
+        if fail_count >= 3:
+            # 오프라인: base * 2^(실패 횟수 - 2), 최대 OFFLINE_BACKOFF_MAX, ±20% 지터 (여러 장치가 같은 때에 몰리지 않도록)
+            interval = min(config.OFFLINE_BACKOFF_MAX, base * 2 ** min(fail_count - 2, 16))
+            interval *= self._rng.uniform(0.8, 1.2)
+        else:
+            interval = base
+            threshold = entry['device'].get('alarm_threshold')
+            if temperature is not None and threshold is not None and temperature >= threshold - config.NEAR_ALARM_MARGIN:
+                interval = max(config.MIN_POLL_INTERVAL, base * config.NEAR_ALARM_INTERVAL_FACTOR) # 임계값 근처: 더 자주
+        previous_due = entry['due'] if entry['due'] is not None else now
+        due = previous_due + interval if fail_count == 0 else now + interval # 정상 장치는 예정 시각 기준으로 밀림 없이
+        if due < now: due = now;
+        self._push(device['id'], due)
+        return interval
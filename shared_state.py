@@ -1,6 +1,18 @@
 # -*- coding: utf-8 -*-
+import datetime
+import os
 import threading
+import time
+import logging
+import json
+import zlib
+from types import MappingProxyType
 import config
+import database
+from ring_buffer import SampleRing
+from device_registry import registry
+
+log = logging.getLogger()
 
 # 스레드 간 공유 데이터 접근을 보호하기 위한 잠금(Lock)
 data_lock = threading.Lock()
@@ -13,6 +25,53 @@ comm_fail_counters = {} # 연속 통신 실패 횟수 카운터
 current_set_temps = {}
 current_temperatures = {}
 last_alarm_times = {} # 알람 반복 전송을 위해 마지막 알람 시간을 기록
+recent_samples = {} # 장치별 최근 샘플 링 버퍼 (SampleRing). 자체 lock이 있어 data_lock 없이 읽고 씀
+_ring_lock = threading.Lock()
+_names_by_id = {} # 장치 id -> 공유 상태에 쓰인 이름 (이름 변경 감지용)
+_BOOT_ID = os.urandom(4).hex() # 프로세스마다 다른 값: 스냅샷 버전은 0부터 다시 세므로 ETag에 붙여 재시작 전 ETag와 겹치지 않게 함
+
+def get_sample_ring(device_name):
+    """ 장치의 링 버퍼 (없으면 만듦) """
+    ring = recent_samples.get(device_name)
+    if ring is None:
+        with _ring_lock:
+            ring = recent_samples.get(device_name)
+            if ring is None:
+                ring = recent_samples[device_name] = SampleRing(config.RECENT_BUFFER_HOURS * 3600 // config.POLL_INTERVAL)
+    return ring
+
+def preload_recent_samples(device_names):
+    """ 시작 시 DB의 최근 RECENT_BUFFER_HOURS 시간 샘플로 링 버퍼를 채웁니다. """
+    since_ts = int(time.time()) - config.RECENT_BUFFER_HOURS * 3600
+    try:
+        rows = database.get_recent_samples(since_ts)
+    except Exception as e:
+        log.error(f"링 버퍼 예열 실패 (DB 조회 오류): {e}"); return;
+    for row in rows:
+        get_sample_ring(row['device_name']).append(row['ts'], row['temperature'])
+    for device_name in device_names:
+        get_sample_ring(device_name).mark_valid_from(since_ts)
+    log.info(f"링 버퍼 예열 완료: {len(device_names)}개 장치, {len(rows)}건")
+
+def load_persisted_state(devices):
+    """
+    DB에 남은 장치별 알람/오프라인 상태(device_alarm_state)를 메모리에 반영합니다.
+    폴러가 재시작하거나 다른 폴러의 장치를 넘겨받았을 때, 이미 보낸 알람/오프라인 알림을 다시 보내지 않기 위함입니다.
+    """
+    if not devices: return;
+    try:
+        states = database.get_alarm_states([device['id'] for device in devices])
+    except Exception as e:
+        log.error(f"알람/오프라인 상태 불러오기 실패 (DB 조회 오류): {e}"); return;
+    with data_lock:
+        for device in devices:
+            state = states.get(device['id']); name = device['name']
+            if state is None or name not in comm_fail_counters: continue;
+            alarm_status[name] = state['in_alarm']
+            last_alarm_times[name] = datetime.datetime.fromtimestamp(state['last_alarm_at']) if state['last_alarm_at'] is not None else None
+            comm_fail_status[name] = state['offline']
+            if state['offline']: comm_fail_counters[name] = max(comm_fail_counters[name], 3);
+            elif comm_fail_counters[name] >= 3: comm_fail_counters[name] = 0;
 
 def initialize_shared_state():
     """DB에서 장치 목록을 읽어와 공유 상태 변수들을 초기화합니다."""
@@ -26,4 +85,216 @@ def initialize_shared_state():
         comm_fail_counters.clear(); comm_fail_counters.update({device['name']: 0 for device in devices})
         current_set_temps.clear(); current_set_temps.update({device['name']: None for device in devices})
         current_temperatures.clear(); current_temperatures.update({device['name']: {'temp': None, 'timestamp': None, 'op_status': None} for device in devices})
-        last_alarm_times.clear(); last_alarm_times.update({device['name']: None for device in devices})
\ No newline at end of file
+        last_alarm_times.clear(); last_alarm_times.update({device['name']: None for device in devices})
+        _names_by_id.clear(); _names_by_id.update({device['id']: device['name'] for device in devices})
+
+    load_persisted_state(devices)
+    preload_recent_samples([device['name'] for device in devices])
+    publish_snapshot(devices)
+
+def sync_shared_state(devices):
+    """
+    실행 중 추가/이름 변경/삭제된 장치를 공유 상태에 반영합니다. (기존 장치의 상태는 유지)
+    같은 id의 이름이 바뀌었으면 상태와 링 버퍼를 새 이름으로 옮기고, 새 장치는 초기값으로 추가, 사라진 장치는 제거합니다.
+    """
+    states = (alarm_status, comm_fail_status, comm_fail_counters, current_set_temps, current_temperatures, last_alarm_times, recent_samples)
+    names = {device['name'] for device in devices}
+    with data_lock:
+        renamed = []
+        for device in devices:
+            old_name = _names_by_id.get(device['id'])
+            if old_name and old_name != device['name'] and old_name in comm_fail_counters and old_name not in names:
+                for state in states:
+                    if old_name in state: state[device['name']] = state.pop(old_name);
+                renamed.append(f"{old_name}->{device['name']}")
+        added = names - set(comm_fail_counters)
+        removed = set(comm_fail_counters) - names
+        for name in added:
+            alarm_status[name] = False; comm_fail_status[name] = False; comm_fail_counters[name] = 0
+            current_set_temps[name] = None; last_alarm_times[name] = None
+            current_temperatures[name] = {'temp': None, 'timestamp': None, 'op_status': None}
+        for name in removed:
+            for state in states: state.pop(name, None);
+        _names_by_id.clear(); _names_by_id.update({device['id']: device['name'] for device in devices})
+    if added: load_persisted_state([device for device in devices if device['name'] in added]);
+    if added or removed or renamed:
+        log.info(f"장치 목록 변경 반영: 추가 {sorted(added)}, 제거 {sorted(removed)}, 이름 변경 {renamed}")
+
+def build_latest_data(devices):
+    """ 대시보드 표시용 최신 데이터 + 알람 상태 + 설정 온도 가져오기 """
+    latest_data = [];
+    try:
+        with data_lock:
+            for device in devices:
+                device_name = device['name'];
+                is_in_alarm = alarm_status.get(device_name, False);
+                read_set_temp = current_set_temps.get(device_name)
+
+                mem_data = current_temperatures.get(device_name, {'temp': None, 'timestamp': None, 'op_status': None})
+                current_temp_val = mem_data['temp']
+                op_status_val = dict(mem_data['op_status']) if mem_data['op_status'] else mem_data['op_status'] # 스냅샷이 공유 상태를 참조하지 않도록 복사
+                timestamp_str = mem_data['timestamp']
+
+                set_temp_val = None
+                try:
+                    if read_set_temp is not None: set_temp_val = float(read_set_temp)
+                except (ValueError, TypeError):
+                    log.warning(f"장치 {device_name}: 메모리 설정 온도 값 '{read_set_temp}'를 float으로 변환 실패. None으로 처리합니다.")
+                    set_temp_val = None
+
+                # 상태 결정 로직: 오프라인 > 알람 > 정상 순으로 판단
+                if current_temp_val is None:
+                    status = "오프라인"
+                elif is_in_alarm:
+                    status = "알람"
+                else:
+                    status = "정상"
+
+
+
+                latest_data.append({
+                    "name": device_name,
+                    "temperature": current_temp_val,
+                    "status": status,
+                    "timestamp": timestamp_str,
+                    "device_name": device_name,
+                    "is_alarm": is_in_alarm,
+                    "alarm_threshold": device.get('alarm_threshold'),
+                    "set_temp": set_temp_val,
+                    "op_status": op_status_val
+                });
+
+    except Exception as e:
+        log.error(f"대시보드 데이터 생성 오류: {e}");
+    return latest_data
+
+class StateSnapshot:
+    """
+    한 시점의 전체 장치 상태 (읽기 전용, 만든 뒤 바뀌지 않음).
+    폴러가 상태를 갱신할 때마다 새 객체를 만들어 모듈 변수를 통째로 바꾸므로, HTTP 처리기는 data_lock 없이 읽습니다.
+    JSON 직렬화 결과는 객체(= 버전)마다 한 번만 만들어 재사용합니다.
+    """
+    __slots__ = ('version', 'registry_version', 'items', 'by_name', 'item_versions', 'nonce', '_json', '_device_json')
+
+    def __init__(self, version, registry_version, items, item_versions, nonce=''):
+        self.version = version
+        self.registry_version = registry_version # 이 스냅샷을 만들 때의 장치 레지스트리 버전
+        self.items = tuple(items)
+        self.by_name = MappingProxyType({item['device_name']: item for item in items})
+        self.item_versions = MappingProxyType(item_versions) # 장치명 -> 그 장치 항목이 마지막으로 바뀐 스냅샷 버전
+        self.nonce = nonce # 버전이 프로세스 안에서만 유일하면 ETag 앞에 붙일 값 (내용 해시 버전이면 '')
+        self._json = None
+        self._device_json = {}
+
+    def etag(self, device_name=None):
+        """ 전체 목록(또는 장치 하나)의 ETag 값. 내용이 같으면 값도 같고, 재시작 전 실행의 ETag와는 겹치지 않습니다. """
+        version = self.version if device_name is None else self.item_versions[device_name]
+        return f"{self.nonce}-v{version}" if self.nonce else f"v{version}"
+
+    def json(self):
+        """ 전체 목록 JSON 문자열 (버전마다 한 번만 직렬화) """
+        if self._json is None:
+            self._json = json.dumps(self.items, ensure_ascii=False)
+        return self._json
+
+    def device_json(self, device_name):
+        """ 장치 하나의 JSON 문자열 (장치별로 한 번만 직렬화) """
+        body = self._device_json.get(device_name)
+        if body is None:
+            body = self._device_json[device_name] = json.dumps(self.by_name[device_name], ensure_ascii=False)
+        return body
+
+_snapshot = StateSnapshot(0, None, (), {}, _BOOT_ID)
+_publish_lock = threading.Lock()
+_segment_writer = None # 폴러 프로세스: 게시할 때마다 상태 세그먼트에도 씀
+_segment_reader = None # 웹 작업자 프로세스: 폴러들이 쓴 상태 세그먼트를 합쳐 스냅샷을 만듦
+_segment_seq = None
+
+def attach_segment_writer(writer):
+    """ (폴러 프로세스) 이후 게시하는 스냅샷을 상태 세그먼트에도 씁니다. 현재 스냅샷도 바로 씁니다. """
+    global _segment_writer
+    with _publish_lock:
+        _segment_writer = writer
+        _write_segment(_snapshot)
+
+def attach_segment_reader(reader):
+    """ (웹 작업자 프로세스) 이 프로세스의 공유 상태 대신 폴러 프로세스들이 쓴 상태 세그먼트(SegmentDirectoryReader)를 읽습니다. """
+    global _segment_reader
+    _segment_reader = reader
+
+def reads_from_segment():
+    return _segment_reader is not None
+
+def _write_segment(snapshot):
+    """ 본문: 장치 목록 JSON + 줄바꿈 + 장치별 항목 버전 JSON (읽는 쪽이 목록 JSON을 그대로 응답에 씀). 항목 버전에는 이 프로세스의 _BOOT_ID를 붙임 """
+    if _segment_writer is None: return;
+    item_versions = {name: f"{_BOOT_ID}.{version}" for name, version in snapshot.item_versions.items()} # 같은 --owner로 재시작해도 겹치지 않게
+    body = snapshot.json().encode('utf-8') + b'\n' + json.dumps(item_versions, ensure_ascii=False).encode('utf-8')
+    try: _segment_writer.publish(snapshot.version, body);
+    except Exception as e: log.error(f"상태 세그먼트 쓰기 실패: {e}");
+
+def _offline_item(device):
+    """ 어느 폴러의 세그먼트에도 없는 장치(임대를 넘겨받기 전, 맡은 폴러 없음)의 표시용 항목 """
+    return {"name": device['name'], "temperature": None, "status": "오프라인", "timestamp": None, "device_name": device['name'],
+            "is_alarm": False, "alarm_threshold": device.get('alarm_threshold'), "set_temp": None, "op_status": None}
+
+def _merge_segments(parts):
+    """
+    폴러별 세그먼트 본문들을 장치 레지스트리 순서의 목록 하나로 합칩니다. 넘겨받는 순간 두 폴러가 같은 장치를 실었으면
+    더 최근에 읽은 쪽을 씁니다. 항목 버전은 '폴러 이름표.폴러 프로세스 _BOOT_ID.그 폴러의 버전'이라 폴러가 바뀌거나 재시작해도 겹치지 않습니다.
+    """
+    by_name = {}; versions = {}
+    for tag, _, _, body in parts:
+        items_json, _, versions_json = bytes(body).partition(b'\n')
+        item_versions = json.loads(versions_json)
+        for item in json.loads(items_json):
+            name = item['device_name']; current = by_name.get(name)
+            if current is not None and (current['timestamp'] or '') >= (item['timestamp'] or ''): continue;
+            by_name[name] = item; versions[name] = f"{tag}.{item_versions[name]}"
+    items = []
+    for device in config.load_devices():
+        item = by_name.get(device['name'])
+        if item is None:
+            item = _offline_item(device)
+            versions[device['name']] = f"none.{zlib.crc32(json.dumps(item, ensure_ascii=False).encode('utf-8'))}"
+        items.append(item)
+    return items, versions
+
+def _refresh_from_segment():
+    """ 세그먼트들의 seq나 장치 목록이 바뀌었으면 새 스냅샷을 만듭니다. (바뀌지 않았으면 세그먼트마다 머리말 8바이트만 읽음) """
+    global _snapshot, _segment_seq
+    config.load_devices() # 장치 목록 캐시 확인 (다른 작업자에서 바뀐 장치 목록도 순서/오프라인 항목에 반영)
+    key = (_segment_reader.seq(), registry.version)
+    if key == _segment_seq: return _snapshot;
+    with _publish_lock:
+        if key == _segment_seq: return _snapshot;
+        items, item_versions = _merge_segments(_segment_reader.read())
+        items_json = json.dumps(items, ensure_ascii=False)
+        snapshot = StateSnapshot(zlib.crc32(items_json.encode('utf-8')), registry.version, items, item_versions) # 내용이 같으면 버전(ETag)도 같음
+        snapshot._json = items_json
+        _snapshot = snapshot; _segment_seq = key
+        return snapshot
+
+def get_snapshot():
+    """ 현재 상태 스냅샷 (잠금 없음. 웹 작업자 프로세스에서는 상태 세그먼트가 바뀌었을 때만 다시 읽음) """
+    if _segment_reader is not None: return _refresh_from_segment();
+    return _snapshot
+
+def publish_snapshot(devices=None):
+    """
+    공유 상태로 새 스냅샷을 만들어 게시하고 반환합니다. 내용과 장치 목록이 그대로면 기존 스냅샷(같은 버전)을 반환합니다.
+    devices를 생략하면 장치 레지스트리에서 읽습니다.
+    """
+    global _snapshot
+    with _publish_lock:
+        if devices is None: devices = config.load_devices();
+        registry_version = registry.version
+        items = build_latest_data(devices)
+        old = _snapshot
+        if registry_version == old.registry_version and items == list(old.items): return old;
+        version = old.version + 1
+        item_versions = {item['device_name']: old.item_versions[item['device_name']] if old.by_name.get(item['device_name']) == item else version for item in items}
+        _snapshot = StateSnapshot(version, registry_version, items, item_versions, _BOOT_ID)
+        _write_segment(_snapshot)
+        return _snapshot
+
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+온도 컨트롤러 시뮬레이터 (asyncio TCP). protocol.py와 같은 STX/ID/RXTP0·RXTS0/ETX/BCC 프로토콜로 응답합니다.
+포트 하나가 RS-485 컨버터 하나(멀티드롭 버스)이고, 포트마다 컨트롤러 ID 01부터 --controllers개가 매달려 있습니다.
+
+    python simulator.py [--host 127.0.0.1] [--base-port 15000] [--ports 10] [--controllers 20]
+                        [--curve sine] [--base -18] [--amplitude 2] [--period 600]
+                        [--latency 20] [--jitter 10] [--drop-rate 0.01] [--bad-bcc-rate 0.01]
+                        [--split-rate 0.1] [--open-rate 0] [--short-rate 0] [--hot-fraction 0.05]
+                        [--seed 1] [--register --threshold -10]
+
+- 온도 곡선: constant(고정), sine(주기 변동), ramp(주기마다 base에서 base+amplitude까지 상승 후 복귀), walk(무작위 보행)
+- 장애: 응답 누락, BCC 오류, 프레임 분할 전송(조각 사이 지연), 센서 오픈/쇼트 플래그. 모두 응답 단위 확률입니다.
+- --hot-fraction 비율의 컨트롤러는 --hot-offset만큼 높은 온도를 보내 알람 동작을 시험할 수 있습니다.
+- --register는 시뮬레이터의 모든 컨트롤러를 devices 테이블에 'SIM-포트-ID' 이름으로 등록합니다. (이미 있으면 건너뜀)
+- 같은 --seed면 같은 장애/온도 순서가 재현됩니다. (요청 순서가 같을 때)
+"""
+import argparse
+import asyncio
+import logging
+import math
+import os
+import random
+import threading
+import time
+
+from protocol import STX, ETX, HEADER_READ_TEMP, HEADER_READ_DATA, HEADER_READ_SETTING, HEADER_READ_SETTING_RESP, calculate_bcc
+
+log = logging.getLogger()
+
+CURVES = ('constant', 'sine', 'ramp', 'walk')
+REQUEST_LEN = 1 + 2 + 5 + 1 + 1 # STX + ID + 헤더 + ETX + BCC
+
+class SimulatorConfig:
+    """ 시뮬레이터 설정. 확률은 0~1, 시간은 초 단위입니다. """
+    def __init__(self, host='127.0.0.1', base_port=15000, ports=1, controllers=10, curve='sine', base=-18.0, amplitude=2.0, period=600.0,
+                 set_temp=None, latency=0.02, jitter=0.0, drop_rate=0.0, bad_bcc_rate=0.0, split_rate=0.0, split_delay=0.05,
+                 open_rate=0.0, short_rate=0.0, hot_fraction=0.0, hot_offset=15.0, seed=None):
+        self.host = host; self.base_port = base_port; self.ports = ports; self.controllers = controllers
+        self.curve = curve; self.base = base; self.amplitude = amplitude; self.period = period
+        self.set_temp = base if set_temp is None else set_temp
+        self.latency = latency; self.jitter = jitter
+        self.drop_rate = drop_rate; self.bad_bcc_rate = bad_bcc_rate; self.split_rate = split_rate; self.split_delay = split_delay
+        self.open_rate = open_rate; self.short_rate = short_rate
+        self.hot_fraction = hot_fraction; self.hot_offset = hot_offset
+        self.seed = seed
+
+class VirtualController:
+    """ 가상 컨트롤러 하나. 곡선에 따라 현재 온도를 만들고 응답 프레임을 조립합니다. """
+    def __init__(self, controller_id, cfg, rng, hot=False):
+        self.controller_id = controller_id
+        self.cfg = cfg
+        self.rng = rng
+        self.phase = rng.random() * cfg.period # 컨트롤러마다 곡선 위상을 달리해 동시에 같은 값이 나오지 않도록
+        self.offset = cfg.hot_offset if hot else 0.0
+        self.walk = cfg.base
+        self.requests = 0
+
+    def temperature(self, now):
+        cfg = self.cfg
+        if cfg.curve == 'sine': value = cfg.base + cfg.amplitude * math.sin(2 * math.pi * (now + self.phase) / cfg.period);
+        elif cfg.curve == 'ramp': value = cfg.base + cfg.amplitude * (((now + self.phase) % cfg.period) / cfg.period);
+        elif cfg.curve == 'walk':
+            self.walk += self.rng.gauss(0, cfg.amplitude / 10)
+            self.walk += (cfg.base - self.walk) * 0.05 # 기준값으로 천천히 복귀
+            value = self.walk
+        else: value = cfg.base;
+        return value + self.offset
+
+    def reply(self, header, now):
+        """ 요청 헤더에 맞는 응답 프레임 (지원하지 않는 헤더면 None) """
+        self.requests += 1
+        if header == HEADER_READ_TEMP:
+            roll = self.rng.random()
+            error_flag = b'1' if roll < self.cfg.open_rate else b'2' if roll < self.cfg.open_rate + self.cfg.short_rate else b'0'
+            payload = HEADER_READ_DATA + encode_temperature(self.temperature(now)) + error_flag
+        elif header == HEADER_READ_SETTING:
+            payload = HEADER_READ_SETTING_RESP + encode_temperature(self.cfg.set_temp)
+        else:
+            return None
+        packet = STX + self.controller_id + payload + ETX
+        return packet + calculate_bcc(packet)
+
+def encode_temperature(value):
+    """ 온도 -> 4자리 ASCII-Hex(0.1도 단위, 2의 보수) + 소수점 플래그 '1' """
+    return f"{int(round(value * 10)) & 0xFFFF:04X}".encode('ascii') + b'1'
+
+class Simulator:
+    """ 포트(버스)별 TCP 서버 묶음. 통계는 stats에 누적됩니다. """
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.rng = random.Random(cfg.seed)
+        self.buses = {} # 포트 -> {ID 바이트: VirtualController}
+        for p in range(cfg.ports):
+            port = cfg.base_port + p
+            self.buses[port] = {}
+            for c in range(cfg.controllers):
+                cid = f"{c + 1:02d}".encode('ascii')
+                self.buses[port][cid] = VirtualController(cid, cfg, random.Random(self.rng.random()), hot=self.rng.random() < cfg.hot_fraction)
+        self.stats = {'connections': 0, 'requests': 0, 'replies': 0, 'dropped': 0, 'bad_bcc': 0, 'split': 0, 'unknown_id': 0, 'bad_request': 0}
+        self._servers = []
+        self._writers = set()
+        self.loop = None
+
+    def devices(self):
+        """ 등록용 장치 목록 [(이름, ip, port, controller_id), ...] """
+        return [(f"SIM-{port}-{cid.decode()}", self.cfg.host, port, cid.decode()) for port, bus in self.buses.items() for cid in bus]
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        for port in self.buses:
+            server = await asyncio.start_server(lambda r, w, port=port: self._handle(port, r, w), self.cfg.host, port)
+            self._servers.append(server)
+        log.info(f"시뮬레이터 시작: {self.cfg.host}:{self.cfg.base_port}~{self.cfg.base_port + self.cfg.ports - 1} ({self.cfg.ports}개 버스 x {self.cfg.controllers}개 컨트롤러, 곡선 {self.cfg.curve})")
+
+    async def stop(self):
+        for server in self._servers: server.close();
+        for writer in list(self._writers): writer.close(); # 열린 클라이언트 연결도 끊어야 처리 코루틴이 끝남
+        for server in self._servers: await server.wait_closed();
+        self._servers = []
+
+    async def _handle(self, port, reader, writer):
+        """ 연결 하나 (컨버터 하나). 버스처럼 요청을 하나씩 순서대로 처리합니다. """
+        self.stats['connections'] += 1; self._writers.add(writer)
+        bus = self.buses[port]; buffer = b''
+        try:
+            while True:
+                chunk = await reader.read(256)
+                if not chunk: break;
+                buffer += chunk
+                while True:
+                    stx_index = buffer.find(STX)
+                    if stx_index == -1: buffer = b''; break;
+                    buffer = buffer[stx_index:]
+                    if len(buffer) < REQUEST_LEN: break;
+                    request, buffer = buffer[:REQUEST_LEN], buffer[REQUEST_LEN:]
+                    await self._respond(bus, request, writer)
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            self._writers.discard(writer); writer.close()
+
+    async def _respond(self, bus, request, writer):
+        cfg = self.cfg; rng = self.rng
+        self.stats['requests'] += 1
+        if request[-2] != ETX[0] or calculate_bcc(request[:-1]) != request[-1:]:
+            self.stats['bad_request'] += 1; return
+        controller = bus.get(request[1:3])
+        if controller is None:
+            self.stats['unknown_id'] += 1; return # 버스에 없는 ID: 실제 장비처럼 응답하지 않음
+        frame = controller.reply(request[3:8], time.time())
+        if frame is None:
+            self.stats['bad_request'] += 1; return
+        delay = cfg.latency + (rng.uniform(-cfg.jitter, cfg.jitter) if cfg.jitter else 0.0)
+        if delay > 0: await asyncio.sleep(delay);
+        if rng.random() < cfg.drop_rate:
+            self.stats['dropped'] += 1; return
+        if rng.random() < cfg.bad_bcc_rate:
+            frame = frame[:-1] + bytes([frame[-1] ^ 0xFF]); self.stats['bad_bcc'] += 1
+        if rng.random() < cfg.split_rate:
+            cut = rng.randint(1, len(frame) - 1)
+            writer.write(frame[:cut]); await writer.drain()
+            await asyncio.sleep(cfg.split_delay)
+            writer.write(frame[cut:]); self.stats['split'] += 1
+        else:
+            writer.write(frame)
+        await writer.drain()
+        self.stats['replies'] += 1
+
+def run_in_thread(cfg):
+    """ 시뮬레이터를 백그라운드 스레드의 이벤트 루프에서 실행하고, 수신 대기가 시작되면 Simulator를 반환합니다. (벤치마크/시험용) """
+    simulator = Simulator(cfg); ready = threading.Event(); errors = []
+    def _main():
+        loop = asyncio.new_event_loop(); asyncio.set_event_loop(loop)
+        try: loop.run_until_complete(simulator.start());
+        except Exception as e: errors.append(e); ready.set(); return;
+        ready.set(); loop.run_forever()
+        loop.run_until_complete(asyncio.sleep(0.05)); loop.close() # 닫힌 연결의 처리 코루틴이 끝나도록 잠시 돌린 뒤 종료
+    threading.Thread(target=_main, name="SimulatorThread", daemon=True).start()
+    ready.wait()
+    if errors: raise errors[0];
+    return simulator
+
+def stop_thread(simulator):
+    """ run_in_thread로 띄운 시뮬레이터 종료 """
+    loop = simulator.loop
+    asyncio.run_coroutine_threadsafe(simulator.stop(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+
+def register_devices(simulator, threshold):
+    """ 시뮬레이터 컨트롤러를 devices 테이블에 등록 (이미 있는 이름은 건너뜀) """
+    import config, database
+    os.makedirs(os.path.dirname(config.DATABASE), exist_ok=True)
+    database.init_db()
+    existing = {device['name'] for device in database.get_all_devices()}
+    added = 0
+    for name, ip, port, controller_id in simulator.devices():
+        if name in existing: continue;
+        database.add_device(name, ip, port, controller_id, threshold, "시뮬레이터"); added += 1
+    log.info(f"시뮬레이터 장치 등록: {added}개 추가 (기존 {len(existing)}개)")
+
+async def _serve(simulator, report_interval):
+    await simulator.start()
+    last = dict(simulator.stats)
+    while True:
+        await asyncio.sleep(report_interval)
+        stats = simulator.stats
+        rate = (stats['requests'] - last['requests']) / report_interval
+        log.info(f"요청 {rate:.0f}/초 | 누적 응답 {stats['replies']} 누락 {stats['dropped']} BCC오류 {stats['bad_bcc']} 분할 {stats['split']} 연결 {stats['connections']}")
+        last = dict(stats)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="온도 컨트롤러 TCP 시뮬레이터 (부하/장애 시험용)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--base-port', type=int, default=15000, help="첫 포트 (기본 15000)")
+    parser.add_argument('--ports', type=int, default=1, help="버스(포트) 수 (기본 1)")
+    parser.add_argument('--controllers', type=int, default=10, help="버스당 컨트롤러 수, 최대 99 (기본 10)")
+    parser.add_argument('--curve', choices=CURVES, default='sine', help="온도 곡선 (기본 sine)")
+    parser.add_argument('--base', type=float, default=-18.0, help="기준 온도 (기본 -18)")
+    parser.add_argument('--amplitude', type=float, default=2.0, help="곡선 진폭 (기본 2)")
+    parser.add_argument('--period', type=float, default=600.0, help="곡선 주기(초) (기본 600)")
+    parser.add_argument('--set-temp', type=float, default=None, help="설정 온도 응답값 (기본: 기준 온도)")
+    parser.add_argument('--latency', type=float, default=20.0, help="응답 지연(ms) (기본 20)")
+    parser.add_argument('--jitter', type=float, default=0.0, help="응답 지연 흔들림 ±ms (기본 0)")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="응답 누락 확률")
+    parser.add_argument('--bad-bcc-rate', type=float, default=0.0, help="BCC 오류 확률")
+    parser.add_argument('--split-rate', type=float, default=0.0, help="프레임 분할 전송 확률")
+    parser.add_argument('--split-delay', type=float, default=50.0, help="분할 조각 사이 지연(ms) (기본 50)")
+    parser.add_argument('--open-rate', type=float, default=0.0, help="센서 오픈 플래그 확률")
+    parser.add_argument('--short-rate', type=float, default=0.0, help="센서 쇼트 플래그 확률")
+    parser.add_argument('--hot-fraction', type=float, default=0.0, help="기준보다 높은 온도를 보낼 컨트롤러 비율 (알람 시험)")
+    parser.add_argument('--hot-offset', type=float, default=15.0, help="hot 컨트롤러의 온도 상승폭 (기본 15)")
+    parser.add_argument('--seed', type=int, default=None, help="난수 시드 (재현용)")
+    parser.add_argument('--report', type=float, default=10.0, help="통계 출력 주기(초) (기본 10)")
+    parser.add_argument('--register', action='store_true', help="컨트롤러를 devices 테이블에 등록")
+    parser.add_argument('--threshold', type=float, default=-10.0, help="--register 시 알람 임계값 (기본 -10)")
+    args = parser.parse_args()
+    if not 1 <= args.controllers <= 99: parser.error("--controllers는 1~99");
+
+    cfg = SimulatorConfig(host=args.host, base_port=args.base_port, ports=args.ports, controllers=args.controllers, curve=args.curve,
+                          base=args.base, amplitude=args.amplitude, period=args.period, set_temp=args.set_temp,
+                          latency=args.latency / 1000, jitter=args.jitter / 1000, drop_rate=args.drop_rate, bad_bcc_rate=args.bad_bcc_rate,
+                          split_rate=args.split_rate, split_delay=args.split_delay / 1000, open_rate=args.open_rate, short_rate=args.short_rate,
+                          hot_fraction=args.hot_fraction, hot_offset=args.hot_offset, seed=args.seed)
+    simulator = Simulator(cfg)
+    if args.register: register_devices(simulator, args.threshold);
+    try:
+        asyncio.run(_serve(simulator, args.report))
+    except KeyboardInterrupt:
+        log.info(f"시뮬레이터 종료: {simulator.stats}")
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+DB에 기록하지 못한 샘플을 잠시 보관하는 로컬 스풀 (고정 길이 레코드, mmap, 추가 전용).
+
+    python spool.py            # 스풀 파일 현황 (남은 건수, 주인 프로세스 생존 여부)
+    python spool.py --replay   # 주인이 없는(죽은) 스풀을 지금 DB에 옮기고 지움
+
+- DB 일괄 기록이 실패하거나(잠김, 디스크 가득 참 등) 기록 대기열이 가득 차면 기록 스레드/폴러가 샘플을 버리지 않고 여기에 씁니다.
+  쓰기는 mmap에 레코드 하나를 복사하고 머리말의 head를 올리는 것뿐이라 시스템 호출이 없습니다.
+- DB가 다시 정상이 되면 기록 스레드가 SPOOL_REPLAY_CHUNK건씩 한 트랜잭션으로 temp_logs에 옮기고(INSERT OR IGNORE),
+  커밋한 뒤에 checkpoint를 올립니다. 커밋과 checkpoint 사이에 죽으면 같은 레코드를 다시 옮기지만 (device_id, ts) 기본키로 걸러집니다.
+- 레코드마다 CRC32가 있어 전원 차단 등으로 반쯤 쓰인 레코드는 건너뜁니다. 모두 옮기면 파일 앞부분부터 다시 씁니다.
+- 프로세스(폴러)마다 자기 스풀 파일을 쓰고 flock으로 표시합니다. 주인이 죽은 스풀은 다음에 시작하는 폴러(또는 --replay)가 가져가 옮깁니다.
+
+머리말 (<8sIIQQQ, 64바이트 예약): MAGIC, 레코드 크기, 예약, 용량(레코드 수), head(쓴 레코드 수), checkpoint(옮긴 레코드 수)
+레코드 (<iqdI, 24바이트): device_id, ts(epoch 초), 온도, CRC32(앞 20바이트)
+"""
+import argparse
+import fcntl
+import glob
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import zlib
+import logging
+
+import config
+import database
+import metrics
+
+log = logging.getLogger()
+
+MAGIC = b'TMSPOOL1'
+HEADER = struct.Struct('<8sIIQQQ')
+HEADER_SIZE = 64
+RECORD = struct.Struct('<iqdI')
+_BODY = struct.Struct('<iqd') # CRC 계산 대상
+_CAPACITY_OFFSET = 16
+_HEAD_OFFSET = 24
+_CHECKPOINT_OFFSET = 32
+_U64 = struct.Struct('<Q')
+
+spool_records_total = metrics.Counter('tempmon_spool_records_total', "로컬 스풀 레코드 (spooled: 보관, replayed: DB로 옮김, dropped: 스풀도 가득 차 버림, corrupt: CRC 불일치로 건너뜀)", ('event',))
+
+def spool_path(base_path, owner):
+    """ 프로세스별 스풀 경로: data/samples.spool -> data/samples.<owner>.spool """
+    root, ext = os.path.splitext(base_path)
+    return f"{root}.{re.sub(r'[^A-Za-z0-9_.-]', '_', owner)}{ext}"
+
+def list_spools(base_path):
+    root, ext = os.path.splitext(base_path)
+    return sorted(glob.glob(f"{glob.escape(root)}.*{ext}"))
+
+class SampleSpool:
+    """ 스풀 파일 하나. 열 때 flock을 잡으므로 한 파일은 한 프로세스만 씁니다. (이미 잡혀 있으면 BlockingIOError) """
+    def __init__(self, path, capacity=None, max_bytes=None):
+        self.path = path
+        self.max_records = max(1, ((max_bytes or config.SPOOL_MAX_BYTES) - HEADER_SIZE) // RECORD.size)
+        capacity = min(capacity or config.SPOOL_INITIAL_RECORDS, self.max_records)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._file = open(path, 'a+b')
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._file.close(); raise
+        self._file.seek(0, os.SEEK_END)
+        if self._file.tell() < HEADER_SIZE: # 새 파일
+            self._file.truncate(HEADER_SIZE + capacity * RECORD.size)
+            self._mm = mmap.mmap(self._file.fileno(), 0)
+            self._mm[:HEADER.size] = HEADER.pack(MAGIC, RECORD.size, 0, capacity, 0, 0)
+            head = checkpoint = 0
+        else:
+            self._mm = mmap.mmap(self._file.fileno(), 0)
+            magic, record_size, _, capacity, head, checkpoint = HEADER.unpack_from(self._mm)
+            if magic != MAGIC or record_size != RECORD.size: raise ValueError(f"스풀 파일 형식이 다릅니다: {path}");
+            capacity = min(capacity, (len(self._mm) - HEADER_SIZE) // RECORD.size) # 잘린 파일 방어
+            head = min(head, capacity); checkpoint = min(checkpoint, head)
+            self._mm[:HEADER.size] = HEADER.pack(MAGIC, RECORD.size, 0, capacity, head, checkpoint)
+        self.capacity = capacity
+        # 헤더의 head/checkpoint 사본: _grow()가 잠금 안에서 mmap을 바꿔 끼우므로, 잠금 없이 읽는 쪽(pending, 지표)은 이 값을 봅니다.
+        self._head = head; self._checkpoint = checkpoint
+        self._dirty = False
+
+    @property
+    def head(self):
+        return self._head
+
+    @property
+    def checkpoint(self):
+        return self._checkpoint
+
+    def pending(self):
+        """ 아직 DB로 옮기지 않은 레코드 수 """
+        return self.head - self.checkpoint
+
+    def _grow(self, needed):
+        """ 용량을 두 배씩(최대 SPOOL_MAX_BYTES) 늘립니다. 늘릴 수 없으면 False """
+        if needed > self.max_records: return False;
+        capacity = self.capacity
+        while capacity < needed: capacity = min(capacity * 2, self.max_records);
+        self._mm.flush(); self._mm.close()
+        self._file.truncate(HEADER_SIZE + capacity * RECORD.size)
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+        _U64.pack_into(self._mm, _CAPACITY_OFFSET, capacity)
+        self.capacity = capacity
+        log.warning(f"로컬 스풀 확장: {capacity}건 ({(HEADER_SIZE + capacity * RECORD.size) // 1024}KB)")
+        return True
+
+    def append_many(self, samples):
+        """ [(device_id, ts, 온도)]를 덧붙입니다. 보관한 건수를 반환합니다. (스풀도 가득 차면 나머지는 버림) """
+        with self._lock:
+            head = self.head
+            if head + len(samples) > self.capacity and not self._grow(head + len(samples)):
+                room = self.capacity - head
+                spool_records_total.inc(len(samples) - room, 'dropped')
+                log.error(f"🚨 로컬 스풀 가득 참 ({self.capacity}건): 샘플 {len(samples) - room}건 누락")
+                samples = samples[:room]
+            mm = self._mm; offset = HEADER_SIZE + head * RECORD.size
+            for device_id, ts, temperature in samples:
+                body = _BODY.pack(device_id, ts, temperature)
+                mm[offset:offset + RECORD.size] = body + struct.pack('<I', zlib.crc32(body))
+                offset += RECORD.size
+            _U64.pack_into(mm, _HEAD_OFFSET, head + len(samples)) # 레코드를 다 쓴 뒤에 head를 올림
+            self._head = head + len(samples)
+            self._dirty = True
+        if samples: spool_records_total.inc(len(samples), 'spooled');
+        return len(samples)
+
+    def read_pending(self, limit):
+        """ checkpoint부터 최대 limit건: ([(device_id, ts, 온도)], 다음 checkpoint). CRC가 맞지 않는 레코드는 건너뜁니다. """
+        with self._lock:
+            start = self.checkpoint; end = min(self.head, start + limit)
+            rows = []; corrupt = 0
+            for index in range(start, end):
+                offset = HEADER_SIZE + index * RECORD.size
+                device_id, ts, temperature, crc = RECORD.unpack_from(self._mm, offset)
+                if zlib.crc32(self._mm[offset:offset + _BODY.size]) != crc: corrupt += 1; continue;
+                rows.append((device_id, ts, temperature))
+        if corrupt:
+            spool_records_total.inc(corrupt, 'corrupt'); log.warning(f"로컬 스풀: 손상된 레코드 {corrupt}건 건너뜀 ({self.path})")
+        return rows, end
+
+    def commit(self, checkpoint):
+        """ checkpoint까지 DB에 옮겼음을 기록합니다. 모두 옮겼으면 파일 앞부분부터 다시 씁니다. """
+        with self._lock:
+            _U64.pack_into(self._mm, _CHECKPOINT_OFFSET, checkpoint); self._checkpoint = checkpoint
+            if checkpoint >= self._head:
+                _U64.pack_into(self._mm, _CHECKPOINT_OFFSET, 0) # checkpoint를 먼저 0으로: 그 사이에 죽으면 다시 옮길 뿐 (중복은 기본키로 걸러짐)
+                _U64.pack_into(self._mm, _HEAD_OFFSET, 0)
+                self._head = self._checkpoint = 0
+            self._mm.flush(0, HEADER_SIZE); self._dirty = False
+
+    def sync(self):
+        """ 새로 쓴 레코드를 디스크에 내립니다. (msync: 프로세스가 죽는 것에는 필요 없고, 전원 차단 대비) """
+        if not self._dirty: return;
+        with self._lock:
+            self._mm.flush(); self._dirty = False
+
+    def close(self, remove_if_empty=False):
+        with self._lock:
+            empty = self.head == 0
+            self._mm.flush(); self._mm.close()
+            if remove_if_empty and empty: os.remove(self.path);
+            self._file.close() # 파일을 지운 뒤에 잠금을 풂 (다른 프로세스가 빈 파일을 가져가지 않도록)
+
+def replay(spool, conn, chunk=None, max_chunks=None):
+    """
+    스풀의 남은 레코드를 chunk건씩 한 트랜잭션으로 temp_logs에 옮깁니다. (INSERT OR IGNORE, 삭제된 장치의 레코드는 버림)
+    max_chunks가 주어지면 그만큼만 옮기고 돌아옵니다. (기록 스레드가 새 샘플 기록과 번갈아 하도록)
+    옮긴 레코드 수를 반환합니다. DB 오류는 그대로 올려 보내며, 그때까지 커밋한 부분의 checkpoint는 이미 기록되어 있습니다.
+    """
+    chunk = chunk or config.SPOOL_REPLAY_CHUNK
+    replayed = 0; chunks = 0
+    while spool.pending() and (max_chunks is None or chunks < max_chunks):
+        rows, checkpoint = spool.read_pending(chunk)
+        device_ids = {row[0] for row in conn.execute("SELECT id FROM devices")}
+        with conn:
+            conn.executemany(f"INSERT OR IGNORE INTO {config.TABLE_NAME} (device_id, ts, temperature) VALUES (?, ?, ?)", [row for row in rows if row[0] in device_ids])
+        spool.commit(checkpoint)
+        replayed += len(rows); chunks += 1
+        spool_records_total.inc(len(rows), 'replayed')
+    return replayed
+
+def adopt_orphans(base_path, conn):
+    """ 주인 프로세스가 죽은 스풀 파일을 가져와 DB로 옮기고 지웁니다. 옮긴 레코드 수를 반환합니다. """
+    total = 0
+    for path in list_spools(base_path):
+        try:
+            spool = SampleSpool(path)
+        except BlockingIOError:
+            continue # 살아 있는 프로세스의 스풀
+        except (OSError, ValueError) as e:
+            log.error(f"스풀 파일을 열지 못했습니다: {path} ({e})"); continue
+        try:
+            count = replay(spool, conn); total += count
+            if count: log.info(f"남은 스풀 {count}건을 DB로 옮겼습니다: {path}");
+        finally:
+            spool.close(remove_if_empty=True)
+    return total
+
+def status(base_path):
+    """ [(경로, 남은 건수, 주인 생존 여부)] """
+    result = []
+    for path in list_spools(base_path):
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+            try:
+                fcntl.flock(f, fcntl.LOCK_SH | fcntl.LOCK_NB); live = False
+            except OSError:
+                live = True
+        if len(header) < HEADER.size or header[:8] != MAGIC: result.append((path, None, live)); continue;
+        _, _, _, _, head, checkpoint = HEADER.unpack(header)
+        result.append((path, head - checkpoint, live))
+    return result
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="DB에 기록하지 못한 샘플의 로컬 스풀")
+    parser.add_argument('--replay', action='store_true', help="주인이 없는 스풀을 DB로 옮기고 지움")
+    args = parser.parse_args()
+    if args.replay:
+        database.init_db()
+        conn = database.configure_writer_connection(database.get_db_connection())
+        try: print(f"옮긴 레코드: {adopt_orphans(config.SPOOL_PATH, conn)}건");
+        finally: conn.close();
+    rows = status(config.SPOOL_PATH)
+    if not rows: print("스풀 파일이 없습니다."); sys.exit(0);
+    for path, pending, live in rows:
+        print(f"{path}: {'형식 오류' if pending is None else f'남은 {pending}건'} ({'사용 중' if live else '주인 없음'})")
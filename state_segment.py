@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+폴러 프로세스와 웹 작업자 프로세스가 실시간 상태를 나눠 보는 mmap 파일.
+폴러마다 자기 세그먼트(config.STATE_SEGMENT_PATH의 확장자 앞에 폴러 이름을 붙인 파일)에 맡은 장치의 상태를 쓰고,
+웹 작업자는 SegmentDirectoryReader로 살아 있는 폴러의 세그먼트를 모두 읽어 합칩니다.
+
+- 세그먼트마다 쓰는 쪽은 폴러 프로세스 하나뿐입니다. 스냅샷이 바뀔 때마다 본문을 쓰지 않는 쪽 슬롯에 쓰고,
+  머리말의 활성 슬롯/길이/CRC/버전을 바꿉니다. 바꾸는 동안 seq를 홀수로 두는 seqlock이라 읽는 쪽은 잠금 없이
+  seq가 짝수이고 읽기 전후에 같을 때만 결과를 받아들입니다. (CRC까지 맞아야 함)
+- 본문이 슬롯보다 커지면 두 배 크기의 새 파일로 바꾸고(os.replace), 예전 파일 머리말에 moved를 표시해
+  읽는 쪽이 새 파일을 다시 열도록 합니다.
+- 쓰는 쪽은 살아 있는 동안 '<세그먼트>.lock' 파일에 flock을 잡고 있습니다. 잠금을 잡을 수 있으면 그 폴러는 죽은 것이므로
+  읽는 쪽은 그 세그먼트를 건너뜁니다. (그 장치들은 임대를 넘겨받은 폴러의 세그먼트에 다시 나타남)
+
+머리말 (<8sQIIIIIIQ, 64바이트 예약): MAGIC, seq, 슬롯 크기, moved, 활성 슬롯, 길이, CRC32, 예약, 스냅샷 버전
+슬롯 0은 HEADER_SIZE, 슬롯 1은 HEADER_SIZE + 슬롯 크기에서 시작합니다.
+"""
+import fcntl
+import glob
+import mmap
+import os
+import re
+import struct
+import time
+import zlib
+import logging
+
+log = logging.getLogger()
+
+MAGIC = b'TMSTATE1'
+HEADER = struct.Struct('<8sQIIIIIIQ')
+HEADER_SIZE = 64
+_SEQ = struct.Struct('<Q') # 머리말 오프셋 8
+_MOVED_OFFSET = 20
+
+def _create(path, capacity):
+    """ 빈 세그먼트 파일을 임시 이름으로 만든 뒤 제자리로 옮깁니다. (읽는 쪽이 반쯤 만든 파일을 보지 않도록) """
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, 0, capacity, 0, 0, 0, 0, 0, 0).ljust(HEADER_SIZE, b'\0'))
+        f.truncate(HEADER_SIZE + 2 * capacity)
+    os.replace(tmp, path)
+
+def segment_path(base_path, owner):
+    """ 폴러별 세그먼트 경로: data/live_state.seg -> data/live_state.<owner>.seg (파일명에 못 쓰는 문자는 _) """
+    root, ext = os.path.splitext(base_path)
+    return f"{root}.{re.sub(r'[^A-Za-z0-9_.-]', '_', owner)}{ext}"
+
+def is_live(path):
+    """ 세그먼트를 쓰는 폴러 프로세스가 살아 있는지 (잠금 파일의 flock을 잡을 수 있으면 죽은 것) """
+    try:
+        lock_file = open(path + '.lock', 'a')
+    except OSError:
+        return False
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        return False
+    except OSError:
+        return True
+    finally:
+        lock_file.close()
+
+def list_segments(base_path):
+    root, ext = os.path.splitext(base_path)
+    return sorted(glob.glob(f"{glob.escape(root)}.*{ext}"))
+
+def remove_dead_segments(base_path):
+    """ 죽은 폴러가 남긴 세그먼트와 잠금 파일을 지웁니다. (폴러 시작 시) """
+    for path in list_segments(base_path):
+        if is_live(path): continue;
+        for name in (path, path + '.lock'):
+            try: os.remove(name);
+            except FileNotFoundError: pass;
+        log.info(f"죽은 폴러의 상태 세그먼트 정리: {path}")
+
+def _map(path):
+    with open(path, 'r+b') as f:
+        return mmap.mmap(f.fileno(), 0)
+
+class StateSegmentWriter:
+    """ 폴러 프로세스 쪽. publish(버전, 본문 bytes). 같은 세그먼트를 다른 프로세스가 쓰고 있으면 RuntimeError """
+    def __init__(self, path, capacity):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock_file = open(path + '.lock', 'a')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB) # 프로세스가 끝나면 자동으로 풀림 (읽는 쪽의 생존 확인용)
+        except OSError:
+            self._lock_file.close(); raise RuntimeError(f"다른 프로세스가 상태 세그먼트를 쓰고 있습니다: {path}")
+        self._mm = None
+        if os.path.exists(path):
+            try:
+                mm = _map(path)
+                if mm[:8] == MAGIC and HEADER.unpack_from(mm)[2] >= capacity and len(mm) >= HEADER_SIZE + 2 * HEADER.unpack_from(mm)[2]:
+                    self._mm = mm # 이전 실행의 파일을 그대로 이어 씀 (seq는 계속 증가)
+                else:
+                    self._retire(mm)
+            except (OSError, ValueError, struct.error):
+                pass
+        if self._mm is None:
+            _create(path, capacity); self._mm = _map(path)
+        self.capacity = HEADER.unpack_from(self._mm)[2]
+
+    def _retire(self, mm):
+        """ 예전 파일을 읽고 있는 쪽이 새 파일을 다시 열도록 moved 표시 """
+        try:
+            struct.pack_into('<I', mm, _MOVED_OFFSET, 1); mm.close()
+        except (ValueError, OSError):
+            pass
+
+    def _grow(self, size):
+        capacity = self.capacity
+        while capacity < size: capacity *= 2;
+        log.warning(f"상태 세그먼트 확장: 슬롯 {self.capacity} -> {capacity}바이트")
+        old = self._mm
+        _create(self.path, capacity); self._mm = _map(self.path); self.capacity = capacity
+        self._retire(old)
+
+    def publish(self, version, body):
+        if len(body) > self.capacity: self._grow(len(body));
+        mm = self._mm
+        _, seq, capacity, _, active, _, _, _, _ = HEADER.unpack_from(mm)
+        slot = 1 - active
+        offset = HEADER_SIZE + slot * capacity
+        mm[offset:offset + len(body)] = body
+        _SEQ.pack_into(mm, 8, seq + 1) # 홀수: 머리말 바꾸는 중
+        HEADER.pack_into(mm, 0, MAGIC, seq + 1, capacity, 0, slot, len(body), zlib.crc32(body), 0, version)
+        _SEQ.pack_into(mm, 8, seq + 2)
+
+    def close(self):
+        try: self._mm.close();
+        except (ValueError, OSError): pass;
+        self._lock_file.close()
+
+class StateSegmentReader:
+    """ 웹 작업자 쪽. seq()로 바뀌었는지만 싸게 보고, 바뀌었으면 read()로 (버전, 본문)을 복사해 옵니다. """
+    def __init__(self, path):
+        self.path = path
+        self._mm = None
+
+    def _ensure(self):
+        if self._mm is not None:
+            if self._mm[_MOVED_OFFSET] == 0: return self._mm;
+            self._mm.close(); self._mm = None # 새 파일로 바뀜
+        if not os.path.exists(self.path): return None;
+        try:
+            mm = _map(self.path)
+        except (OSError, ValueError):
+            return None
+        if mm[:8] != MAGIC: mm.close(); return None;
+        self._mm = mm
+        return mm
+
+    def seq(self):
+        """ 현재 seq (파일이 아직 없으면 None) """
+        mm = self._ensure()
+        return None if mm is None else _SEQ.unpack_from(mm, 8)[0]
+
+    def read(self, retries=100):
+        """ (seq, 스냅샷 버전, 본문 bytes). 아직 게시된 적이 없거나 계속 쓰는 중이면 None """
+        for attempt in range(retries):
+            mm = self._ensure()
+            if mm is None: return None;
+            _, seq, capacity, moved, active, length, crc, _, version = HEADER.unpack_from(mm)
+            if moved: continue;
+            if seq == 0: return None;
+            if seq % 2 == 0:
+                offset = HEADER_SIZE + active * capacity
+                body = mm[offset:offset + length]
+                if _SEQ.unpack_from(mm, 8)[0] == seq and zlib.crc32(body) == crc: return seq, version, body;
+            if attempt > 10: time.sleep(0.001);
+        log.warning("상태 세그먼트를 읽지 못했습니다. (계속 쓰는 중)")
+        return None
+
+    def close(self):
+        if self._mm is not None: self._mm.close(); self._mm = None;
+
+class SegmentDirectoryReader:
+    """
+    웹 작업자 쪽. base_path에서 나온 폴러별 세그먼트를 모두 찾아 살아 있는 것만 읽습니다.
+    디렉터리 목록과 생존 확인은 rescan_interval초마다 한 번만 하고, 그 사이에는 각 세그먼트의 seq만 봅니다.
+    """
+    def __init__(self, base_path, rescan_interval=1.0):
+        self.base_path = base_path
+        self.rescan_interval = rescan_interval
+        self._readers = {}
+        self._scanned_at = None
+
+    def _scan(self):
+        now = time.monotonic()
+        if self._scanned_at is not None and now - self._scanned_at < self.rescan_interval: return;
+        self._scanned_at = now
+        live = [path for path in list_segments(self.base_path) if is_live(path)]
+        for path in set(self._readers) - set(live): self._readers.pop(path).close();
+        for path in live:
+            if path not in self._readers: self._readers[path] = StateSegmentReader(path);
+
+    def _tag(self, path):
+        """ 세그먼트 이름표 (= 폴러 이름 부분) """
+        root, ext = os.path.splitext(os.path.basename(self.base_path))
+        name = os.path.basename(path)
+        return name[len(root) + 1:len(name) - len(ext)]
+
+    def seq(self):
+        """ 살아 있는 세그먼트들의 (경로, seq) 묶음. 어느 하나라도 바뀌거나 폴러가 늘고 줄면 값이 바뀝니다. """
+        self._scan()
+        return tuple((path, reader.seq()) for path, reader in sorted(self._readers.items()))
+
+    def read(self):
+        """ [(이름표, seq, 스냅샷 버전, 본문 bytes)]. 아직 게시 전인 세그먼트는 빠집니다. """
+        self._scan()
+        parts = []
+        for path, reader in sorted(self._readers.items()):
+            result = reader.read()
+            if result is not None: parts.append((self._tag(path),) + result);
+        return parts
@@ -1,5 +1,46 @@
 document.addEventListener('DOMContentLoaded', () => {
-    // 10초마다 대시보드 데이터를 업데이트하는 함수
+    // 장치 상태 목록을 카드에 반영하는 함수 (스트림 이벤트와 폴링 응답이 함께 사용)
+    function applyDeviceItems(latestData) {
+        latestData.forEach(item => {
+            const deviceName = item.device_name;
+            // 각 장치에 해당하는 HTML 요소 찾기
+            const tempDiv = document.getElementById(`temp-div-${deviceName}`);
+            const tempValue = document.getElementById(`temp-value-${deviceName}`);
+            const setTemp = document.getElementById(`set-temp-${deviceName}`);
+            const status = document.getElementById(`status-${deviceName}`);
+            const cardHeader = document.getElementById(`header-${deviceName}`); // 카드 헤더 추가
+
+            if (tempDiv && tempValue && setTemp && status && cardHeader) {
+                // 1. 온도 값 업데이트
+                tempValue.textContent = item.temperature !== null ? item.temperature.toFixed(1) : '--';
+                setTemp.textContent = item.set_temp !== null ? `${item.set_temp.toFixed(1)}°C` : '--°C';
+
+                // 2. 상태 텍스트 및 클래스 업데이트
+                // 기존 클래스 제거
+                tempDiv.classList.remove('good', 'warn');
+                status.classList.remove('good', 'warn');
+
+                if (item.is_alarm) {
+                    status.textContent = 'WAR';
+                    status.classList.add('warn');
+                    cardHeader.classList.remove('offline-header');
+                    tempDiv.classList.add('warn');
+                } else if (item.status === '정상') {
+                    status.textContent = 'GO';
+                    status.classList.add('good');
+                    cardHeader.classList.remove('offline-header');
+                    tempDiv.classList.add('good');
+                } else { // 오프라인
+                    status.textContent = 'OFF';
+                    status.classList.add('good'); // 오프라인일 때도 기본 색상 (warn 아님)
+                    cardHeader.classList.add('offline-header');
+                    tempDiv.classList.add('good');
+                }
+            }
+        });
+    }
+
+    // 스트림을 쓸 수 없을 때 10초마다 대시보드 데이터를 가져오는 함수 (대체 경로)
     async function updateDashboard() {
         try {
             const response = await fetch('/api/latest_data');
@@ -7,52 +48,55 @@ document.addEventListener('DOMContentLoaded', () => {
                 console.error('데이터를 가져오는 데 실패했습니다:', response.status);
                 return;
             }
-            const latestData = await response.json();
-
-            latestData.forEach(item => {
-                const deviceName = item.device_name;
-                // 각 장치에 해당하는 HTML 요소 찾기
-                const tempDiv = document.getElementById(`temp-div-${deviceName}`);
-                const tempValue = document.getElementById(`temp-value-${deviceName}`);
-                const setTemp = document.getElementById(`set-temp-${deviceName}`);
-                const status = document.getElementById(`status-${deviceName}`);
-                const cardHeader = document.getElementById(`header-${deviceName}`); // 카드 헤더 추가
-
-                if (tempDiv && tempValue && setTemp && status && cardHeader) {
-                    // 1. 온도 값 업데이트
-                    tempValue.textContent = item.temperature !== null ? item.temperature.toFixed(1) : '--';
-                    setTemp.textContent = item.set_temp !== null ? `${item.set_temp.toFixed(1)}°C` : '--°C';
-
-                    // 2. 상태 텍스트 및 클래스 업데이트
-                    // 기존 클래스 제거
-                    tempDiv.classList.remove('good', 'warn');
-                    status.classList.remove('good', 'warn');
-
-                    if (item.is_alarm) {
-                        status.textContent = 'WAR';
-                        status.classList.add('warn');
-                        cardHeader.classList.remove('offline-header');
-                        tempDiv.classList.add('warn');
-                    } else if (item.status === '정상') {
-                        status.textContent = 'GO';
-                        status.classList.add('good');
-                        cardHeader.classList.remove('offline-header');
-                        tempDiv.classList.add('good');
-                    } else { // 오프라인
-                        status.textContent = 'OFF';
-                        status.classList.add('good'); // 오프라인일 때도 기본 색상 (warn 아님)
-                        cardHeader.classList.add('offline-header');
-                        tempDiv.classList.add('good');
-                    }
-                }
-            });
+            applyDeviceItems(await response.json());
         } catch (error) {
             console.error('대시보드 업데이트 중 오류 발생:', error);
         }
     }
 
-    // 페이지 로드 후 10초마다 주기적으로 호출
-    // 초기 로드 시에도 한 번 호출하여 최신 데이터 표시
-    updateDashboard(); 
-    setInterval(updateDashboard, 10000); // 10초 (10000 밀리초)
+    // 카드 하단 미니 그래프 갱신 (서버 메모리 링 버퍼에서 최근 2시간 추이를 받아 그림)
+    async function updateSparklines() {
+        try {
+            const response = await fetch('/api/sparklines?hours=2&points=60');
+            if (!response.ok) return;
+            const sparklines = await response.json();
+
+            Object.entries(sparklines).forEach(([deviceName, points]) => {
+                const svg = document.getElementById(`spark-${deviceName}`);
+                if (!svg || points.length < 2) return;
+                const temps = points.map(p => p[1]);
+                const minTemp = Math.min(...temps);
+                const range = (Math.max(...temps) - minTemp) || 1;
+                const firstTs = points[0][0];
+                const spanTs = (points[points.length - 1][0] - firstTs) || 1;
+                // viewBox 0~100 x 0~20 좌표로 변환 (위가 높은 온도)
+                const coords = points.map(p => `${((p[0] - firstTs) / spanTs * 100).toFixed(1)},${(19 - (p[1] - minTemp) / range * 18).toFixed(1)}`);
+                svg.querySelector('polyline').setAttribute('points', coords.join(' '));
+            });
+        } catch (error) {
+            console.error('미니 그래프 업데이트 중 오류 발생:', error);
+        }
+    }
+
+    // 서버가 밀어주는 실시간 스트림(SSE)을 우선 사용하고, 연결이 끊긴 동안에는 10초 폴링으로 대체
+    let pollTimer = null;
+    function startPolling() {
+        if (pollTimer) return;
+        updateDashboard();
+        pollTimer = setInterval(updateDashboard, 10000); // 10초 (10000 밀리초)
+    }
+    function stopPolling() {
+        if (pollTimer) { clearInterval(pollTimer); pollTimer = null; }
+    }
+
+    if (window.EventSource) {
+        const stream = new EventSource('/api/stream');
+        stream.addEventListener('snapshot', event => { stopPolling(); applyDeviceItems(JSON.parse(event.data)); });
+        stream.addEventListener('update', event => applyDeviceItems(JSON.parse(event.data).changed));
+        stream.onerror = () => startPolling(); // 브라우저가 자동 재연결하면 snapshot을 받아 폴링을 멈춤
+    } else {
+        startPolling();
+    }
+    updateSparklines();
+    setInterval(updateSparklines, 60000); // 미니 그래프는 1분마다
 });
\ No newline at end of file
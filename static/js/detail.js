@@ -26,7 +26,8 @@ document.addEventListener('DOMContentLoaded', function() {
         }
         
         // 💡 [사용자 요청] 데이터를 Chart.js의 time scale 형식에 맞게 가공
-        const dataPoints = chartData.map(item => ({ x: item.timestamp, y: item.temperature }));
+        // 서버는 LTTB로 줄인 [[epoch 밀리초, 온도], ...] 배열을 보냅니다.
+        const dataPoints = chartData.map(([ts, temperature]) => ({ x: ts, y: temperature }));
 
         // 💡 [수정] 데이터셋 정의를 데이터 유무 확인 전으로 이동
         const datasets = [
@@ -125,9 +126,11 @@ document.addEventListener('DOMContentLoaded', function() {
                     x: {
                         type: 'time', // 💡 [핵심] x축 타입을 'time'으로 변경
                         time: {
-                            unit: 'hour', // 💡 [핵심] 시간 단위를 'hour'로 설정
+                            // 시간 단위는 조회 기간에 맞게 자동 선택 (1일이면 시, 1년이면 월)
                             displayFormats: {
-                                hour: 'HH:mm' // 💡 툴팁 및 라벨 표시 형식을 '시:분'으로 지정
+                                hour: 'HH:mm', // 💡 툴팁 및 라벨 표시 형식을 '시:분'으로 지정
+                                day: 'MM-dd',
+                                month: 'yyyy-MM'
                             },
                             tooltipFormat: 'yyyy-MM-dd HH:mm' // 툴팁에 날짜까지 표시
                         },
@@ -177,7 +180,37 @@ document.addEventListener('DOMContentLoaded', function() {
 
 
     /**
-     * API를 호출하여 현재 장치 상태 및 기록 테이블을 주기적으로 업데이트합니다.
+     * 현재 장치 상태를 운전 상태 표시와 기록 테이블에 반영합니다. (스트림 이벤트와 폴링 응답이 함께 사용)
+     */
+    function applyDeviceData(data) {
+        updateOpStatusUI(data.op_status);
+
+        // 💡 [핵심] 실시간 기록 테이블에 데이터 행 추가 로직
+        const tableBody = document.querySelector('.table tbody');
+        if (tableBody && data.timestamp && data.temperature !== null) {
+            const firstRow = tableBody.rows[0];
+            let lastTimestamp = null;
+            if (firstRow && firstRow.cells[0]) {
+                lastTimestamp = new Date(firstRow.cells[0].textContent);
+            }
+
+            const newTimestamp = new Date(data.timestamp);
+            if (lastTimestamp && newTimestamp <= lastTimestamp) return; // 이미 표시한 샘플
+            
+            // 테이블 갱신 (30분 간격 필터링은 제거)
+            const noDataRow = tableBody.querySelector('td[colspan="2"]');
+            if (noDataRow) noDataRow.parentElement.remove();
+
+            const newRow = tableBody.insertRow(0);
+            const cell1 = newRow.insertCell(0);
+            const cell2 = newRow.insertCell(1);
+            cell1.textContent = data.timestamp;
+            cell2.textContent = data.temperature.toFixed(1);
+        }
+    }
+
+    /**
+     * 스트림을 쓸 수 없을 때 API를 호출하여 현재 장치 상태를 가져옵니다. (대체 경로)
      */
     async function updateCurrentStatus() {
         try {
@@ -186,32 +219,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 console.error('상태 업데이트 데이터 가져오기 실패:', response.status);
                 return;
             }
-
-            const data = await response.json();
-                      
-            updateOpStatusUI(data.op_status);
-
-            // 💡 [핵심] 실시간 기록 테이블에 데이터 행 추가 로직
-            const tableBody = document.querySelector('.table tbody');
-            if (tableBody && data.timestamp && data.temperature !== null) {
-                const firstRow = tableBody.rows[0];
-                let lastTimestamp = null;
-                if (firstRow && firstRow.cells[0]) {
-                    lastTimestamp = new Date(firstRow.cells[0].textContent);
-                }
-
-                const newTimestamp = new Date(data.timestamp);
-                
-                // 테이블 갱신 (30분 간격 필터링은 제거)
-                const noDataRow = tableBody.querySelector('td[colspan="2"]');
-                if (noDataRow) noDataRow.parentElement.remove();
-
-                const newRow = tableBody.insertRow(0);
-                const cell1 = newRow.insertCell(0);
-                const cell2 = newRow.insertCell(1);
-                cell1.textContent = data.timestamp;
-                cell2.textContent = data.temperature.toFixed(1);
-            }
+            applyDeviceData(await response.json());
         } catch (error) {
             console.error('상태 업데이트 중 오류 발생:', error);
         }
@@ -223,6 +231,23 @@ document.addEventListener('DOMContentLoaded', function() {
         createChart(historyChartData); 
     }
     
-    // 10초마다 현재 상태 및 테이블 업데이트 시작
-    setInterval(updateCurrentStatus, 10000); 
+    // 실시간 스트림(SSE)에서 이 장치의 변경만 받아 반영하고, 연결이 끊긴 동안에는 10초 폴링으로 대체
+    let pollTimer = null;
+    function startPolling() {
+        if (pollTimer) return;
+        pollTimer = setInterval(updateCurrentStatus, 10000);
+    }
+    function stopPolling() {
+        if (pollTimer) { clearInterval(pollTimer); pollTimer = null; }
+    }
+
+    if (window.EventSource) {
+        const stream = new EventSource('/api/stream');
+        const applyMine = items => items.filter(item => item.device_name === deviceName).forEach(applyDeviceData);
+        stream.addEventListener('snapshot', event => { stopPolling(); applyMine(JSON.parse(event.data)); });
+        stream.addEventListener('update', event => applyMine(JSON.parse(event.data).changed));
+        stream.onerror = () => startPolling();
+    } else {
+        startPolling();
+    }
 }); // 💡 [추가 완료] 이 닫는 괄호 때문에 깨짐 현상이 발생했습니다!
\ No newline at end of file
@@ -11,6 +11,8 @@ document.addEventListener('DOMContentLoaded', () => {
     const deviceControllerIdInput = document.getElementById('deviceControllerId');
     const deviceAlarmThresholdInput = document.getElementById('deviceAlarmThreshold');
     const deviceMemoInput = document.getElementById('deviceMemo');
+    const devicePollIntervalInput = document.getElementById('devicePollInterval');
+    const deviceAlarmRulesInput = document.getElementById('deviceAlarmRules');
     const pushoverSettingsForm = document.getElementById('pushoverSettingsForm');
     const deviceTableBody = document.querySelector('#device-table tbody');
     const newDeviceBtn = document.getElementById('newDeviceBtn');
@@ -54,6 +56,8 @@ function prepareEditDeviceModal(device) {
     deviceControllerIdInput.value = device.controller_id;
     deviceAlarmThresholdInput.value = device.alarm_threshold ?? '';
     deviceMemoInput.value = device.memo || '';
+    devicePollIntervalInput.value = device.poll_interval ?? '';
+    deviceAlarmRulesInput.value = device.alarm_rules || '';
     deviceModalLabel.textContent = '장치 정보 수정';
     deviceModal.show();
 }
@@ -66,7 +70,9 @@ async function saveDevice() {
         port: devicePortInput.value,
         controller_id: deviceControllerIdInput.value,
         alarm_threshold: deviceAlarmThresholdInput.value || null,
-        memo: deviceMemoInput.value || null
+        memo: deviceMemoInput.value || null,
+        poll_interval: devicePollIntervalInput.value || null,
+        alarm_rules: deviceAlarmRulesInput.value.trim() || null
     };
 
     // --- 입력값 검증 ---
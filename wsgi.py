@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+"""
+웹 작업자 진입점. 폴러는 poller_service.py로 따로 실행합니다.
+
+    gunicorn -w 4 -k gthread --threads 16 -b 0.0.0.0:5000 wsgi:app
+
+- 작업자마다 이 모듈을 불러오므로 --preload는 쓰지 않습니다. (fork 전에 시작한 스레드는 작업자에 없음)
+- 실시간 스트림(/api/stream)은 연결마다 스레드 하나를 잡으므로 gthread 작업자에 충분한 --threads를 줍니다.
+"""
+from main import app, start_web_worker
+
+start_web_worker()